@@ -2,21 +2,22 @@
 import os
 import json
 import logging
+import tempfile
 from dotenv import load_dotenv, find_dotenv
 from flask import Flask, current_app
-from flask_migrate import Migrate
 import click
-from alembic.config import Config
-from alembic import command
-import psycopg2
 
 from .extensions import db, login_manager
-from .database import get_assessment_messages
+from .engine_profiles import default_profile_name, engine_options, max_connections
+from .sharding import SHARD_BIND_PREFIX, parse_shard_urls
 
 
 def create_app():
-    load_dotenv(find_dotenv(".env"))
-    load_dotenv(find_dotenv(".env.development.local"), override=True)
+    # FLASK_SKIP_DOTENV (Flask's own switch) lets tools such as the load test
+    # supply DATABASE_URL without the .env files overriding it.
+    if not os.environ.get('FLASK_SKIP_DOTENV'):
+        load_dotenv(find_dotenv(".env"))
+        load_dotenv(find_dotenv(".env.development.local"), override=True)
     
     """Create and configure an instance of the Flask application."""
     # The root path of the app is the 'app' directory. The templates are one level up.
@@ -42,71 +43,129 @@ def create_app():
         if 'sslmode' not in db_url and not is_development:
             db_url += "?sslmode=require"
         app.config['SQLALCHEMY_DATABASE_URI'] = db_url
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            "pool_pre_ping": True,
-            "pool_recycle": 280,
-            "pool_size": 5,
-            "max_overflow": 10,
-            "connect_args": {
-                "connect_timeout": 30
-            }
-        }
     else:
         # Local development with SQLite
         db_path = os.path.join(app.instance_path, 'bizstarter.db')
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-    
-    # --- Multi-tenancy Setup ---
-    try:
-        conn = psycopg2.connect(db_url)
-        cursor = conn.cursor()
 
-        # Create the shared schema
-        cursor.execute("CREATE SCHEMA IF NOT EXISTS shared;")
-        print("Schema 'shared' created successfully or already exists.")
+    # Pooling, pre-ping and statement caching depend on where we run. See
+    # engine_profiles.py; DB_ENGINE_PROFILE overrides the automatic choice.
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['DB_ENGINE_PROFILE'] = os.environ.get('DB_ENGINE_PROFILE') or default_profile_name(database_uri, os.environ)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['DB_ENGINE_PROFILE'], database_uri)
 
-        # Create the tenants table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS shared.tenants (
-            tenant_id SERIAL PRIMARY KEY,
-            tenant_key VARCHAR(255) UNIQUE NOT NULL,
-            schema_name VARCHAR(255) UNIQUE NOT NULL,
-            company_name VARCHAR(255),
-            industry VARCHAR(255),
-            locations TEXT,
-            plan_type VARCHAR(50),
-            is_active BOOLEAN DEFAULT TRUE,
-            use_multilocations BOOLEAN DEFAULT FALSE
-        );
-        """)
-        print("Table 'shared.tenants' created successfully or already exists.")
+    # --- Read Replica ---
+    # Read-only routes are served from REPLICA_DATABASE_URL when it is set and
+    # healthy. Reads stick to the primary for READ_YOUR_WRITES_SECONDS after a
+    # user's own write, which should cover the worst tolerated lag.
+    replica_url = os.environ.get('REPLICA_DATABASE_URL')
+    binds = {}
+    if replica_url:
+        if replica_url.startswith("postgres://"):
+            replica_url = replica_url.replace("postgres://", "postgresql://")
+        binds['replica'] = {'url': replica_url, **engine_options(app.config['DB_ENGINE_PROFILE'], replica_url)}
+    app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    app.config['REPLICA_HEALTH_TTL'] = float(os.environ.get('REPLICA_HEALTH_TTL', 5))
+    app.config['READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
 
-        # Create the tenant_owners table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS shared.tenant_owners (
-            owner_id SERIAL PRIMARY KEY,
-            tenant_id INTEGER REFERENCES shared.tenants(tenant_id),
-            email VARCHAR(255) UNIQUE NOT NULL,
-            first_name VARCHAR(255),
-            last_name VARCHAR(255),
-            role VARCHAR(50),
-            is_active BOOLEAN DEFAULT TRUE,
-            is_verified BOOLEAN DEFAULT FALSE
-        );
-        """)
-        print("Table 'shared.tenant_owners' created successfully or already exists.")
+    # --- Tenant Sharding ---
+    # The primary database is the 'default' shard and holds the shared tenant
+    # directory. SHARD_DATABASE_URLS adds more, e.g. "eu=postgresql://...".
+    for shard_id, shard_url in parse_shard_urls(os.environ.get('SHARD_DATABASE_URLS')).items():
+        binds[SHARD_BIND_PREFIX + shard_id] = {'url': shard_url, **engine_options(app.config['DB_ENGINE_PROFILE'], shard_url)}
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['SHARD_MAP_TTL'] = float(os.environ.get('SHARD_MAP_TTL', 10))
+    app.config['NEW_TENANT_SHARD'] = os.environ.get('NEW_TENANT_SHARD')
 
-        # Commit the changes
-        conn.commit()
+    # --- Tenant Admission Control ---
+    # The overall limit matches the engine's connection cap (pool_size +
+    # max_overflow) so requests queue fairly here instead of inside the pool.
+    app.config['ADMISSION_MAX_ACTIVE'] = int(
+        os.environ.get('ADMISSION_MAX_ACTIVE', max_connections(app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+    )
+    app.config['TENANT_MAX_CONCURRENCY'] = int(os.environ.get('TENANT_MAX_CONCURRENCY', 4))
+    # Every visitor who is not logged in shares one bucket; logins are slow
+    # (password hashing), so it gets up to half the slots by default.
+    app.config['ANONYMOUS_MAX_CONCURRENCY'] = int(os.environ.get(
+        'ANONYMOUS_MAX_CONCURRENCY', max(app.config['TENANT_MAX_CONCURRENCY'], app.config['ADMISSION_MAX_ACTIVE'] // 2)
+    ))
+    app.config['TENANT_MAX_QUEUE'] = int(os.environ.get('TENANT_MAX_QUEUE', 20))
+    app.config['ADMISSION_TIMEOUT'] = float(os.environ.get('ADMISSION_TIMEOUT', 5))
+    app.config['ADMISSION_SLOW_WAIT'] = float(os.environ.get('ADMISSION_SLOW_WAIT', 0.5))
 
-    except Exception as e:
-        print(f"An error occurred during multi-tenancy setup: {e}")
+    # --- Forecast Patches ---
+    # Edits arriving for a user while their previous one is applied are
+    # merged; the batch waits this long for stragglers before recomputing.
+    app.config['FORECAST_PATCH_DEBOUNCE_MS'] = float(os.environ.get('FORECAST_PATCH_DEBOUNCE_MS', 25))
 
-    finally:
-        # Close the connection
-        if conn is not None:
-            conn.close()
+    # --- Singleflight ---
+    # Identical concurrent saves and recalculations of one user run once (see
+    # singleflight.py). Within a worker by default; with a lock directory on
+    # local disk, also across the workers of the host.
+    app.config['SINGLEFLIGHT_LOCK_DIR'] = os.environ.get('SINGLEFLIGHT_LOCK_DIR', '')
+    app.config['SINGLEFLIGHT_WAIT_SECONDS'] = float(os.environ.get('SINGLEFLIGHT_WAIT_SECONDS', 30))
+
+    # --- Compression ---
+    # HTML responses and static text assets smaller than this are sent as is.
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+    # --- Export Cache ---
+    # Serverless instances can only write to the temp directory.
+    default_export_cache_dir = (os.path.join(tempfile.gettempdir(), 'export_cache') if os.environ.get('VERCEL')
+                                else os.path.join(app.instance_path, 'export_cache'))
+    app.config['EXPORT_CACHE_DIR'] = os.environ.get('EXPORT_CACHE_DIR', default_export_cache_dir)
+    app.config['EXPORT_CACHE_MAX_BYTES'] = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Exports larger than EXPORT_SYNC_MAX_ROWS are built by background jobs
+    # when requested through /export-jobs; smaller ones use the direct route.
+    app.config['EXPORT_SYNC_MAX_ROWS'] = int(os.environ.get('EXPORT_SYNC_MAX_ROWS', 2000))
+    app.config['EXPORT_JOB_WORKERS'] = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+    app.config['EXPORT_JOB_MAX_PENDING'] = int(os.environ.get('EXPORT_JOB_MAX_PENDING', 20))
+    # Tenant-wide exports: worker processes per job, and jobs allowed to wait.
+    app.config['EXPORT_BULK_PROCESSES'] = int(os.environ.get('EXPORT_BULK_PROCESSES', min(4, os.cpu_count() or 1)))
+    app.config['EXPORT_BULK_MAX_PENDING'] = int(os.environ.get('EXPORT_BULK_MAX_PENDING', 4))
+
+    # --- Metrics ---
+    # Each worker writes its metrics to METRICS_DIR every METRICS_FLUSH_SECONDS
+    # and /metrics adds up the files of all workers (empty: this process only).
+    # When METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    default_metrics_dir = (os.path.join(tempfile.gettempdir(), 'metrics') if os.environ.get('VERCEL')
+                           else os.path.join(app.instance_path, 'metrics'))
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', default_metrics_dir)
+    app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 
+    # --- Profiling ---
+    # A request carrying a token from `flask profile-token` is profiled once
+    # and the result stored in PROFILE_DIR. PROFILE_SAMPLE_HZ > 0 also samples
+    # the stacks of running requests into collapsed-stack files for flame graphs.
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config['PROFILE_TOKEN_MAX_AGE'] = float(os.environ.get('PROFILE_TOKEN_MAX_AGE', 3600))
+    app.config['PROFILE_SAMPLE_HZ'] = float(os.environ.get('PROFILE_SAMPLE_HZ', 0))
+    app.config['PROFILE_SAMPLE_FLUSH_SECONDS'] = float(os.environ.get('PROFILE_SAMPLE_FLUSH_SECONDS', 60))
+
+    # --- Slow Query Log ---
+    # Statements slower than SLOW_QUERY_MS are appended to SLOW_QUERY_LOG
+    # (empty disables it), with their plan the first time each is seen.
+    # `flask slow-queries` summarizes the log.
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+    default_slow_query_log = (os.path.join(tempfile.gettempdir(), 'slow_queries.jsonl') if os.environ.get('VERCEL')
+                              else os.path.join(app.instance_path, 'slow_queries.jsonl'))
+    app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', default_slow_query_log)
+
+    # --- Templates ---
+    # Compiled templates are cached in TEMPLATE_CACHE_DIR (empty disables it);
+    # `flask precompile-templates` fills it at build time. TEMPLATE_WARMUP
+    # compiles every template in create_app instead of on first use.
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'template_cache'))
+    app.config['TEMPLATE_WARMUP'] = os.environ.get('TEMPLATE_WARMUP', '0') == '1'
+    # Rendered fragments ({% cache %}) and pages kept per worker process; 0 disables.
+    # Writes invalidate them in the worker that made them; the TTL bounds staleness elsewhere.
+    app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1000))
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+    # --- Multi-tenancy Setup ---
+    if db_url and database_uri.startswith('postgresql'):
+        _init_shared_schema(db_url)
 
     # --- Logging Configuration ---
     if not app.debug and not app.testing:
@@ -117,7 +176,40 @@ def create_app():
 
     # Initialize extensions
     db.init_app(app)
-    Migrate(app, db)
+    if click.get_current_context(silent=True) is not None:
+        # Flask-Migrate pulls in all of alembic at import time. Only the
+        # `flask db ...` commands need it, so web workers skip it entirely.
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from .metrics import init_metrics
+    from .profiling import init_profiling
+    from .admission import init_admission
+    from .db_routing import init_db_routing
+    from .slow_queries import init_slow_queries
+    from .export_cache import init_export_cache
+    from .export_jobs import init_export_jobs
+    from .bulk_export import init_bulk_export
+    from .forecast_patch import init_forecast_patches
+    from .singleflight import init_singleflight
+    from .static_assets import init_static_assets
+    from .template_cache import init_template_cache
+    from .fragment_cache import init_fragment_cache
+    from .sharding import init_sharding
+    init_metrics(app)
+    init_profiling(app)
+    init_admission(app)
+    init_sharding(app)
+    init_db_routing(app)
+    init_slow_queries(app)
+    init_export_cache(app)
+    init_export_jobs(app)
+    init_bulk_export(app)
+    init_forecast_patches(app)
+    init_singleflight(app)
+    init_static_assets(app)
+    init_fragment_cache(app)
+    init_template_cache(app)
 
     @app.teardown_appcontext
     def shutdown_session(exception=None):
@@ -147,10 +239,10 @@ def create_app():
 
     # --- Configure Flask-Login ---
     login_manager.init_app(app)
-    from .models import User
+    from .sharding import load_session_user
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_session_user(user_id)
 
     app.register_blueprint(auth.bp)
     app.register_blueprint(main_routes.bp)
@@ -158,10 +250,82 @@ def create_app():
     app.register_blueprint(locations.locations_bp)
 
     # Register CLI commands
+    from .startup_profile import startup_profile_command
     app.cli.add_command(init_db_command)
+    app.cli.add_command(startup_profile_command)
+
+    if app.config['TEMPLATE_WARMUP']:
+        # After the template filters above are registered; templates using them would not compile.
+        from .template_cache import compile_templates
+        count, seconds = compile_templates(app)
+        app.logger.info(f"Compiled {count} templates in {seconds * 1000:.0f} ms")
 
     return app
 
+
+def _init_shared_schema(db_url):
+    """Creates the shared schema and tenant directory tables if they are missing."""
+    # psycopg2 is only needed against PostgreSQL, so it is imported on demand
+    # to keep it off the cold-start path of SQLite and serverless workers.
+    import psycopg2
+
+    conn = None
+    try:
+        conn = psycopg2.connect(db_url)
+        cursor = conn.cursor()
+
+        # Create the shared schema
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS shared;")
+        print("Schema 'shared' created successfully or already exists.")
+
+        # Create the tenants table
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shared.tenants (
+            tenant_id SERIAL PRIMARY KEY,
+            tenant_key VARCHAR(255) UNIQUE NOT NULL,
+            schema_name VARCHAR(255) UNIQUE NOT NULL,
+            company_name VARCHAR(255),
+            industry VARCHAR(255),
+            locations TEXT,
+            plan_type VARCHAR(50),
+            is_active BOOLEAN DEFAULT TRUE,
+            use_multilocations BOOLEAN DEFAULT FALSE,
+            shard_id VARCHAR(50) NOT NULL DEFAULT 'default',
+            shard_locked BOOLEAN NOT NULL DEFAULT FALSE
+        );
+        """)
+        # Tenant directories created before sharding lack the shard columns.
+        cursor.execute("ALTER TABLE shared.tenants ADD COLUMN IF NOT EXISTS shard_id VARCHAR(50) NOT NULL DEFAULT 'default';")
+        cursor.execute("ALTER TABLE shared.tenants ADD COLUMN IF NOT EXISTS shard_locked BOOLEAN NOT NULL DEFAULT FALSE;")
+        print("Table 'shared.tenants' created successfully or already exists.")
+
+        # Create the tenant_owners table
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shared.tenant_owners (
+            owner_id SERIAL PRIMARY KEY,
+            tenant_id INTEGER REFERENCES shared.tenants(tenant_id),
+            email VARCHAR(255) UNIQUE NOT NULL,
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            role VARCHAR(50),
+            is_active BOOLEAN DEFAULT TRUE,
+            is_verified BOOLEAN DEFAULT FALSE
+        );
+        """)
+        print("Table 'shared.tenant_owners' created successfully or already exists.")
+
+        # Commit the changes
+        conn.commit()
+
+    except Exception as e:
+        print(f"An error occurred during multi-tenancy setup: {e}")
+
+    finally:
+        # Close the connection
+        if conn is not None:
+            conn.close()
+
+
 def seed_initial_data():
     """Seeds the database with initial data."""
     from .models import AssessmentMessage
@@ -191,6 +355,11 @@ def seed_initial_data():
 @click.command('init-db')
 def init_db_command():
     """Clear the existing data and create new tables."""
+    from alembic.config import Config
+    from alembic import command
+
+    from .sharding import shard_engine, shard_ids
+
     with current_app.app_context():
         click.echo("Applying database migrations...")
         try:
@@ -198,8 +367,15 @@ def init_db_command():
             alembic_cfg = Config(os.path.join(migrations_dir, "alembic.ini"))
             alembic_cfg.set_main_option("script_location", migrations_dir)
             alembic_cfg.set_main_option('sqlalchemy.url', current_app.config['SQLALCHEMY_DATABASE_URI'])
-            command.upgrade(alembic_cfg, 'head')
-            click.echo("Database migrations applied successfully.")
+            # Every shard carries the full set of tenant tables. The connection
+            # is handed over outside a transaction: migrations.env owns the
+            # transactions, and some migrations step out of them (autocommit_block).
+            for shard_id in shard_ids():
+                with shard_engine(shard_id).connect() as connection:
+                    alembic_cfg.attributes['connection'] = connection
+                    command.upgrade(alembic_cfg, 'head')
+                click.echo(f"Database migrations applied successfully to shard '{shard_id}'.")
             seed_initial_data()
         except Exception as e:
-            click.echo(f"Error applying migrations: {e}", err=True)
+            # Fail the command, and with it the deploy build, rather than start on an old schema.
+            raise click.ClickException(f"Error applying migrations: {e!r}") from e
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app, g, make_response, request, session
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within its wait budget."""
+
+    def __init__(self, status_code, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class TenantAdmission:
+    """
+    Fair admission control in front of database session checkout.
+
+    At most `max_active` requests hold a slot at once (sized to the connection
+    pool) and each tenant may hold at most `tenant_limit` of them. When slots
+    free up they are handed out round-robin across the tenants that have
+    requests waiting, so a tenant with a deep backlog cannot starve the others.
+    `limits` overrides `tenant_limit` for particular buckets, e.g. the one
+    shared by all anonymous requests.
+    """
+
+    def __init__(self, max_active, tenant_limit, max_queue, timeout, limits=None):
+        self.max_active = max_active
+        self.tenant_limit = tenant_limit
+        self.limits = dict(limits or {})
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._active_total = 0
+        self._active = {}
+        self._waiters = OrderedDict()  # tenant -> deque of _Waiter, in round-robin order
+        self._stats = {}
+
+    def acquire(self, tenant):
+        """Blocks until `tenant` may proceed and returns the seconds spent waiting."""
+        started = time.perf_counter()
+        with self._lock:
+            if not self._waiters.get(tenant) and self._has_capacity(tenant):
+                self._grant(tenant)
+                self._record_admit(tenant, 0.0)
+                return 0.0
+
+            queue = self._waiters.setdefault(tenant, deque())
+            if len(queue) >= self.max_queue:
+                self._record_reject(tenant, 429)
+                raise AdmissionRejected(429, 'Too many requests queued for this account.')
+            waiter = _Waiter()
+            queue.append(waiter)
+
+        waiter.event.wait(self.timeout)
+        waited = time.perf_counter() - started
+
+        with self._lock:
+            if waiter.granted:
+                self._record_admit(tenant, waited)
+                return waited
+
+            queue = self._waiters.get(tenant)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del self._waiters[tenant]
+
+            # Blame the tenant if it was held back by its own limit, otherwise
+            # the whole pool was saturated.
+            if self._active.get(tenant, 0) >= self._limit(tenant):
+                self._record_reject(tenant, 429)
+                raise AdmissionRejected(429, 'Too many concurrent requests for this account.')
+            self._record_reject(tenant, 503)
+            raise AdmissionRejected(503, 'The server is busy, please try again shortly.')
+
+    def release(self, tenant):
+        """Returns a slot held by `tenant` and wakes the next waiter in line."""
+        with self._lock:
+            self._active_total -= 1
+            self._active[tenant] -= 1
+            if not self._active[tenant]:
+                del self._active[tenant]
+            self._dispatch()
+
+    def stats(self):
+        """Returns a snapshot of per-tenant admission counters."""
+        with self._lock:
+            snapshot = {}
+            for tenant, stats in self._stats.items():
+                entry = dict(stats)
+                entry['active'] = self._active.get(tenant, 0)
+                entry['queued'] = len(self._waiters.get(tenant, ()))
+                entry['avg_wait_seconds'] = (
+                    stats['wait_seconds_total'] / stats['admitted'] if stats['admitted'] else 0.0
+                )
+                snapshot[tenant] = entry
+            return snapshot
+
+    def _limit(self, tenant):
+        return self.limits.get(tenant, self.tenant_limit)
+
+    def _has_capacity(self, tenant):
+        return self._active_total < self.max_active and self._active.get(tenant, 0) < self._limit(tenant)
+
+    def _grant(self, tenant):
+        self._active_total += 1
+        self._active[tenant] = self._active.get(tenant, 0) + 1
+
+    def _dispatch(self):
+        """Hands free slots to waiting tenants in round-robin order. Caller holds the lock."""
+        while self._active_total < self.max_active:
+            for tenant in self._waiters:
+                if self._active.get(tenant, 0) < self._limit(tenant):
+                    break
+            else:
+                return  # Everyone waiting is at their own limit
+
+            queue = self._waiters[tenant]
+            waiter = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(tenant)
+            else:
+                del self._waiters[tenant]
+
+            self._grant(tenant)
+            waiter.granted = True
+            waiter.event.set()
+
+    def _tenant_stats(self, tenant):
+        if tenant not in self._stats:
+            self._stats[tenant] = {
+                'admitted': 0,
+                'rejected_429': 0,
+                'rejected_503': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+            }
+        return self._stats[tenant]
+
+    def _record_admit(self, tenant, waited):
+        stats = self._tenant_stats(tenant)
+        stats['admitted'] += 1
+        stats['wait_seconds_total'] += waited
+        stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+
+    def _record_reject(self, tenant, status_code):
+        self._tenant_stats(tenant)[f'rejected_{status_code}'] += 1
+
+
+def current_tenant_key():
+    """
+    Identifies the tenant of the current request without touching the database.
+
+    The tenant key is stored in the session at login. Sessions from before that
+    fall back to the user id, and anonymous requests (login, registration)
+    share a single bucket with its own limit, ANONYMOUS_MAX_CONCURRENCY.
+    """
+    tenant_key = session.get('tenant_key')
+    if tenant_key:
+        return f'tenant:{tenant_key}'
+    user_id = session.get('_user_id')
+    if user_id:
+        return f'user:{user_id}'
+    return 'anonymous'
+
+
+def get_admission_stats():
+    """Returns the per-tenant admission counters of the current app, if enabled."""
+    admission = current_app.extensions.get('admission')
+    return admission.stats() if admission else {}
+
+
+def init_admission(app):
+    """Puts a TenantAdmission controller in front of every non-static request."""
+    admission = TenantAdmission(
+        max_active=app.config['ADMISSION_MAX_ACTIVE'],
+        tenant_limit=app.config['TENANT_MAX_CONCURRENCY'],
+        max_queue=app.config['TENANT_MAX_QUEUE'],
+        timeout=app.config['ADMISSION_TIMEOUT'],
+        limits={'anonymous': app.config['ANONYMOUS_MAX_CONCURRENCY']},
+    )
+    app.extensions['admission'] = admission
+
+    @app.before_request
+    def admit_request():
+        """Waits for a fair share of the connection pool before the view runs."""
+        if request.endpoint in ('static', 'metrics'):
+            return None
+        tenant = current_tenant_key()
+        try:
+            waited = admission.acquire(tenant)
+        except AdmissionRejected as e:
+            app.logger.warning(f"Rejected {request.endpoint} for {tenant} with {e.status_code}: {e.reason}")
+            response = make_response(e.reason, e.status_code)
+            response.headers['Retry-After'] = str(max(1, int(admission.timeout)))
+            return response
+
+        g.admission_tenant = tenant
+        g.admission_wait = waited
+        if waited > app.config['ADMISSION_SLOW_WAIT']:
+            app.logger.warning(f"{tenant} waited {waited:.3f}s for a connection slot on {request.endpoint}")
+        return None
+
+    @app.teardown_request
+    def release_admission(exception=None):
+        """Returns the request's slot so the next waiting tenant can proceed."""
+        tenant = g.pop('admission_tenant', None)
+        if tenant is not None:
+            admission.release(tenant)
+
+    return admission
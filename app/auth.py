@@ -1,10 +1,13 @@
-import json
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, g
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, current_user
 
 from .models import User, Expense, Asset, Liability, FinancialParams, BusinessStartupActivity, Product
 from .extensions import db
+from .database import get_tenant_for_user
+from .sharding import find_user
+from .warmup import seed_data
 
 bp = Blueprint('auth', __name__, url_prefix='/')
 
@@ -15,9 +18,12 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        user = User.query.filter_by(username=username).first()
+        user, shard_id = find_user(username)
         if user and password and check_password_hash(user.password_hash, password):
+            g.shard_id = shard_id
             login_user(user, remember=True)
+            session['tenant_key'] = _resolve_tenant_key(user)
+            session['shard_id'] = shard_id
             return redirect(url_for('main.intro'))
         else:
             flash('Invalid username or password.', 'danger')
@@ -35,7 +41,7 @@ def register():
             flash('Username and password are required.')
             return render_template('register.html')
 
-        if User.query.filter_by(username=username).first():
+        if find_user(username)[0] is not None:
             flash('Username already exists. Please choose a different one.')
             return render_template('register.html')
 
@@ -54,19 +60,25 @@ def register():
         return redirect(url_for('auth.login'))
     return render_template('register.html')
 
+def _resolve_tenant_key(user):
+    """Looks up the user's tenant once at login so later requests can be attributed without a query."""
+    try:
+        tenant = get_tenant_for_user(user)
+    except SQLAlchemyError as e:
+        # The shared schema only exists on PostgreSQL; local SQLite has no tenants.
+        current_app.logger.warning(f"Could not resolve tenant for user {user.id}: {e}")
+        db.session.rollback()
+        return None
+    return tenant.tenant_key if tenant else None
+
 def _seed_initial_user_data(user_id):
     """Seeds the database with a default set of data for a new user."""
     try:
-        with current_app.open_resource('db/startup-activities.json') as f:
-            initial_activities_data = json.load(f)
-        with current_app.open_resource('db/initial_expenses.json') as f:
-            initial_expenses_data = json.load(f)
-        with current_app.open_resource('db/initial_liabilities.json') as f:
-            initial_liabilities_data = json.load(f)
-        with current_app.open_resource('db/initial_products.json') as f:
-            initial_products_data = json.load(f)
-        with current_app.open_resource('db/initial_assets.json') as f:
-            initial_assets_data = json.load(f)
+        initial_activities_data = seed_data('startup-activities.json')
+        initial_expenses_data = seed_data('initial_expenses.json')
+        initial_liabilities_data = seed_data('initial_liabilities.json')
+        initial_products_data = seed_data('initial_products.json')
+        initial_assets_data = seed_data('initial_assets.json')
         
         initial_activities = [BusinessStartupActivity(**item, user_id=user_id) for item in initial_activities_data]
         initial_expenses = [Expense(**item, user_id=user_id) for item in initial_expenses_data]
@@ -89,4 +101,6 @@ def _seed_initial_user_data(user_id):
 @bp.route('/logout')
 def logout():
     logout_user()
+    session.pop('tenant_key', None)
+    session.pop('shard_id', None)
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -0,0 +1,294 @@
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import click
+from flask import Blueprint, current_app, jsonify, url_for
+from flask.cli import with_appcontext
+from flask_login import current_user, login_required
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+
+from .extensions import db
+from .models import Tenant, User
+
+bulk_export_bp = Blueprint('bulk_export', __name__, url_prefix='/tenant-export')
+
+# Below this many workbooks, starting worker processes costs more than it saves.
+MIN_USERS_FOR_POOL = 4
+
+
+# --- Loading ---
+
+def tenant_users_query(tenant):
+    """Returns a query for every user of a tenant, including pre-tenant_id owners."""
+    return User.query.filter(or_(
+        User.tenant_id == tenant.tenant_id,
+        and_(User.tenant_id.is_(None), User.username == tenant.tenant_key),
+    ))
+
+
+def iter_tenant_export_inputs(tenant, batch_size=100):
+    """
+    Yields (username, export inputs) for every user of a tenant; inputs are
+    None for users without financial params.
+
+    Users are read in id order, `batch_size` at a time, with their products,
+    expenses, activities and params loaded by one IN query each, and are
+    dropped from the session once converted so memory stays flat.
+    """
+    from .services import get_forecast_export_inputs
+
+    last_id = 0
+    while True:
+        batch = (tenant_users_query(tenant)
+                 .filter(User.id > last_id)
+                 .order_by(User.id)
+                 .options(selectinload(User.products), selectinload(User.expenses),
+                          selectinload(User.startup_activities), selectinload(User.financial_params))
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            return
+        for user in batch:
+            yield user.username, get_forecast_export_inputs(user)
+            db.session.expunge(user)
+        last_id = batch[-1].id
+
+
+# --- Building ---
+
+def _build_workbook(inputs):
+    """Runs in a worker process: builds one workbook and returns its bytes."""
+    from .services import build_forecast_export
+
+    with build_forecast_export(inputs) as output:
+        return output.read()
+
+
+def _entry_name(username, used):
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', username).strip('._') or 'user'
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f'{name}-{n}'
+    used.add(candidate)
+    return f'{candidate}.xlsx'
+
+
+def write_tenant_export(tenant, output, workers=None, batch_size=100, progress=None, cache=None):
+    """
+    Writes one forecast workbook per user of `tenant` into a zip at `output`.
+
+    Workbooks are built across `workers` processes and written to the zip as
+    they finish, so at most a few are held in memory at once. Workbooks that
+    are already in the per-user export `cache` are copied instead of rebuilt.
+    `progress(done, total)` is called after each user. Returns counters.
+    """
+    from .services import forecast_export_key
+    from .sharding import on_shard
+
+    started = time.perf_counter()
+    workers = workers or min(4, os.cpu_count() or 1)
+    counts = {'users': 0, 'exported': 0, 'cached': 0, 'skipped': 0}
+    used_names = set()
+
+    with on_shard(tenant.shard_id):
+        total = tenant_users_query(tenant).count()
+        use_pool = workers > 1 and total >= MIN_USERS_FOR_POOL
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) if use_pool else None
+        pending = {}
+
+        def advance():
+            counts['users'] += 1
+            if progress is not None:
+                progress(counts['users'], total)
+
+        def finish(name, data):
+            archive.writestr(name, data)
+            counts['exported'] += 1
+            advance()
+
+        def drain(return_when):
+            finished, _ = wait(pending, return_when=return_when)
+            for future in finished:
+                finish(pending.pop(future), future.result())
+
+        try:
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for username, inputs in iter_tenant_export_inputs(tenant, batch_size):
+                    if inputs is None:
+                        counts['skipped'] += 1
+                        advance()
+                        continue
+                    name = _entry_name(username, used_names)
+                    cached_path = cache.get(forecast_export_key(inputs)) if cache is not None else None
+                    if cached_path is not None:
+                        # Workbooks are already compressed; the zip stores them as is.
+                        archive.write(cached_path, name)
+                        counts['exported'] += 1
+                        counts['cached'] += 1
+                        advance()
+                    elif pool is None:
+                        finish(name, _build_workbook(inputs))
+                    else:
+                        # Keep a couple of workbooks queued per worker, no more.
+                        while len(pending) >= workers * 2:
+                            drain(FIRST_COMPLETED)
+                        pending[pool.submit(_build_workbook, inputs)] = name
+                while pending:
+                    drain(FIRST_COMPLETED)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    counts['seconds'] = time.perf_counter() - started
+    return counts
+
+
+def build_tenant_zip(inputs, progress):
+    """Export job entry point: builds the zip for inputs['tenant_id'] into a temporary file."""
+    app = inputs['app']
+    output = tempfile.TemporaryFile()
+    try:
+        with app.app_context():
+            tenant = db.session.get(Tenant, inputs['tenant_id'])
+            counts = write_tenant_export(
+                tenant, output, workers=app.config['EXPORT_BULK_PROCESSES'],
+                progress=progress, cache=app.extensions['export_cache'],
+            )
+            app.logger.info(f"Tenant export for {tenant.tenant_key}: {counts}")
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output
+
+
+# --- Routes ---
+
+def _tenant_admin_or_403():
+    from .database import get_tenant_for_user
+
+    if not current_user.is_tenant_admin:
+        return None, (jsonify({'error': 'Only tenant admins can export all users.'}), 403)
+    tenant = get_tenant_for_user(current_user)
+    if tenant is None:
+        return None, (jsonify({'error': 'Tenant not found.'}), 404)
+    return tenant, None
+
+
+def _get_own_job(job_id):
+    job = current_app.extensions['bulk_exports'].get(job_id)
+    if job is None or job['owner'] != current_user.get_id():
+        return None
+    return job
+
+
+@bulk_export_bp.route('/', methods=['POST'])
+@login_required
+def submit_tenant_export():
+    """Starts building the zip of every user's forecast workbook."""
+    import uuid
+    from .export_jobs import ExportQueueFull, job_status
+
+    tenant, error = _tenant_admin_or_403()
+    if error:
+        return error
+    try:
+        job = current_app.extensions['bulk_exports'].submit(
+            current_user.get_id(), uuid.uuid4().hex, build_tenant_zip,
+            {'app': current_app._get_current_object(), 'tenant_id': tenant.tenant_id},
+            current_app.logger, reports_progress=True,
+        )
+    except ExportQueueFull:
+        response = jsonify({'error': 'Too many tenant exports are in progress. Please try again later.'})
+        response.status_code = 429
+        response.headers['Retry-After'] = '30'
+        return response
+
+    body = job_status(job)
+    body['status_url'] = url_for('bulk_export.tenant_export_status', job_id=job['id'])
+    body['download_url'] = url_for('bulk_export.download_tenant_export', job_id=job['id'])
+    return jsonify(body), 202
+
+
+@bulk_export_bp.route('/<job_id>')
+@login_required
+def tenant_export_status(job_id):
+    from .export_jobs import JOB_DONE, job_status
+
+    job = _get_own_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found.'}), 404
+    body = job_status(job)
+    if job['status'] == JOB_DONE:
+        body['download_url'] = url_for('bulk_export.download_tenant_export', job_id=job_id)
+    return jsonify(body)
+
+
+@bulk_export_bp.route('/<job_id>/download')
+@login_required
+def download_tenant_export(job_id):
+    from flask import send_file
+    from .export_jobs import JOB_DONE
+
+    job = _get_own_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found.'}), 404
+    if job['status'] != JOB_DONE:
+        return jsonify({'error': 'The export is not ready yet.', 'status': job['status']}), 409
+    path = current_app.extensions['bulk_exports'].cache.get(job['key'])
+    if path is None:
+        return jsonify({'error': 'The export has expired. Please export again.'}), 410
+    return send_file(path, as_attachment=True, download_name='tenant_forecasts.zip', mimetype='application/zip')
+
+
+# --- CLI ---
+
+@click.command('export-tenant')
+@click.argument('tenant_key')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='Zip file to write (default: <tenant_key>_forecasts.zip).')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: EXPORT_BULK_PROCESSES).')
+@click.option('--batch-size', type=int, default=100, show_default=True, help='Users loaded per query batch.')
+@with_appcontext
+def export_tenant_command(tenant_key, output, workers, batch_size):
+    """Writes every user's forecast workbook of a tenant into one zip file."""
+    tenant = Tenant.query.filter_by(tenant_key=tenant_key).first()
+    if tenant is None:
+        raise click.ClickException(f"Tenant '{tenant_key}' not found.")
+    output = output or f'{tenant_key}_forecasts.zip'
+
+    def progress(done, total):
+        click.echo(f'\r{done}/{total} users', nl=done >= total)
+
+    with open(output, 'wb') as f:
+        counts = write_tenant_export(
+            tenant, f, workers=workers or current_app.config['EXPORT_BULK_PROCESSES'],
+            batch_size=batch_size, progress=progress, cache=current_app.extensions.get('export_cache'),
+        )
+    click.echo(
+        f"Wrote {counts['exported']} workbooks ({counts['cached']} from cache, {counts['skipped']} users "
+        f"without a forecast) to {output} in {counts['seconds']:.1f}s."
+    )
+
+
+def init_bulk_export(app):
+    """Registers the tenant export job queue, routes and CLI command."""
+    from .export_cache import ExportCache
+    from .export_jobs import ExportJobQueue
+
+    directory = os.path.join(app.config['EXPORT_CACHE_DIR'], 'tenants')
+    # One job at a time: each job already fans out over a process pool.
+    app.extensions['bulk_exports'] = ExportJobQueue(
+        ExportCache(directory, app.config['EXPORT_CACHE_MAX_BYTES'], suffix='.zip'),
+        os.path.join(directory, 'jobs'),
+        max_workers=1,
+        max_pending=app.config['EXPORT_BULK_MAX_PENDING'],
+    )
+    app.register_blueprint(bulk_export_bp)
+    app.cli.add_command(export_tenant_command)
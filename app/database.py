@@ -35,6 +35,13 @@ def get_tenant_by_key(tenant_key):
     """Retrieves a tenant by their key."""
     return Tenant.query.filter_by(tenant_key=tenant_key).first()
 
+def get_tenant_for_user(user):
+    """Retrieves the tenant a user belongs to."""
+    if user.tenant_id is not None:
+        return db.session.get(Tenant, user.tenant_id)
+    # Users created before tenant_id existed are linked by the owner's username.
+    return Tenant.query.filter_by(tenant_key=user.username).first()
+
 def create_tenant_owner(tenant, email, first_name, last_name, role):
     """Creates a new tenant owner."""
     owner = TenantOwner(
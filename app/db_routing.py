@@ -0,0 +1,198 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+# Last health probe per replica engine: engine -> (healthy, checked_at).
+_replica_health = {}
+_replica_health_lock = threading.RLock()
+
+
+class RoutingSession(Session):
+    """
+    A Flask-SQLAlchemy session that sends reads to a read replica when allowed.
+
+    Tenant data is first routed to the shard of the current tenant (see
+    sharding.py). On the primary shard, reads go to the replica only inside a
+    read-only route (see `read_only`) or a `use_replica()` block, only while
+    the replica is healthy and caught up, and never within a few seconds of
+    the user's own write. Everything else, including flushes, DML statements,
+    SELECT ... FOR UPDATE and every read after this session has written, goes
+    to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        from .sharding import DEFAULT_SHARD, current_shard_id, shard_engine, table_is_sharded
+
+        if bind is not None:
+            return bind
+        table = _statement_table(mapper, clause)
+        if table is None or table_is_sharded(table):
+            shard_id = current_shard_id(self)
+            if shard_id != DEFAULT_SHARD:
+                return shard_engine(shard_id)
+        if self._reads_from_replica(clause):
+            replica = get_healthy_replica()
+            if replica is not None:
+                if has_request_context():
+                    g.db_used_replica = replica
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if self._flushing or self.info.get('wrote'):
+            return False
+        if isinstance(clause, sa.sql.dml.UpdateBase):
+            _mark_write(self)
+            return False
+        if clause is not None and getattr(clause, '_for_update_arg', None) is not None:
+            return False
+        if self.info.get('use_replica'):
+            return True
+        return has_request_context() and g.get('db_read_only', False) and not _in_read_your_writes_window()
+
+
+def _statement_table(mapper, clause):
+    """Returns the main table a mapper or statement targets, if there is one."""
+    if mapper is not None:
+        return sa.inspect(mapper).local_table
+    if isinstance(clause, sa.Table):
+        return clause
+    if isinstance(clause, sa.sql.dml.UpdateBase):
+        return clause.table
+    if isinstance(clause, sa.sql.Select):
+        for from_clause in clause.get_final_froms():
+            if isinstance(from_clause, sa.Table):
+                return from_clause
+    return None
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(db_session, flush_context):
+    _mark_write(db_session)
+
+
+def _mark_write(db_session):
+    db_session.info['wrote'] = True
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _in_read_your_writes_window():
+    return session.get('rw_until', 0) > time.time()
+
+
+def read_only(view):
+    """
+    Marks a view as read-only so its queries may be served by the replica.
+    If the replica fails during the view, it is run once more on the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from .extensions import db
+
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        except sa.exc.DBAPIError as e:
+            replica = g.pop('db_used_replica', None)
+            if replica is None or not (isinstance(e, sa.exc.OperationalError) or e.connection_invalidated):
+                raise
+            current_app.logger.warning(f"Read replica failed, retrying on the primary: {e}")
+            mark_replica_unhealthy(replica)
+            db.session.rollback()
+            g.db_read_only = False
+            return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_replica():
+    """Routes the reads of the current session to the replica, e.g. for cross-tenant reports."""
+    from .extensions import db
+
+    db_session = db.session()
+    previous = db_session.info.get('use_replica', False)
+    db_session.info['use_replica'] = True
+    try:
+        yield db_session
+    finally:
+        db_session.info['use_replica'] = previous
+
+
+def replica_lag_seconds(engine):
+    """Returns how far the replica is behind the primary, in seconds."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # pg_last_xact_replay_timestamp() stops moving while the primary is
+            # idle, so a fully replayed WAL counts as no lag.
+            lag = conn.execute(sa.text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )).scalar()
+            return float(lag or 0)
+        conn.execute(sa.text('SELECT 1'))
+        return 0.0
+
+
+def mark_replica_unhealthy(engine):
+    """Sends reads back to the primary until the next health probe."""
+    with _replica_health_lock:
+        _replica_health[engine] = (False, time.monotonic())
+
+
+def get_healthy_replica():
+    """Returns the replica engine if it is configured, reachable and caught up."""
+    from .extensions import db
+
+    engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return None
+
+    now = time.monotonic()
+    healthy, checked_at = _replica_health.get(engine, (False, None))
+    if checked_at is None or now - checked_at > current_app.config['REPLICA_HEALTH_TTL']:
+        with _replica_health_lock:
+            healthy, checked_at = _replica_health.get(engine, (False, None))
+            if checked_at is None or now - checked_at > current_app.config['REPLICA_HEALTH_TTL']:
+                healthy = _probe_replica(engine)
+                _replica_health[engine] = (healthy, time.monotonic())
+    return engine if healthy else None
+
+
+def _probe_replica(engine):
+    try:
+        lag = replica_lag_seconds(engine)
+    except sa.exc.SQLAlchemyError as e:
+        current_app.logger.warning(f"Read replica unavailable, using the primary: {e}")
+        return False
+    if lag > current_app.config['REPLICA_MAX_LAG']:
+        current_app.logger.warning(f"Read replica is {lag:.1f}s behind, using the primary.")
+        return False
+    return True
+
+
+def init_db_routing(app):
+    """Wires up replica health tracking and read-your-writes stickiness."""
+    from .extensions import db
+
+    with app.app_context():
+        replica = db.engines.get(REPLICA_BIND)
+    if replica is not None:
+        @sa.event.listens_for(replica, 'handle_error')
+        def _replica_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, sa.exc.OperationalError):
+                mark_replica_unhealthy(replica)
+
+    @app.after_request
+    def stick_to_primary_after_write(response):
+        """Keeps the user's reads on the primary until the replica has their write."""
+        if g.get('db_wrote'):
+            session['rw_until'] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+        return response
@@ -0,0 +1,100 @@
+from sqlalchemy.pool import NullPool
+
+# Named SQLAlchemy engine configurations, one per deployment runtime.
+#
+# pooled      Long-lived gunicorn workers talking straight to PostgreSQL. Keeps
+#             a warm pool, pings connections on checkout and recycles them
+#             before the server's idle timeout.
+# serverless  Vercel functions. Instances are frozen between invocations, so a
+#             pooled connection is likely dead (or leaked) by the next one.
+#             Every checkout opens a fresh connection and closes it afterwards.
+# pgbouncer   Behind PgBouncer in transaction mode. PgBouncer already pools
+#             server connections, so a small client pool is enough, pre-ping
+#             is a wasted round trip and server-side prepared statements must
+#             be off because consecutive transactions may hit different
+#             backends.
+# sqlite      Local development. Maps the PostgreSQL `shared` schema onto the
+#             main SQLite database so the tenant tables can be used locally.
+ENGINE_PROFILES = {
+    'pooled': {
+        'poolclass': None,
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_recycle': 280,
+        'pool_pre_ping': True,
+        'query_cache_size': 500,
+        'prepared_statements': True,
+    },
+    'serverless': {
+        'poolclass': NullPool,
+        'pool_pre_ping': False,
+        'query_cache_size': 100,
+        'prepared_statements': False,
+    },
+    'pgbouncer': {
+        'poolclass': None,
+        'pool_size': 2,
+        'max_overflow': 3,
+        'pool_recycle': 280,
+        'pool_pre_ping': False,
+        'query_cache_size': 500,
+        'prepared_statements': False,
+    },
+    'sqlite': {
+        'poolclass': None,
+        'pool_pre_ping': False,
+        'query_cache_size': 500,
+        'prepared_statements': True,
+        'schema_translate_map': {'shared': None},
+    },
+}
+
+# Used when a profile does not cap the number of connections (NullPool).
+DEFAULT_MAX_CONNECTIONS = 15
+
+
+def default_profile_name(database_uri, environ):
+    """Picks a profile from the database URL and the runtime environment."""
+    if database_uri.startswith('sqlite'):
+        return 'sqlite'
+    if environ.get('VERCEL'):
+        return 'serverless'
+    return 'pooled'
+
+
+def engine_options(profile_name, database_uri):
+    """Builds the SQLALCHEMY_ENGINE_OPTIONS for a named profile."""
+    if profile_name not in ENGINE_PROFILES:
+        raise ValueError(
+            f"Unknown engine profile '{profile_name}'. Choose one of: {', '.join(sorted(ENGINE_PROFILES))}."
+        )
+    profile = ENGINE_PROFILES[profile_name]
+    is_postgres = database_uri.startswith('postgresql')
+
+    options = {
+        'pool_pre_ping': profile['pool_pre_ping'],
+        'query_cache_size': profile['query_cache_size'],
+    }
+    if profile['poolclass'] is not None:
+        options['poolclass'] = profile['poolclass']
+    for key in ('pool_size', 'max_overflow', 'pool_recycle'):
+        if key in profile and not database_uri.startswith('sqlite'):
+            options[key] = profile[key]
+    if 'schema_translate_map' in profile:
+        options['execution_options'] = {'schema_translate_map': profile['schema_translate_map']}
+
+    if is_postgres:
+        connect_args = {'connect_timeout': 30}
+        # psycopg2 never prepares statements server-side. psycopg 3 does after
+        # a few executions unless prepare_threshold is disabled.
+        if not profile['prepared_statements'] and database_uri.startswith('postgresql+psycopg:'):
+            connect_args['prepare_threshold'] = None
+        options['connect_args'] = connect_args
+    return options
+
+
+def max_connections(options):
+    """Returns how many connections an engine built from `options` may open at once."""
+    if 'pool_size' in options:
+        return options['pool_size'] + options.get('max_overflow', 0)
+    return DEFAULT_MAX_CONNECTIONS
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from flask import current_app
+
+# Part of every cache key. Bump it whenever utils/export.py changes what it
+# writes, so stale workbooks are not served after a deploy.
+EXPORT_LAYOUT_VERSION = 2
+
+
+def export_cache_key(*parts):
+    """Returns a stable content hash of the inputs of an export."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ExportCache:
+    """
+    Finished export files on local disk, keyed by the hash of their inputs.
+
+    Each entry is one file named after its key. Reads bump the file's mtime,
+    so evicting the oldest mtimes first is least-recently-used, and the same
+    directory can be shared by several worker processes: entries are written
+    to a temporary file and renamed into place, so readers never see a
+    partial file.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Returns the path of a cached export, or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, fileobj):
+        """Stores the contents of `fileobj` under `key` and returns the cached path."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = fileobj.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # The new entry stays even if it alone exceeds max_bytes: its job is
+        # about to report it ready. It goes first on the next eviction.
+        self.evict(keep=self.path(key))
+        return self.path(key)
+
+    def evict(self, keep=None):
+        """Removes least-recently-used entries, except `keep`, until the cache fits in `max_bytes`."""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.suffix) or entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def get_export_cache():
+    """Returns the export cache of the current app."""
+    return current_app.extensions['export_cache']
+
+
+def init_export_cache(app):
+    app.extensions['export_cache'] = ExportCache(
+        app.config['EXPORT_CACHE_DIR'], app.config['EXPORT_CACHE_MAX_BYTES'], suffix='.xlsx'
+    )
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .export_cache import ExportCache
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class ExportQueueFull(Exception):
+    """Raised when too many export jobs are already waiting."""
+
+
+class ExportJobQueue:
+    """
+    Builds export files in a bounded background thread pool.
+
+    Job records are small JSON files in `store_dir`, so any worker process on
+    the same host can answer status polls, and finished files go into the
+    export cache under their content key, so downloads are ordinary cache
+    hits. The pool itself belongs to this process: a job only runs while the
+    process that accepted it is alive, which on serverless hosts means while
+    the instance stays warm.
+    """
+
+    def __init__(self, cache: ExportCache, store_dir, max_workers=2, max_pending=20, job_ttl=3600):
+        self.cache = cache
+        self.store_dir = store_dir
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export-job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+            'queue_seconds_total': 0.0, 'build_seconds_total': 0.0, 'build_seconds_max': 0.0,
+        }
+        os.makedirs(store_dir, exist_ok=True)
+
+    def submit(self, owner, key, build, inputs, logger=None, reports_progress=False):
+        """
+        Queues `build(inputs)` and returns the new job record. `build` must
+        return a readable file object; it runs without an app context, so
+        `inputs` should already hold everything it needs. With
+        `reports_progress`, it is called as `build(inputs, progress)` and may
+        call `progress(done, total)` to update the job record.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise ExportQueueFull()
+            self._pending += 1
+            self._stats['submitted'] += 1
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'owner': owner,
+            'key': key,
+            'status': JOB_QUEUED,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            'progress': None,
+        }
+        try:
+            self._save(job)
+            self._executor.submit(self._run, job, build, inputs, logger, reports_progress)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._remove_expired()
+        return job
+
+    def done_job(self, owner, key):
+        """Records a job that is already finished because its file is cached."""
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex, 'owner': owner, 'key': key, 'status': JOB_DONE,
+            'submitted_at': now, 'started_at': now, 'finished_at': now, 'error': None, 'progress': None,
+        }
+        self._save(job)
+        return job
+
+    def get(self, job_id):
+        """Returns a job record, or None if it does not exist (or has expired)."""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def stats(self):
+        """Returns a snapshot of the job counters and timings of this process."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = self._pending
+        finished = snapshot['completed'] + snapshot['failed']
+        snapshot['avg_queue_seconds'] = snapshot['queue_seconds_total'] / finished if finished else 0.0
+        snapshot['avg_build_seconds'] = snapshot['build_seconds_total'] / finished if finished else 0.0
+        return snapshot
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, build, inputs, logger, reports_progress):
+        job = dict(job, status=JOB_RUNNING)
+        job['started_at'] = time.time()
+        self._save(job)
+        try:
+            if self.cache.get(job['key']) is None:
+                args = (inputs, self._progress_reporter(job)) if reports_progress else (inputs,)
+                with build(*args) as output:
+                    self.cache.put(job['key'], output)
+            job['status'] = JOB_DONE
+        except Exception as e:
+            if logger is not None:
+                logger.exception(f"Export job {job['id']} failed: {e}")
+            job['status'] = JOB_FAILED
+            job['error'] = 'The export could not be generated.'
+        job['finished_at'] = time.time()
+        self._save(job)
+
+        queue_seconds = job['started_at'] - job['submitted_at']
+        build_seconds = job['finished_at'] - job['started_at']
+        with self._lock:
+            self._pending -= 1
+            self._stats['completed' if job['status'] == JOB_DONE else 'failed'] += 1
+            self._stats['queue_seconds_total'] += queue_seconds
+            self._stats['build_seconds_total'] += build_seconds
+            self._stats['build_seconds_max'] = max(self._stats['build_seconds_max'], build_seconds)
+        if logger is not None:
+            logger.info(f"Export job {job['id']} {job['status']}: queued {queue_seconds:.2f}s, built in {build_seconds:.2f}s")
+
+    def _progress_reporter(self, job, interval=0.5):
+        """Returns a progress(done, total) callback that saves the job at most every `interval` seconds."""
+        last_saved = [0.0]
+
+        def progress(done, total):
+            job['progress'] = {'done': done, 'total': total}
+            now = time.monotonic()
+            if done >= total or now - last_saved[0] >= interval:
+                last_saved[0] = now
+                self._save(job)
+        return progress
+
+    def _job_path(self, job_id):
+        return os.path.join(self.store_dir, job_id + '.json')
+
+    def _save(self, job):
+        tmp_path = self._job_path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job['id']))
+
+    def _remove_expired(self):
+        cutoff = time.time() - self.job_ttl
+        with os.scandir(self.store_dir) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def job_status(job):
+    """Returns the public view of a job record, with timings in seconds."""
+    started, finished = job['started_at'], job['finished_at']
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'error': job['error'],
+        'progress': job.get('progress'),
+        'queue_seconds': (started - job['submitted_at']) if started else None,
+        'build_seconds': (finished - started) if finished and started else None,
+    }
+
+
+def get_export_jobs():
+    """Returns the export job queue of the current app."""
+    return current_app.extensions['export_jobs']
+
+
+def get_export_job_stats():
+    """Returns the export job counters of the current app, if enabled."""
+    jobs = current_app.extensions.get('export_jobs')
+    return jobs.stats() if jobs else {}
+
+
+def init_export_jobs(app):
+    app.extensions['export_jobs'] = ExportJobQueue(
+        app.extensions['export_cache'],
+        os.path.join(app.config['EXPORT_CACHE_DIR'], 'jobs'),
+        max_workers=app.config['EXPORT_JOB_WORKERS'],
+        max_pending=app.config['EXPORT_JOB_MAX_PENDING'],
+    )
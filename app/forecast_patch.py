@@ -0,0 +1,256 @@
+import hashlib
+import json
+import threading
+import time
+
+from .extensions import db
+from .models import Asset, Liability
+
+# Inputs the monthly profitability forecast depends on. A patch touching any
+# of them recomputes the whole forecast.
+PROFITABILITY_FIELDS = ('cogs_percentage', 'tax_rate', 'seasonality', 'annual_operating_expenses')
+# Inputs only the key ratios depend on. A patch touching only these (or the
+# asset and liability tables) recomputes the ratios from the stored results.
+RATIO_FIELDS = ('current_assets', 'current_liabilities', 'interest_expense', 'depreciation')
+ITEM_TABLES = {'assets': Asset, 'liabilities': Liability}
+
+
+# --- Parsing ---
+
+def _parse_items(items):
+    if not isinstance(items, list):
+        raise ValueError('must be a list')
+    return [(item['description'], float(item.get('amount', 0) or 0)) for item in items if item.get('description')]
+
+
+def parse_forecast_patch(data):
+    """
+    Validates a patch body and returns it normalized:
+
+        {'version': str, 'changes': {field: value}, 'assets': [(description, amount)] or None,
+         'liabilities': ... or None}
+
+    Raises ValueError naming the offending field.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('version'), str):
+        raise ValueError("'version' is required")
+    changes = data.get('changes') or {}
+    if not isinstance(changes, dict):
+        raise ValueError("'changes' must be an object")
+
+    patch = {'version': data['version'], 'changes': {}}
+    for field, value in changes.items():
+        try:
+            if field == 'seasonality':
+                value = [float(v) for v in value]
+                if len(value) != 12:
+                    raise ValueError
+            elif field in PROFITABILITY_FIELDS or field in RATIO_FIELDS:
+                value = float(value)
+            else:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid value for '{field}'")
+        patch['changes'][field] = value
+    for table in ITEM_TABLES:
+        try:
+            patch[table] = _parse_items(data[table]) if data.get(table) is not None else None
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"invalid '{table}'")
+    return patch
+
+
+def merge_patches(patches):
+    """
+    Folds patches, oldest first, into one. Later values win field by field;
+    a table is replaced by the latest list sent for it.
+    """
+    merged = {'versions': set(), 'changes': {}, 'assets': None, 'liabilities': None}
+    for patch in patches:
+        merged['versions'].add(patch['version'])
+        merged['changes'].update(patch['changes'])
+        for table in ITEM_TABLES:
+            if patch[table] is not None:
+                merged[table] = patch[table]
+    return merged
+
+
+# --- Applying ---
+
+def forecast_version(user):
+    """
+    Returns a token for the inputs of a user's forecast: their financial
+    params, asset and liability tables and products. It changes whenever one
+    of them does, whoever made the change.
+    """
+    params = user.financial_params
+    state = [
+        [getattr(params, field) for field in PROFITABILITY_FIELDS + RATIO_FIELDS],
+        [(a.description, a.amount) for a in user.assets],
+        [(l.description, l.amount) for l in user.liabilities],
+        sorted((p.description, p.price, p.sales_volume, p.sales_volume_unit) for p in user.products),
+    ]
+    return hashlib.sha256(json.dumps(state, default=str).encode()).hexdigest()[:16]
+
+
+def forecast_inputs(user):
+    """Returns the editable inputs of the forecast page, for resyncing a stale client."""
+    params = user.financial_params
+    inputs = {field: getattr(params, field) for field in PROFITABILITY_FIELDS + RATIO_FIELDS}
+    inputs['seasonality'] = json.loads(params.seasonality)
+    inputs['assets'] = [a.to_dict() for a in user.assets]
+    inputs['liabilities'] = [l.to_dict() for l in user.liabilities]
+    return inputs
+
+
+def _sync_items(user, table, items):
+    """
+    Makes a user's asset or liability rows match `items`, updating rows in
+    place and only adding or deleting the difference.
+    """
+    model = ITEM_TABLES[table]
+    rows = list(getattr(user, table))
+    if [(r.description, r.amount) for r in rows] == items:
+        return False
+    for row, (description, amount) in zip(rows, items):
+        row.description, row.amount = description, amount
+    for row in rows[len(items):]:
+        db.session.delete(row)
+    for description, amount in items[len(rows):]:
+        db.session.add(model(description=description, amount=amount, user_id=user.id))
+    db.session.flush()
+    db.session.expire(user, [table])
+    return True
+
+
+def _stored_ratios(user):
+    """Computes the key ratios from the stored forecast results, without re-running the forecast."""
+    from logic.financial_ratios import calculate_key_ratios
+
+    params = user.financial_params
+    return calculate_key_ratios(
+        net_profit=params.annual_net_profit or 0, total_revenue=params.total_annual_revenue or 0,
+        total_assets=sum(a.amount for a in user.assets), current_assets=params.current_assets,
+        current_liabilities=params.current_liabilities, total_debt=sum(l.amount for l in user.liabilities),
+        net_operating_income=params.net_operating_income or 0, interest_expense=params.interest_expense,
+        depreciation=params.depreciation,
+    )
+
+
+def apply_forecast_patch(user, patch):
+    """
+    Applies a merged patch to `user` and returns the response body.
+
+    When the patch was made against the current version, only what it can
+    have changed is recomputed and returned: the whole forecast (`annual`,
+    `quarterly`, `monthly`) if a profitability input changed, otherwise the
+    key ratios that moved (`ratios`). A patch made against an older version,
+    or merged with another client's, gets the full forecast plus the current
+    `inputs` and `stale: true`, so the client can resync.
+    """
+    from .services import get_or_recalculate_forecast
+
+    params = user.financial_params
+    stale = patch['versions'] != {forecast_version(user)}
+    ratios_before = None if stale else _stored_ratios(user)
+
+    changes = patch['changes']
+    for field, value in changes.items():
+        setattr(params, field, json.dumps(value) if field == 'seasonality' else value)
+    for table in ITEM_TABLES:
+        if patch[table] is not None:
+            _sync_items(user, table, patch[table])
+
+    if stale or any(field in changes for field in PROFITABILITY_FIELDS):
+        body = get_or_recalculate_forecast(user)
+    else:
+        db.session.commit()
+        ratios = _stored_ratios(user)
+        body = {'ratios': {k: v for k, v in ratios.items() if ratios_before.get(k) != v}}
+    if stale:
+        body['stale'] = True
+        body['inputs'] = forecast_inputs(user)
+    body['version'] = forecast_version(user)
+    return body
+
+
+# --- Coalescing ---
+
+class _UserPatches:
+    __slots__ = ('lock', 'pending', 'submitted', 'applied', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.submitted = 0
+        self.applied = 0
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class ForecastPatchCoalescer:
+    """
+    Runs forecast patches one user at a time and folds bursts into one recompute.
+
+    Patches arriving while a user's previous patch is still being applied
+    queue up; the next request to get the user's lock applies all of them at
+    once (after waiting `debounce` seconds for stragglers) and the others
+    return its result. Coalescing is per process; patches handled by
+    different processes are still applied field by field, last one wins.
+    """
+
+    def __init__(self, debounce=0.0):
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._users = {}
+        self._stats = {'patches': 0, 'recomputes': 0}
+
+    def submit(self, user_id, patch, apply):
+        """
+        Queues `patch` for `user_id` and returns the body computed for the
+        batch it ends up in. `apply(merged_patch)` does the work and is called
+        by whichever request runs the batch.
+        """
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = _UserPatches()
+            state.pending.append(patch)
+            state.submitted += 1
+            state.waiters += 1
+            ticket = state.submitted
+            self._stats['patches'] += 1
+
+        try:
+            with state.lock:
+                if state.applied < ticket:
+                    if self.debounce:
+                        time.sleep(self.debounce)
+                    with self._lock:
+                        batch, state.pending = state.pending, []
+                        upto = state.submitted
+                        self._stats['recomputes'] += 1
+                    try:
+                        state.result, state.error = apply(merge_patches(batch)), None
+                    except Exception as exc:
+                        state.result, state.error = None, exc
+                    state.applied = upto
+                if state.error is not None:
+                    raise state.error
+                return state.result
+        finally:
+            with self._lock:
+                state.waiters -= 1
+                if not state.waiters:
+                    del self._users[user_id]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def init_forecast_patches(app):
+    app.extensions['forecast_patches'] = ForecastPatchCoalescer(
+        debounce=app.config['FORECAST_PATCH_DEBOUNCE_MS'] / 1000,
+    )
@@ -0,0 +1,208 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, render_template, request
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from werkzeug.local import LocalProxy
+
+from .db_routing import RoutingSession
+
+
+class FragmentCache:
+    """
+    Rendered template fragments of this process, least recently used first out.
+
+    Keys are tuples of the parts a fragment varies by. Parts such as
+    'user:<username>' and 'tenant:<id>' (see `fragment_scope`) name what the
+    fragment was rendered for, and `invalidate` drops every entry carrying
+    one of them. Invalidation only reaches this process; entries also expire
+    after `ttl` seconds, which bounds how long other workers serve a fragment
+    rendered before a write.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, *parts):
+        """Drops every entry whose key contains one of `parts`."""
+        parts = set(parts)
+        with self._lock:
+            stale = [key for key in self._entries if parts.intersection(key)]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def _cache_key(parts):
+    key = []
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            key.extend(part)
+        else:
+            key.append(part)
+    return tuple(key)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    `{% cache 'name', part, ... %}...{% endcache %}` renders its body once per
+    distinct key and reuses it from the environment's `fragment_cache`. Every
+    value the body depends on must be part of the key; tuples are flattened,
+    so `fragment_scope()` can be passed as one part.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = ('fragment',) + _cache_key(parts)
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            cache.set(key, rendered)
+        return rendered
+
+
+def fragment_scope():
+    """Returns the key parts naming the current user and tenant, which writes to them invalidate."""
+    if not current_user.is_authenticated:
+        return ('anonymous',)
+    if current_user.tenant_id is None:
+        # Tenants of older users are found by username; see get_tenant_for_user.
+        return (f'user:{current_user.username}',)
+    return (f'user:{current_user.username}', f'tenant:{current_user.tenant_id}')
+
+
+def _current_tenant():
+    if 'current_tenant' not in g:
+        from .database import get_tenant_for_user
+        g.current_tenant = get_tenant_for_user(current_user) if current_user.is_authenticated else None
+    return g.current_tenant
+
+
+def get_fragment_cache():
+    return current_app.extensions['fragment_cache']
+
+
+def render_cached_page(template_name, **context):
+    """
+    Renders a page that only varies by user and tenant, reusing the cached
+    HTML while it is fresh. The response carries a weak ETag of the HTML and
+    is answered with 304 when the browser already has it.
+    """
+    cache = get_fragment_cache()
+    key = ('page', template_name) + fragment_scope()
+    cached = cache.get(key)
+    if cached is None:
+        body = render_template(template_name, **context)
+        cached = (body, hashlib.sha256(body.encode('utf-8')).hexdigest()[:32])
+        cache.set(key, cached)
+    body, etag = cached
+    response = current_app.response_class(body, mimetype='text/html')
+    # Weak: the gzipped response (see compress_response) is the same page.
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# --- Invalidation on writes ---
+
+def _scope_parts(obj):
+    from .models import Tenant, User
+
+    if isinstance(obj, User):
+        return {f'user:{obj.username}'}
+    if isinstance(obj, Tenant):
+        return {f'tenant:{obj.tenant_id}', f'user:{obj.tenant_key}'}
+    return set()
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _collect_invalidations(db_session, flush_context):
+    parts = set()
+    for obj in (*db_session.new, *db_session.dirty, *db_session.deleted):
+        parts |= _scope_parts(obj)
+    if parts:
+        db_session.info.setdefault('fragment_invalidations', set()).update(parts)
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _invalidate_committed(db_session):
+    parts = db_session.info.pop('fragment_invalidations', None)
+    if parts and has_app_context() and 'fragment_cache' in current_app.extensions:
+        get_fragment_cache().invalidate(*parts)
+
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _discard_invalidations(db_session):
+    db_session.info.pop('fragment_invalidations', None)
+
+
+def init_fragment_cache(app):
+    """
+    Enables `{% cache %}` in templates, backed by a per-process LRU of
+    FRAGMENT_CACHE_SIZE entries (0 keeps nothing). Register before templates
+    are compiled, as the tag is resolved at compile time.
+    """
+    cache = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'])
+    app.extensions['fragment_cache'] = cache
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = cache
+    app.jinja_env.globals['fragment_scope'] = fragment_scope
+
+    @app.context_processor
+    def inject_tenant():
+        # Loaded only when a template uses it, e.g. on a sidebar cache miss;
+        # views that pass `tenant` themselves override it.
+        return {'tenant': LocalProxy(_current_tenant)}
@@ -1,11 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import current_user, login_required
 from app.models import db, Tenant, Location
+from app.db_routing import read_only
 
 locations_bp = Blueprint('locations', __name__, url_prefix='/locations')
 
 @locations_bp.route('/')
 @login_required
+@read_only
 def list_locations():
     tenant = Tenant.query.filter_by(tenant_key=current_user.username).first()
     if not tenant or not tenant.use_multilocations:
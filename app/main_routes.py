@@ -1,3 +1,4 @@
+import hashlib
 import json
 from flask import Blueprint, render_template, request, jsonify, send_file, redirect, url_for, flash, g, current_app
 from typing import Any, Dict
@@ -6,10 +7,13 @@ from flask_login import login_required, current_user
 
 from .extensions import db
 from .models import FinancialParams, Asset, Liability, BusinessStartupActivity
-from logic.loan import calculate_loan_schedule
+from logic.loan import aggregate_schedule_by_year, calculate_loan_schedule, schedule_for_year
 from logic.financial_ratios import calculate_dscr
-from utils.export import create_forecast_spreadsheet
 from .database import get_assessment_messages
+from .db_routing import read_only
+from .fragment_cache import render_cached_page
+from .singleflight import singleflight
+from .warmup import seed_data
 
 bp = Blueprint('main', __name__, url_prefix='/')
 
@@ -17,9 +21,8 @@ bp = Blueprint('main', __name__, url_prefix='/')
 # This will be populated on the first request.
 _assessment_messages_cache = None
 
-@bp.before_app_request
-def before_request():
-    """Load assessment messages into the request context if not already present."""
+def load_assessment_messages():
+    """Returns the assessment messages, loading them from the database the first time."""
     global _assessment_messages_cache
     if _assessment_messages_cache is None:
         try:
@@ -29,8 +32,12 @@ def before_request():
             current_app.logger.error(f"Failed to load assessment messages from DB: {e}")
             db.session.rollback() # Rollback the session to prevent further errors
             _assessment_messages_cache = {}  # Use an empty dict on failure
+    return _assessment_messages_cache
 
-    g.assessment_messages = _assessment_messages_cache
+@bp.before_app_request
+def before_request():
+    """Load assessment messages into the request context if not already present."""
+    g.assessment_messages = load_assessment_messages()
 @bp.route("/")
 def index():
     if current_user.is_authenticated:
@@ -40,12 +47,12 @@ def index():
 @bp.route("/intro")
 @login_required
 def intro():
-    return render_template('intro.html')
+    return render_cached_page('intro.html')
 
 @bp.route("/library")
 @login_required
 def library():
-    return render_template('library.html')
+    return render_cached_page('library.html')
 
 @bp.route('/startup-activities', methods=['GET', 'POST'])
 @login_required
@@ -95,8 +102,7 @@ def startup_activities():
     # Self-healing: If the user has an incomplete list of activities due to a past bug,
     # delete the partial list and re-seed the full one.
     try:
-        with current_app.open_resource('db/startup-activities.json') as f:
-            default_activities_count = len(json.load(f))
+        default_activities_count = len(seed_data('startup-activities.json'))
     except Exception:
         default_activities_count = 10 # Fallback count
 
@@ -107,8 +113,7 @@ def startup_activities():
 
     if not activities:
         try:
-            with current_app.open_resource('db/startup-activities.json') as f:
-                initial_activities_data = json.load(f)
+            initial_activities_data = seed_data('startup-activities.json')
             new_activities = [BusinessStartupActivity(**item, user_id=current_user.id) for item in initial_activities_data]
             db.session.add_all(new_activities)
             db.session.commit()
@@ -122,6 +127,7 @@ def startup_activities():
 
 @bp.route("/product-detail", methods=["GET"])
 @login_required
+@read_only
 def product_detail():
     from . import services
     products, expenses, company_name = services.get_product_and_expense_data(current_user.id)
@@ -136,6 +142,7 @@ def product_detail():
 
 @bp.route("/save-product-details", methods=["POST"])
 @login_required
+@singleflight()
 def save_product_details():
     from . import services
     data = request.get_json()
@@ -144,6 +151,7 @@ def save_product_details():
 
 @bp.route("/financial-forecast", methods=["GET"])
 @login_required
+# Not @read_only: the page recalculates and stores the forecast results.
 def financial_forecast():
     from . import services
     financial_params = current_user.financial_params
@@ -158,16 +166,37 @@ def financial_forecast():
 
     forecast = services.get_or_recalculate_forecast(current_user)
 
+    from .forecast_patch import forecast_version
     return render_template(
         'financial-forecast.html',
         forecast=forecast,
+        forecast_version=forecast_version(current_user),
         assets=assets,
         liabilities=liabilities,
         financial_params=financial_params
     )
 
+def _forecast_response(body):
+    """
+    Returns `body` as plain JSON, or in the compact columnar encoding (gzipped
+    when accepted) if the client asks for it in its Accept header.
+    """
+    from utils.forecast_payload import COLUMNAR_MIMETYPE, dumps_columnar, gzip_if_worthwhile
+
+    if request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE]) != COLUMNAR_MIMETYPE:
+        response = jsonify(body)
+    else:
+        data, content_encoding = gzip_if_worthwhile(dumps_columnar(body), request.accept_encodings['gzip'] > 0)
+        response = current_app.response_class(data, mimetype=COLUMNAR_MIMETYPE)
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+    return response
+
 @bp.route("/recalculate-forecast", methods=["POST"])
 @login_required
+@singleflight()
 def recalculate_forecast():
     from . import services
     data = request.get_json()
@@ -188,10 +217,33 @@ def recalculate_forecast():
     db.session.refresh(current_user)
 
     forecast = services.get_or_recalculate_forecast(current_user, data)
-    return jsonify(forecast)
+    return _forecast_response(forecast)
+
+@bp.route("/recalculate-forecast", methods=["PATCH"])
+@login_required
+def patch_forecast():
+    """
+    Applies only the inputs that changed and returns only the outputs that
+    changed. See forecast_patch.apply_forecast_patch for the response.
+    """
+    from .forecast_patch import apply_forecast_patch, parse_forecast_patch
+
+    if current_user.financial_params is None:
+        return jsonify({'error': 'Financial parameters not found.'}), 404
+    try:
+        patch = parse_forecast_patch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    user = current_user._get_current_object()
+    body = current_app.extensions['forecast_patches'].submit(
+        user.id, patch, lambda merged: apply_forecast_patch(user, merged)
+    )
+    return _forecast_response(body)
 
 @bp.route("/loan-calculator", methods=['GET', 'POST'])
 @login_required
+@singleflight()
 def loan_calculator():
     from . import services
     params = current_user.financial_params
@@ -210,7 +262,7 @@ def loan_calculator():
     interest_expense = params.interest_expense or 0
     icr = net_operating_income / interest_expense if interest_expense > 0 else 0
     
-    assessment, dscr, dscr_status, schedule, monthly_payment = None, 0.0, "", None, None
+    assessment, dscr, dscr_status, monthly_payment = None, 0.0, "", None
     form_data = {
         'loan_amount': params.loan_amount,
         'interest_rate': params.loan_interest_rate,
@@ -236,11 +288,10 @@ def loan_calculator():
         db.session.commit()
         return redirect(url_for('main.loan_calculator'))
 
-    # On a GET request, load the saved loan data from the database
+    # On a GET request, load the saved loan data from the database. The
+    # schedule itself is fetched by the page from /loan-schedule.
     if request.method == 'GET' and params.loan_monthly_payment:
         monthly_payment = params.loan_monthly_payment
-        if params.loan_schedule:
-            schedule = params.loan_schedule  # Pass the raw JSON string to the template
 
     # This block runs for both POST and for GET requests that have loaded data
     if monthly_payment and monthly_payment > 0:
@@ -266,33 +317,167 @@ def loan_calculator():
                            assessment=assessment,
                            dscr=dscr,
                            dscr_status=dscr_status,
-                           schedule=schedule,
+                           has_schedule=bool(params.loan_schedule),
                            icr=icr)
 
-@bp.route("/export-forecast")
+@bp.route("/loan-schedule")
 @login_required
-def export_forecast():
+@read_only
+def loan_schedule():
+    """
+    Returns the saved amortization schedule summed per year, or the months
+    of one year with `?year=N`. Responses carry an ETag of the schedule so
+    drilling back into a year is answered with 304.
+    """
     params = current_user.financial_params
-    products = [p.to_dict() for p in current_user.products]
-    operating_expenses = [e.to_dict() for e in current_user.expenses]
-    startup_activities = [a.to_dict() for a in current_user.startup_activities]
-    loan_details = {
-        'loan_amount': params.loan_amount,
-        'interest_rate': params.loan_interest_rate,
-        'loan_term': params.loan_term,
-        'monthly_payment': params.loan_monthly_payment,
-        'schedule': json.loads(params.loan_schedule) if params.loan_schedule else None,
-    }
+    if not params or not params.loan_schedule:
+        return jsonify({'error': 'No loan schedule saved.'}), 404
+    year = request.args.get('year', type=int)
+
+    etag = hashlib.sha256(f'{year}:{params.loan_schedule}'.encode()).hexdigest()[:32]
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        schedule = json.loads(params.loan_schedule)
+        if year is None:
+            body = {'loan_term': params.loan_term, 'years': aggregate_schedule_by_year(schedule)}
+        else:
+            months = schedule_for_year(schedule, year) if year > 0 else []
+            if not months:
+                return jsonify({'error': f'Year {year} is outside the loan term.'}), 404
+            body = {'year': year, 'months': months}
+        response = jsonify(body)
+    response.set_etag(etag)
+    # The schedule changes whenever the loan is recalculated, so revalidate.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _revalidate_export(response):
+    # Browsers may keep the file but must revalidate it before reuse.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _send_cached_export(path, etag):
+    from .services import EXPORT_FORMATS
+    mimetype, download_name = EXPORT_FORMATS['xlsx']
+    return _revalidate_export(send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype,
+        etag=etag,
+        max_age=0,
+    ))
 
-    spreadsheet_file = create_forecast_spreadsheet(
-        products, operating_expenses, params.cogs_percentage, loan_details,
-        json.loads(params.seasonality), params.company_name,
-        params.depreciation, params.interest_expense, startup_activities
-    )
+@bp.route("/export-forecast")
+@login_required
+@read_only
+def export_forecast():
+    """
+    Downloads the forecast. ?format=xlsx (default) is the full workbook with
+    charts; ?format=csv (zipped, one file per table) and ?format=json
+    (columnar) are light formats for integrations.
+    """
+    from . import services
+    from .export_cache import get_export_cache
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in services.EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{export_format}'. Use one of: {', '.join(services.EXPORT_FORMATS)}."}), 400
+    inputs = services.get_forecast_export_inputs(current_user)
+    if inputs is None:
+        flash('Financial parameters not found. Please visit Product Detail page first.', 'warning')
+        return redirect(url_for('main.product_detail'))
 
-    return send_file(
-        spreadsheet_file,
-        as_attachment=True,
-        download_name='financial_forecast.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
\ No newline at end of file
+    # The export only depends on its inputs, so their hash is both the
+    # cache key and the ETag.
+    etag = services.forecast_export_key(inputs, export_format)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    if export_format != 'xlsx':
+        # Cheap to render, so these are streamed instead of cached.
+        mimetype, download_name = services.EXPORT_FORMATS[export_format]
+        response = current_app.response_class(services.stream_forecast_export(inputs, export_format), mimetype=mimetype)
+        if download_name:
+            response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+        response.set_etag(etag)
+        return _revalidate_export(response)
+
+    cache = get_export_cache()
+    cached_path = cache.get(etag)
+    if cached_path is None:
+        with services.build_forecast_export(inputs) as spreadsheet_file:
+            cached_path = cache.put(etag, spreadsheet_file)
+    return _send_cached_export(cached_path, etag)
+
+@bp.route("/export-jobs", methods=["POST"])
+@login_required
+@read_only
+def submit_export_job():
+    """Starts a background export. Small or cached exports are ready straight away."""
+    from . import services
+    from .export_cache import get_export_cache
+    from .export_jobs import JOB_DONE, ExportQueueFull, get_export_jobs, job_status
+    inputs = services.get_forecast_export_inputs(current_user)
+    if inputs is None:
+        return jsonify({'error': 'Financial parameters not found.'}), 400
+
+    key = services.forecast_export_key(inputs)
+    if get_export_cache().get(key) is not None:
+        job = get_export_jobs().done_job(current_user.get_id(), key)
+    elif services.forecast_export_rows(inputs) <= current_app.config['EXPORT_SYNC_MAX_ROWS']:
+        # Quick to build: the direct route is faster than a queue round trip.
+        return jsonify({'status': 'done', 'download_url': url_for('main.export_forecast')})
+    else:
+        try:
+            job = get_export_jobs().submit(
+                current_user.get_id(), key, services.build_forecast_export, inputs, current_app.logger
+            )
+        except ExportQueueFull:
+            response = jsonify({'error': 'Too many exports are in progress. Please try again shortly.'})
+            response.status_code = 429
+            response.headers['Retry-After'] = '5'
+            return response
+
+    body = job_status(job)
+    body['status_url'] = url_for('main.export_job_status', job_id=job['id'])
+    body['download_url'] = url_for('main.download_export_job', job_id=job['id'])
+    return jsonify(body), 200 if job['status'] == JOB_DONE else 202
+
+def _get_own_export_job(job_id):
+    from .export_jobs import get_export_jobs
+    job = get_export_jobs().get(job_id)
+    if job is None or job['owner'] != current_user.get_id():
+        return None
+    return job
+
+@bp.route("/export-jobs/<job_id>")
+@login_required
+def export_job_status(job_id):
+    from .export_jobs import JOB_DONE, job_status
+    job = _get_own_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found.'}), 404
+    body = job_status(job)
+    if job['status'] == JOB_DONE:
+        body['download_url'] = url_for('main.download_export_job', job_id=job_id)
+    return jsonify(body)
+
+@bp.route("/export-jobs/<job_id>/download")
+@login_required
+def download_export_job(job_id):
+    from .export_cache import get_export_cache
+    from .export_jobs import JOB_DONE
+    job = _get_own_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found.'}), 404
+    if job['status'] != JOB_DONE:
+        return jsonify({'error': 'The export is not ready yet.', 'status': job['status']}), 409
+    cached_path = get_export_cache().get(job['key'])
+    if cached_path is None:
+        return jsonify({'error': 'The export has expired. Please export again.'}), 410
+    return _send_cached_export(cached_path, job['key'])
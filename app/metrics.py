@@ -0,0 +1,433 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import abort, before_render_template, current_app, g, has_request_context, request, template_rendered
+
+try:
+    import fcntl
+except ImportError:  # No file locks (Windows): files of exited workers are kept as they are.
+    fcntl = None
+
+PREFIX = 'bizstarter_'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COMPONENTS = ('queue', 'db', 'render', 'compute')
+
+# name -> (type, help). Gauges only count processes that are still alive.
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint and status code.'),
+    'http_request_errors_total': ('counter', 'Requests that raised or returned a 5xx status.'),
+    'http_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'http_request_duration_seconds': ('histogram', 'Time from the start of a request to its response.'),
+    'http_request_component_seconds': (
+        'histogram', 'Request time split into queue (admission wait), db, render and compute (the rest).'),
+    'db_queries_total': ('counter', 'SQL statements executed while handling requests.'),
+    'admission_admitted_total': ('counter', 'Requests admitted by tenant admission control.'),
+    'admission_rejected_total': ('counter', 'Requests rejected by tenant admission control, by status code.'),
+    'admission_wait_seconds_total': ('counter', 'Time admitted requests spent waiting for a slot.'),
+    'admission_active': ('gauge', 'Requests holding an admission slot.'),
+    'admission_queued': ('gauge', 'Requests waiting for an admission slot.'),
+    'export_jobs_total': ('counter', 'Background export jobs, by outcome.'),
+    'export_jobs_pending': ('gauge', 'Background export jobs queued or running.'),
+    'export_job_build_seconds_total': ('counter', 'Time spent building background exports.'),
+    'forecast_patches_total': ('counter', 'Forecast patches received.'),
+    'forecast_patch_recomputes_total': ('counter', 'Forecast patch batches applied.'),
+    'fragment_cache_requests_total': ('counter', 'Template fragment and page cache lookups, by result.'),
+    'fragment_cache_evictions_total': ('counter', 'Cached fragments dropped to stay within FRAGMENT_CACHE_SIZE.'),
+    'fragment_cache_invalidations_total': ('counter', 'Cached fragments dropped after writes to their user or tenant.'),
+    'fragment_cache_entries': ('gauge', 'Fragments and pages held in the cache.'),
+    'singleflight_calls_total': (
+        'counter', 'Saves and recalculations, by whether they ran or shared the result of an identical one.'),
+}
+
+
+def _label_str(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms of one process, aggregated across processes.
+
+    Values are kept in memory and written to `<store_dir>/<pid>.json` at most
+    every `flush_interval` seconds, so each gunicorn worker has its own file.
+    `render()` adds up the files of every worker that belongs to the same
+    server (the same parent process) into the Prometheus text format.
+    Counters of workers that have exited still count; their gauges do not.
+    Their files are folded into one `retired-<parent pid>.json` per server,
+    so recycled workers do not pile up. Without a `store_dir` only this
+    process is reported.
+    """
+
+    def __init__(self, store_dir=None, flush_interval=5.0, buckets=DEFAULT_BUCKETS):
+        self.store_dir = store_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._values = {}      # name -> {label string: value}
+        self._histograms = {}  # name -> {label string: [bucket counts..., +Inf count, sum]}
+        self._flushed_at = 0.0
+        self._cleaned_for = None
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def inc(self, name, labels=None, value=1):
+        key = _label_str(labels or {})
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = _label_str(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += seconds
+
+    def snapshot(self):
+        """Returns this process's values, including those reported by the collectors."""
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                values.setdefault(name, {})[_label_str(labels)] = value
+        return {'pid': os.getpid(), 'ppid': os.getppid(), 'buckets': list(self.buckets),
+                'values': values, 'histograms': histograms}
+
+    def maybe_flush(self):
+        if self.store_dir and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes this process's snapshot to the store."""
+        if not self.store_dir:
+            return
+        self._flushed_at = time.monotonic()
+        snapshot = self.snapshot()
+        if self._cleaned_for != snapshot['pid']:
+            self._remove_stale(snapshot['ppid'])
+            self._cleaned_for = snapshot['pid']
+        self._write(os.path.join(self.store_dir, f"{snapshot['pid']}.json"), snapshot)
+
+    @contextmanager
+    def _locked_store(self, exclusive=False):
+        """Holds the store lock: shared to read the files, exclusive to fold them."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.store_dir, 'store.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield  # Released when the file is closed
+
+    def _read_store(self):
+        """Returns (path, snapshot) for every file in the store."""
+        snapshots = []
+        for name in os.listdir(self.store_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.store_dir, name)
+            try:
+                with open(path) as f:
+                    snapshots.append((path, json.load(f)))
+            except (FileNotFoundError, ValueError):
+                continue  # Removed or being replaced meanwhile
+        return snapshots
+
+    def _write(self, path, snapshot):
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def _remove_stale(self, ppid):
+        """Deletes files left by earlier runs of the server: other parents, no longer running."""
+        for path, snapshot in self._read_store():
+            # Retired files have no pid of their own; they go with their server.
+            pid = snapshot['pid'] if snapshot['pid'] is not None else snapshot['ppid']
+            if snapshot['ppid'] != ppid and not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _fold_exited(self, ppid):
+        """Adds the files of this server's exited workers to its retired file and deletes them."""
+        if fcntl is None:
+            return
+        with self._locked_store(exclusive=True):
+            retired_path = os.path.join(self.store_dir, f'retired-{ppid}.json')
+            retired, exited = [], []
+            for path, snapshot in self._read_store():
+                if path == retired_path:
+                    retired.append(snapshot)
+                elif snapshot['ppid'] == ppid and snapshot['pid'] is not None and not _pid_alive(snapshot['pid']):
+                    exited.append((path, snapshot))
+            if not exited:
+                return
+            values, histograms = self._merge(retired + [snapshot for _, snapshot in exited])
+            self._write(retired_path, {'pid': None, 'ppid': ppid, 'buckets': list(self.buckets),
+                                       'values': values, 'histograms': histograms})
+            for path, _ in exited:
+                os.remove(path)
+
+    def _merge(self, snapshots, own_pid=None):
+        """Adds up snapshots; gauges only count for processes still running."""
+        values, histograms = {}, {}
+        for snapshot in snapshots:
+            pid = snapshot['pid']
+            alive = pid == own_pid or (pid is not None and _pid_alive(pid))
+            for name, series in snapshot['values'].items():
+                if METRICS.get(name, ('gauge',))[0] == 'gauge' and not alive:
+                    continue
+                merged = values.setdefault(name, {})
+                for key, value in series.items():
+                    merged[key] = merged.get(key, 0) + value
+            if snapshot['buckets'] != list(self.buckets):
+                continue  # Written with other bucket bounds; cannot be merged
+            for name, series in snapshot['histograms'].items():
+                merged = histograms.setdefault(name, {})
+                for key, counts in series.items():
+                    if key in merged:
+                        merged[key] = [a + b for a, b in zip(merged[key], counts)]
+                    else:
+                        merged[key] = list(counts)
+        return values, histograms
+
+    def collect(self):
+        """Returns the merged values and histograms of every process of this server."""
+        own = self.snapshot()
+        snapshots = [own]
+        if self.store_dir:
+            self.flush()
+            self._fold_exited(own['ppid'])
+            with self._locked_store():
+                snapshots = [snapshot for _, snapshot in self._read_store()
+                             if snapshot['ppid'] == own['ppid'] and snapshot['pid'] != own['pid']]
+            snapshots.append(own)
+        return self._merge(snapshots, own['pid'])
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        values, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            series = histograms.get(name) if kind == 'histogram' else values.get(name)
+            if not series:
+                continue
+            lines.append(f'# HELP {PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+            for key, value in sorted(series.items()):
+                if kind != 'histogram':
+                    lines.append(f'{PREFIX}{name}{{{key}}} {value}' if key else f'{PREFIX}{name} {value}')
+                    continue
+                sep = ',' if key else ''
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_bucket{{{key}{sep}le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{{{key}}} {value[-1]}' if key else f'{PREFIX}{name}_sum {value[-1]}')
+                lines.append(f'{PREFIX}{name}_count{{{key}}} {cumulative}' if key else f'{PREFIX}{name}_count {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+# --- Collectors for the counters kept by other extensions ---
+
+def _collect_admission():
+    from .admission import get_admission_stats
+
+    totals = {'admitted': 0, 'rejected_429': 0, 'rejected_503': 0, 'wait_seconds_total': 0.0, 'active': 0, 'queued': 0}
+    for stats in get_admission_stats().values():
+        for key in totals:
+            totals[key] += stats[key]
+    # Totals only: per-tenant labels would publish tenant keys and grow without bound.
+    return [
+        ('admission_admitted_total', {}, totals['admitted']),
+        ('admission_rejected_total', {'status': '429'}, totals['rejected_429']),
+        ('admission_rejected_total', {'status': '503'}, totals['rejected_503']),
+        ('admission_wait_seconds_total', {}, totals['wait_seconds_total']),
+        ('admission_active', {}, totals['active']),
+        ('admission_queued', {}, totals['queued']),
+    ]
+
+
+def _collect_export_jobs():
+    from .export_jobs import get_export_job_stats
+
+    stats = get_export_job_stats()
+    if not stats:
+        return []
+    return [('export_jobs_total', {'outcome': outcome}, stats[outcome])
+            for outcome in ('submitted', 'completed', 'failed', 'rejected')] + [
+        ('export_jobs_pending', {}, stats['pending']),
+        ('export_job_build_seconds_total', {}, stats['build_seconds_total']),
+    ]
+
+
+def _collect_forecast_patches():
+    coalescer = current_app.extensions.get('forecast_patches')
+    if coalescer is None:
+        return []
+    stats = coalescer.stats()
+    return [('forecast_patches_total', {}, stats['patches']),
+            ('forecast_patch_recomputes_total', {}, stats['recomputes'])]
+
+
+def _collect_fragment_cache():
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        return []
+    stats = cache.stats()
+    return [('fragment_cache_requests_total', {'result': 'hit'}, stats['hits']),
+            ('fragment_cache_requests_total', {'result': 'miss'}, stats['misses']),
+            ('fragment_cache_evictions_total', {}, stats['evictions']),
+            ('fragment_cache_invalidations_total', {}, stats['invalidations']),
+            ('fragment_cache_entries', {}, stats['entries'])]
+
+
+def _collect_singleflight():
+    flight = current_app.extensions.get('singleflight')
+    if flight is None:
+        return []
+    return [('singleflight_calls_total', {'outcome': outcome}, count) for outcome, count in flight.stats().items()]
+
+
+# --- Request timing ---
+
+def _timings():
+    return g.get('metrics_timings') if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_query_started'].pop()
+    timings = _timings()
+    if timings is not None:
+        timings['db'] += elapsed
+        timings['queries'] += 1
+        if 'statements' in timings:  # Only while the request is being profiled
+            timings['statements'].append((elapsed, statement))
+
+
+def _handle_db_error(exception_context):
+    started = exception_context.connection.info.get('metrics_query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def _template_started(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings['render_stack'].append((time.perf_counter(), timings['db']))
+
+
+def _template_rendered(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and timings['render_stack']:
+        started, db_before = timings['render_stack'].pop()
+        if not timings['render_stack']:
+            # Queries run by the template (lazy loads) count as db time only.
+            timings['render'] += time.perf_counter() - started - (timings['db'] - db_before)
+
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+
+def metrics_view():
+    """Serves every worker's metrics in the Prometheus text format."""
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return current_app.response_class(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """
+    Records latency histograms, in-flight and error counts per endpoint and
+    serves them at /metrics. Register before admission control so requests it
+    rejects are counted too.
+    """
+    registry = MetricsRegistry(app.config['METRICS_DIR'] or None, app.config['METRICS_FLUSH_SECONDS'])
+    registry.collectors.extend([_collect_admission, _collect_export_jobs, _collect_forecast_patches,
+                                _collect_fragment_cache, _collect_singleflight])
+    app.extensions['metrics'] = registry
+
+    engine_events = (('before_cursor_execute', _before_cursor_execute),
+                     ('after_cursor_execute', _after_cursor_execute),
+                     ('handle_error', _handle_db_error))
+    for event_name, listener in engine_events:
+        if not sa.event.contains(sa.engine.Engine, event_name, listener):
+            sa.event.listen(sa.engine.Engine, event_name, listener)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        g.metrics_timings = {'db': 0.0, 'render': 0.0, 'queries': 0, 'render_stack': [],
+                             'started': time.perf_counter()}
+        registry.inc('http_requests_in_flight', {'endpoint': g.metrics_endpoint})
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exception=None):
+        timings = g.pop('metrics_timings', None)
+        if timings is None:
+            return
+        endpoint = g.pop('metrics_endpoint')
+        status = g.pop('metrics_status', 500)
+        total = time.perf_counter() - timings['started']
+        queue = g.get('admission_wait', 0.0)
+
+        registry.inc('http_requests_in_flight', {'endpoint': endpoint}, -1)
+        registry.inc('http_requests_total', {'endpoint': endpoint, 'status': status})
+        if exception is not None or status >= 500:
+            registry.inc('http_request_errors_total', {'endpoint': endpoint})
+        registry.inc('db_queries_total', {'endpoint': endpoint}, timings['queries'])
+        registry.observe('http_request_duration_seconds', {'endpoint': endpoint}, total)
+        components = {
+            'queue': queue,
+            'db': timings['db'],
+            'render': timings['render'],
+            'compute': max(0.0, total - queue - timings['db'] - timings['render']),
+        }
+        for component, seconds in components.items():
+            registry.observe('http_request_component_seconds', {'endpoint': endpoint, 'component': component},
+                             seconds)
+        registry.maybe_flush()
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    return registry
@@ -1,6 +1,6 @@
 from app.extensions import db
 from flask_login import UserMixin
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from sqlalchemy import inspect
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 import json
@@ -9,6 +9,11 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
+    # References shared.tenants without a foreign key, since the tenant
+    # directory and the user's shard may be different databases.
+    tenant_id = db.Column(db.Integer, nullable=True, index=True)
+    # 'admin' for the user who registered the tenant, 'member' otherwise.
+    role = db.Column(db.String(20), nullable=False, default='member', server_default='member')
 
     # Relationships
     products: Mapped[list["Product"]] = relationship('Product', backref='user', lazy=True, cascade="all, delete-orphan")
@@ -19,11 +24,27 @@ class User(UserMixin, db.Model):
 
     startup_activities: Mapped[list["BusinessStartupActivity"]] = relationship('BusinessStartupActivity', backref='user', lazy=True, cascade="all, delete-orphan")
 
-    def __init__(self, username: str, password_hash: str):
+    def __init__(self, username: str, password_hash: str, tenant_id: Optional[int] = None, role: str = 'member'):
         self.username = username
         self.password_hash = password_hash
+        self.tenant_id = tenant_id
+        self.role = role
+
+    @property
+    def is_tenant_admin(self) -> bool:
+        return self.role == 'admin'
+
+    def get_id(self):
+        # Flask-Login keeps this in the session and remember-me cookie. Numeric
+        # ids repeat across shards and change when a tenant is moved, while
+        # usernames are unique across all shards. The prefix keeps them apart
+        # from the numeric ids of older sessions, as usernames may be numeric.
+        return f'u:{self.username}'
 
 class Product(db.Model):
+    # Rows are read by user, and matched by (user, description) when saved.
+    __table_args__ = (db.Index('ix_product_user_id_description', 'user_id', 'description'),)
+
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
     price = db.Column(db.Float, nullable=False, default=0.0)
@@ -45,6 +66,8 @@ class Product(db.Model):
         return {c.key: getattr(self, c.key) for c in insp.mapper.column_attrs}
 
 class Expense(db.Model):
+    __table_args__ = (db.Index('ix_expense_user_id_item', 'user_id', 'item'),)
+
     id = db.Column(db.Integer, primary_key=True)
     item = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False, default=0.0)
@@ -64,6 +87,8 @@ class Expense(db.Model):
         return {c.key: getattr(self, c.key) for c in insp.mapper.column_attrs}
 
 class Asset(db.Model):
+    __table_args__ = (db.Index('ix_asset_user_id', 'user_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False, default=0.0)
@@ -81,6 +106,8 @@ class Asset(db.Model):
         return {c.key: getattr(self, c.key) for c in insp.mapper.column_attrs}
 
 class Liability(db.Model):
+    __table_args__ = (db.Index('ix_liability_user_id', 'user_id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False, default=0.0)
@@ -145,6 +172,9 @@ class AssessmentMessage(db.Model):
         self.dscr_status = dscr_status
 
 class BusinessStartupActivity(db.Model):
+    # Listed per user in id order.
+    __table_args__ = (db.Index('ix_business_startup_activity_user_id_id', 'user_id', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     activity = db.Column(db.String(200), nullable=False)
     description = db.Column(db.String(500), nullable=False)
@@ -180,6 +210,9 @@ class Tenant(db.Model):
     plan_type = db.Column(db.String(50))
     is_active = db.Column(db.Boolean, default=True)
     use_multilocations = db.Column(db.Boolean, default=False)
+    shard_id = db.Column(db.String(50), nullable=False, default='default')
+    # Set while the tenant is being moved between shards; writes are refused.
+    shard_locked = db.Column(db.Boolean, nullable=False, default=False)
 
     owners = relationship("TenantOwner", back_populates="tenant")
     locations = relationship("Location", back_populates="tenant", cascade="all, delete-orphan")
@@ -201,7 +234,7 @@ class TenantOwner(db.Model):
 
 class Location(db.Model):
     __tablename__ = 'locations'
-    __table_args__ = {'schema': 'shared'}
+    __table_args__ = (db.Index('ix_locations_tenant_id', 'tenant_id'), {'schema': 'shared'})
 
     id = db.Column(db.Integer, primary_key=True)
     tenant_id = db.Column(db.Integer, db.ForeignKey('shared.tenants.tenant_id'), nullable=False)
@@ -0,0 +1,273 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+import click
+from flask import Blueprint, abort, current_app, g, jsonify, request, send_file
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_ARG = '_profile'
+TOP_FUNCTIONS = 40
+TOP_STATEMENTS = 20
+
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/profiles')
+
+
+# --- Tokens ---
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='request-profile')
+
+
+def issue_profile_token(endpoint=None):
+    """Returns a signed token that profiles one request (to `endpoint`, if given)."""
+    return _serializer().dumps({'id': uuid.uuid4().hex, 'endpoint': endpoint})
+
+
+def load_profile_token(token, max_age=None):
+    """Returns the token's payload, or None if it is forged or older than `max_age` seconds."""
+    try:
+        return _serializer().loads(token, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return None
+
+
+def _profile_path(profile_id, suffix):
+    return os.path.join(current_app.config['PROFILE_DIR'], f'{profile_id}{suffix}')
+
+
+# --- Single request profiles ---
+
+def _top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': f'{filename}:{line}({name})', 'calls': calls,
+                     'own_seconds': own, 'cumulative_seconds': cumulative})
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:limit]
+
+
+def start_request_profile():
+    """Profiles this request if it carries a valid, unused profile token."""
+    token = request.headers.get(TOKEN_HEADER) or request.args.get(TOKEN_ARG)
+    if not token or request.blueprint == 'profiling':
+        return
+    payload = load_profile_token(token, max_age=current_app.config['PROFILE_TOKEN_MAX_AGE'])
+    if payload is None:
+        current_app.logger.warning(f"Ignoring an invalid or expired profile token on {request.endpoint}")
+        return
+    if payload['endpoint'] and payload['endpoint'] != request.endpoint:
+        return
+    if os.path.exists(_profile_path(payload['id'], '.prof')):
+        return  # Tokens profile a single request
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is active in this process
+        current_app.logger.warning(f"Could not profile {request.endpoint}: a profiler is already running")
+        return
+    g.profile = {'id': payload['id'], 'profiler': profiler, 'started': time.perf_counter()}
+    # Filled in by the metrics query hook, see metrics.py.
+    timings = g.get('metrics_timings')
+    if timings is not None:
+        timings['statements'] = []
+
+
+def finish_request_profile(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile['id']
+    return response
+
+
+def save_request_profile(exception=None):
+    """Stops the profiler and stores the pstats dump and a JSON summary."""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profile['profiler'].disable()
+    seconds = time.perf_counter() - profile['started']
+    timings = g.get('metrics_timings') or {}
+    statements = sorted(timings.get('statements', ()), reverse=True)
+
+    summary = {
+        'id': profile['id'],
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': g.get('metrics_status', 500 if exception else None),
+        'created_at': time.time(),
+        'seconds': seconds,
+        'db_seconds': timings.get('db'),
+        'render_seconds': timings.get('render'),
+        'queries': timings.get('queries'),
+        'slowest_statements': [{'seconds': s, 'sql': sql[:1000]} for s, sql in statements[:TOP_STATEMENTS]],
+        'functions': _top_functions(profile['profiler']),
+    }
+    os.makedirs(current_app.config['PROFILE_DIR'], exist_ok=True)
+    profile['profiler'].dump_stats(_profile_path(profile['id'], '.prof'))
+    with open(_profile_path(profile['id'], '.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    current_app.logger.info(f"Profiled {request.endpoint} in {seconds:.3f}s as {profile['id']}")
+
+
+@profiling_bp.route('/<token>')
+def download_profile(token):
+    """The profile taken with `token`: pstats dump, or ?format=json for the summary."""
+    payload = load_profile_token(token)
+    if payload is None:
+        abort(404)
+    as_json = request.args.get('format') == 'json'
+    path = _profile_path(payload['id'], '.json' if as_json else '.prof')
+    if not os.path.exists(path):
+        return jsonify({'error': 'No request has been profiled with this token yet.'}), 404
+    if as_json:
+        return send_file(path, mimetype='application/json')
+    return send_file(path, as_attachment=True, download_name=f"{payload['id']}.prof",
+                     mimetype='application/octet-stream')
+
+
+# --- Continuous sampling ---
+
+class StackSampler:
+    """
+    Samples the Python stacks of threads that are handling a request, `hz`
+    times a second, and keeps the counts in collapsed-stack format (one
+    `endpoint;frame;frame count` line per stack, as read by flamegraph.pl and
+    speedscope). Counts are written to `<out_dir>/continuous-<pid>.collapsed`
+    every `flush_seconds`. Cost is one walk of the active stacks per tick; the
+    sampler does not exist when PROFILE_SAMPLE_HZ is 0.
+    """
+
+    def __init__(self, hz, out_dir, flush_seconds=60):
+        self.interval = 1.0 / hz
+        self.out_dir = out_dir
+        self.flush_seconds = flush_seconds
+        self.counts = Counter()
+        self._requests = {}  # thread ident -> endpoint
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._pid == os.getpid()
+
+    def request_started(self, endpoint):
+        if not self.running:
+            self._start()  # Threads do not survive a fork, so each worker starts its own
+        self._requests[threading.get_ident()] = endpoint or 'unmatched'
+
+    def request_finished(self):
+        self._requests.pop(threading.get_ident(), None)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.counts = Counter()
+            threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+
+    def _run(self):
+        flushed_at = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+            if time.monotonic() - flushed_at >= self.flush_seconds:
+                self.flush()
+                flushed_at = time.monotonic()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, endpoint in list(self._requests.items()):
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                name = f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+                stack.append(name)
+                if name == 'flask.app.wsgi_app':
+                    break  # The server's frames above it are the same for every request
+                frame = frame.f_back
+            if stack:
+                stack.append(endpoint)
+                with self._lock:
+                    self.counts[';'.join(reversed(stack))] += 1
+
+    def flush(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        with self._lock:
+            counts = list(self.counts.items())
+        fd, tmp_path = tempfile.mkstemp(dir=self.out_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            for stack, count in counts:
+                f.write(f'{stack} {count}\n')
+        os.replace(tmp_path, os.path.join(self.out_dir, f'continuous-{os.getpid()}.collapsed'))
+
+
+@profiling_bp.route('/continuous')
+def download_continuous_profile():
+    """Collapsed stacks sampled by every worker; requires an unexpired profile token."""
+    token = request.headers.get(TOKEN_HEADER) or request.args.get(TOKEN_ARG)
+    if not token or load_profile_token(token, max_age=current_app.config['PROFILE_TOKEN_MAX_AGE']) is None:
+        abort(404)
+    sampler = current_app.extensions.get('stack_sampler')
+    if sampler is not None and sampler.running:
+        sampler.flush()
+    counts = Counter()
+    directory = current_app.config['PROFILE_DIR']
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        if name.startswith('continuous-') and name.endswith('.collapsed'):
+            with open(os.path.join(directory, name)) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    counts[stack] += int(count)
+    body = ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+    return current_app.response_class(body, mimetype='text/plain')
+
+
+# --- CLI ---
+
+@click.command('profile-token')
+@click.option('--endpoint', help='Only profile a request to this endpoint, e.g. main.financial_forecast.')
+@with_appcontext
+def profile_token_command(endpoint):
+    """Issues a token that profiles one request."""
+    token = issue_profile_token(endpoint)
+    max_age = current_app.config['PROFILE_TOKEN_MAX_AGE']
+    click.echo(token)
+    click.echo(f"\nValid for {max_age:g}s. Send it as the {TOKEN_HEADER} header or the {TOKEN_ARG} query "
+               f"argument; the profile is then at /profiles/{token} (?format=json for a summary).")
+
+
+def init_profiling(app):
+    """Profiles requests that carry a profile token and, optionally, samples all requests."""
+    app.before_request(start_request_profile)
+    app.after_request(finish_request_profile)
+    app.teardown_request(save_request_profile)
+
+    if app.config['PROFILE_SAMPLE_HZ'] > 0:
+        sampler = StackSampler(app.config['PROFILE_SAMPLE_HZ'], app.config['PROFILE_DIR'],
+                               app.config['PROFILE_SAMPLE_FLUSH_SECONDS'])
+        app.extensions['stack_sampler'] = sampler
+
+        @app.before_request
+        def sample_request_stacks():
+            sampler.request_started(request.endpoint)
+
+        @app.teardown_request
+        def stop_sampling_request(exception=None):
+            sampler.request_finished()
+
+    app.register_blueprint(profiling_bp)
+    app.cli.add_command(profile_token_command)
@@ -3,9 +3,18 @@ from werkzeug.security import generate_password_hash
 from .models import Tenant, TenantOwner, User, Location
 from .database import create_tenant_owner, get_tenant_by_key, get_tenant_owner_by_email
 from .extensions import db
+from .sharding import find_user, on_shard, pick_shard_for_new_tenant
 
 bp = Blueprint('registration', __name__, url_prefix='/register')
 
+
+def _discard_tenant(tenant, owner):
+    """Deletes a tenant whose admin user could not be created, so its key can be registered again."""
+    db.session.delete(owner)
+    db.session.delete(tenant)  # Its locations go with it
+    db.session.commit()
+
+
 @bp.route('/', methods=('GET', 'POST'))
 def register():
     if request.method == 'POST':
@@ -29,6 +38,8 @@ def register():
         
         if get_tenant_owner_by_email(email_address) is not None:
             error = f"Email {email_address} is already registered."
+        elif username and find_user(username)[0] is not None:
+            error = f"Username {username} is already taken."
 
         if error is None:
             try:
@@ -39,7 +50,8 @@ def register():
                     company_name=company_name,
                     industry='', # Add industry if available in the form
                     plan_type='standard', # Or get from form
-                    use_multilocations=use_multilocations
+                    use_multilocations=use_multilocations,
+                    shard_id=pick_shard_for_new_tenant()
                 )
                 db.session.add(tenant)
                 db.session.flush() # Flush to get the tenant_id
@@ -59,10 +71,18 @@ def register():
                     role='admin'
                 )
 
-                # Create a new user
-                user = User(username=username, password_hash=generate_password_hash(password))
-                db.session.add(user)
-                db.session.commit()
+                # Create a new user on the tenant's shard. The tenant is already
+                # committed on the primary, and the two databases cannot commit
+                # together, so the tenant is deleted again if this fails.
+                try:
+                    with on_shard(tenant.shard_id):
+                        user = User(username=username, password_hash=generate_password_hash(password), tenant_id=tenant.tenant_id, role='admin')
+                        db.session.add(user)
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    _discard_tenant(tenant, owner)
+                    raise
                 
                 flash('Registration successful. Please log in.')
                 return redirect(url_for('auth.login'))
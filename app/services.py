@@ -168,3 +168,74 @@ def get_or_recalculate_forecast(user, data=None):
     db.session.commit()
 
     return forecast
+
+def get_forecast_export_inputs(user):
+    """
+    Collects everything the forecast workbook is built from, as plain data.
+
+    The JSON columns are kept as stored strings so the inputs can be hashed
+    without parsing them. Returns None if the user has no financial params yet.
+    """
+    params = user.financial_params
+    if not params:
+        return None
+    return {
+        'products': [p.to_dict() for p in user.products],
+        'operating_expenses': [e.to_dict() for e in user.expenses],
+        'startup_activities': [a.to_dict() for a in user.startup_activities],
+        'cogs_percentage': params.cogs_percentage,
+        'seasonality': params.seasonality,
+        'company_name': params.company_name,
+        'depreciation': params.depreciation,
+        'interest_expense': params.interest_expense,
+        'loan_amount': params.loan_amount,
+        'loan_interest_rate': params.loan_interest_rate,
+        'loan_term': params.loan_term,
+        'loan_monthly_payment': params.loan_monthly_payment,
+        'loan_schedule': params.loan_schedule,
+    }
+
+# format -> (mimetype, download file name); JSON is served inline.
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'financial_forecast.xlsx'),
+    'csv': ('application/zip', 'financial_forecast_csv.zip'),
+    'json': ('application/json', None),
+}
+
+def forecast_export_key(inputs, export_format='xlsx'):
+    """Returns the content hash of the export inputs, used as cache key and ETag."""
+    from .export_cache import EXPORT_LAYOUT_VERSION, export_cache_key
+    return export_cache_key(EXPORT_LAYOUT_VERSION, export_format, inputs)
+
+def forecast_export_rows(inputs):
+    """Estimates the size of the workbook from its longest tables."""
+    schedule_rows = int(inputs['loan_term'] or 0) * 12 if inputs['loan_schedule'] else 0
+    return schedule_rows + len(inputs['startup_activities']) + len(inputs['products'])
+
+def _forecast_export_args(inputs):
+    """Returns the positional arguments of the export builders for `inputs`."""
+    loan_details = {
+        'loan_amount': inputs['loan_amount'],
+        'interest_rate': inputs['loan_interest_rate'],
+        'loan_term': inputs['loan_term'],
+        'monthly_payment': inputs['loan_monthly_payment'],
+        'schedule': json.loads(inputs['loan_schedule']) if inputs['loan_schedule'] else None,
+    }
+    return (
+        inputs['products'], inputs['operating_expenses'], inputs['cogs_percentage'], loan_details,
+        json.loads(inputs['seasonality']), inputs['company_name'],
+        inputs['depreciation'], inputs['interest_expense'], inputs['startup_activities']
+    )
+
+def build_forecast_export(inputs):
+    """Builds the forecast workbook from `get_forecast_export_inputs` data and returns the file."""
+    # openpyxl and its chart modules are only needed here, so keep them off
+    # the import path of every route.
+    from utils.export import create_forecast_spreadsheet
+    return create_forecast_spreadsheet(*_forecast_export_args(inputs))
+
+def stream_forecast_export(inputs, export_format):
+    """Returns a generator of the 'csv' (zipped) or 'json' (columnar) export."""
+    from utils.export_formats import iter_columnar_json, iter_csv_zip
+    render = iter_csv_zip if export_format == 'csv' else iter_columnar_json
+    return render(*_forecast_export_args(inputs))
@@ -0,0 +1,415 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, make_response, request, session
+
+from .db_routing import RoutingSession
+from .extensions import db
+
+DEFAULT_SHARD = 'default'
+SHARD_BIND_PREFIX = 'shard:'
+
+# Reference data that lives only in the directory (primary) database, next to
+# the `shared` schema. Every other table holds tenant data and is sharded.
+GLOBAL_TABLES = {'assessment_message'}
+
+# Tenant data hangs off `user` through user_id; moved in this order.
+USER_CHILD_TABLES = [
+    'financial_params', 'product', 'expense', 'asset', 'liability', 'business_startup_activity'
+]
+
+# Cached tenant_key -> (shard_id, shard_locked) map from shared.tenants.
+_shard_map = {'tenants': {}, 'loaded_at': None}
+_shard_map_lock = threading.Lock()
+
+
+def parse_shard_urls(value):
+    """Parses SHARD_DATABASE_URLS, e.g. 'eu=postgresql://...,us2=postgresql://...'."""
+    shards = {}
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, url = entry.partition('=')
+        name, url = name.strip(), url.strip()
+        if not name or not url or name == DEFAULT_SHARD:
+            raise ValueError(f"Invalid shard entry '{entry}'. Use name=url; '{DEFAULT_SHARD}' is the primary database.")
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://")
+        shards[name] = url
+    return shards
+
+
+def shard_ids():
+    """Returns every shard id, the primary database first."""
+    extra = sorted(key[len(SHARD_BIND_PREFIX):] for key in db.engines if key and key.startswith(SHARD_BIND_PREFIX))
+    return [DEFAULT_SHARD] + extra
+
+
+def has_shards():
+    """True when SHARD_DATABASE_URLS configured any shard besides the primary."""
+    return any(key and key.startswith(SHARD_BIND_PREFIX) for key in db.engines)
+
+
+def shard_engine(shard_id):
+    """Returns the engine holding the data of `shard_id`."""
+    if shard_id == DEFAULT_SHARD:
+        return db.engines[None]
+    try:
+        return db.engines[SHARD_BIND_PREFIX + shard_id]
+    except KeyError:
+        raise ValueError(f"Unknown shard '{shard_id}'. Known shards: {', '.join(shard_ids())}.") from None
+
+
+def table_is_sharded(table):
+    """Tenant data is sharded; the `shared` directory and reference tables are not."""
+    return table.schema != 'shared' and table.name not in GLOBAL_TABLES
+
+
+def current_shard_id(db_session):
+    """Returns the shard the session's tenant data currently routes to."""
+    shard_id = db_session.info.get('shard_id')
+    if shard_id:
+        return shard_id
+    if has_request_context():
+        return g.get('shard_id') or DEFAULT_SHARD
+    return DEFAULT_SHARD
+
+
+@contextmanager
+def on_shard(shard_id):
+    """Routes tenant data of the current session to `shard_id`, e.g. for cross-shard reports."""
+    db_session = db.session()
+    previous = db_session.info.get('shard_id')
+    db_session.info['shard_id'] = shard_id
+    try:
+        yield db_session
+    finally:
+        if previous is None:
+            db_session.info.pop('shard_id', None)
+        else:
+            db_session.info['shard_id'] = previous
+
+
+class TenantLockedError(Exception):
+    """Raised on a write for a tenant that is being moved to another shard."""
+
+
+def _check_tenant_unlocked():
+    if has_request_context() and g.get('shard_locked'):
+        raise TenantLockedError()
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _refuse_locked_flush(db_session, flush_context, instances):
+    if db_session.new or db_session.deleted or any(db_session.is_modified(obj) for obj in db_session.dirty):
+        _check_tenant_unlocked()
+
+
+@sa.event.listens_for(RoutingSession, 'do_orm_execute')
+def _refuse_locked_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _check_tenant_unlocked()
+
+
+def get_tenant_shard(tenant_key):
+    """Returns (shard_id, locked) for a tenant from a map refreshed every SHARD_MAP_TTL seconds."""
+    from .models import Tenant
+
+    now = time.monotonic()
+    loaded_at = _shard_map['loaded_at']
+    if loaded_at is None or now - loaded_at > current_app.config['SHARD_MAP_TTL']:
+        with _shard_map_lock:
+            loaded_at = _shard_map['loaded_at']
+            if loaded_at is None or now - loaded_at > current_app.config['SHARD_MAP_TTL']:
+                rows = db.session.execute(sa.select(Tenant.tenant_key, Tenant.shard_id, Tenant.shard_locked)).all()
+                _shard_map['tenants'] = {key: (shard_id, bool(locked)) for key, shard_id, locked in rows}
+                _shard_map['loaded_at'] = time.monotonic()
+    return _shard_map['tenants'].get(tenant_key, (None, False))
+
+
+def invalidate_shard_map():
+    """Forces the next lookup to reload the tenant to shard map."""
+    with _shard_map_lock:
+        _shard_map['loaded_at'] = None
+
+
+def find_user(username):
+    """Looks a username up on every shard and returns (user, shard_id), or (None, None)."""
+    from .models import User
+
+    for shard_id in shard_ids():
+        with on_shard(shard_id):
+            user = User.query.filter_by(username=username).first()
+        if user is not None:
+            return user, shard_id
+    return None, None
+
+
+def load_session_user(session_user_id):
+    """
+    Loads the user behind a Flask-Login id, 'u:<username>' (see User.get_id),
+    searching other shards if needed. Bare digits are the user ids of older
+    sessions; any other id is not recognised and logs the session out.
+    """
+    from .models import User
+
+    if session_user_id.isdigit():
+        # Safe only while there is a single database, where numeric ids are unique.
+        return None if has_shards() else db.session.get(User, int(session_user_id))
+    if not session_user_id.startswith('u:'):
+        return None
+    username = session_user_id[2:]
+    user = User.query.filter_by(username=username).first()
+    if user is None and has_shards():
+        user, shard_id = find_user(username)
+        if user is not None:
+            g.shard_id = session['shard_id'] = shard_id
+    return user
+
+
+def pick_shard_for_new_tenant():
+    """Places new tenants on NEW_TENANT_SHARD, or on the shard with the fewest tenants."""
+    from .models import Tenant
+
+    configured = current_app.config.get('NEW_TENANT_SHARD')
+    if configured:
+        shard_engine(configured)  # Validate the name
+        return configured
+
+    counts = {shard_id: 0 for shard_id in shard_ids()}
+    rows = db.session.execute(sa.select(Tenant.shard_id, sa.func.count()).group_by(Tenant.shard_id)).all()
+    for shard_id, count in rows:
+        if shard_id in counts:
+            counts[shard_id] = count
+    return min(counts, key=lambda shard_id: (counts[shard_id], shard_id != DEFAULT_SHARD))
+
+
+# --- Moving tenants between shards ---
+
+def _tenant_user_filter(user_table, tenant):
+    # Users created before tenant_id existed are linked by username.
+    return sa.or_(user_table.c.tenant_id == tenant.tenant_id, user_table.c.username == tenant.tenant_key)
+
+
+def _sync_table(source_rows, target_conn, table, id_map, batch_size, remap=None, overrides=None):
+    """
+    Makes `table` on the target match `source_rows`.
+
+    Ids are not portable between shards, so rows are inserted with fresh ids
+    and `id_map` remembers source id -> target id between passes. Foreign keys
+    named in `remap` are translated through the given maps. Returns the counts
+    and the target ids that should be deleted once dependent rows are gone.
+    """
+    remap = remap or {}
+    overrides = overrides or {}
+    columns = [c.name for c in table.columns if c.name != 'id']
+
+    wanted = {}
+    for row in source_rows:
+        values = {name: row[name] for name in columns}
+        for column, mapping in remap.items():
+            values[column] = mapping[values[column]]
+        values.update(overrides)
+        wanted[row['id']] = values
+
+    new_ids = [source_id for source_id in wanted if source_id not in id_map]
+    new_id_set = set(new_ids)
+    for start in range(0, len(new_ids), batch_size):
+        batch = new_ids[start:start + batch_size]
+        result = target_conn.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True),
+            [wanted[source_id] for source_id in batch]
+        )
+        for source_id, (target_id,) in zip(batch, result):
+            id_map[source_id] = target_id
+
+    updated = 0
+    existing = [source_id for source_id in wanted if source_id not in new_id_set]
+    for start in range(0, len(existing), batch_size):
+        batch = existing[start:start + batch_size]
+        target_rows = target_conn.execute(
+            sa.select(table).where(table.c.id.in_([id_map[source_id] for source_id in batch]))
+        ).mappings()
+        current = {row['id']: row for row in target_rows}
+        changes = []
+        for source_id in batch:
+            target_row = current.get(id_map[source_id])
+            values = wanted[source_id]
+            if target_row is None or any(target_row[name] != values[name] for name in columns):
+                changes.append({'target_id': id_map[source_id], **values})
+        if changes:
+            target_conn.execute(
+                table.update().where(table.c.id == sa.bindparam('target_id')),
+                changes
+            )
+            updated += len(changes)
+
+    stale = [source_id for source_id in id_map if source_id not in wanted]
+    stale_target_ids = [id_map.pop(source_id) for source_id in stale]
+    return {'inserted': len(new_ids), 'updated': updated, 'deleted': len(stale_target_ids)}, stale_target_ids
+
+
+def sync_tenant(tenant, source, target, id_maps, batch_size):
+    """Copies one pass of the tenant's rows from the source to the target engine."""
+    tables = db.metadata.tables
+    user_table = tables['user']
+    counts, deletes = {}, []
+
+    with source.connect() as source_conn, target.begin() as target_conn:
+        users = source_conn.execute(
+            sa.select(user_table).where(_tenant_user_filter(user_table, tenant))
+        ).mappings().all()
+        counts['user'], stale = _sync_table(
+            users, target_conn, user_table, id_maps.setdefault('user', {}), batch_size,
+            overrides={'tenant_id': tenant.tenant_id}
+        )
+        deletes.append((user_table, stale))
+
+        user_ids = [row['id'] for row in users]
+        for name in USER_CHILD_TABLES:
+            table = tables[name]
+            rows = []
+            for start in range(0, len(user_ids), batch_size):
+                rows.extend(source_conn.execute(
+                    sa.select(table).where(table.c.user_id.in_(user_ids[start:start + batch_size]))
+                ).mappings().all())
+            counts[name], stale = _sync_table(
+                rows, target_conn, table, id_maps.setdefault(name, {}), batch_size,
+                remap={'user_id': id_maps['user']}
+            )
+            deletes.append((table, stale))
+
+        # Children first, so no row is left pointing at a deleted user.
+        for table, target_ids in reversed(deletes):
+            for start in range(0, len(target_ids), batch_size):
+                target_conn.execute(table.delete().where(table.c.id.in_(target_ids[start:start + batch_size])))
+    return counts
+
+
+def _delete_tenant_rows(tenant, engine, batch_size):
+    tables = db.metadata.tables
+    user_table = tables['user']
+    with engine.begin() as conn:
+        user_ids = conn.execute(sa.select(user_table.c.id).where(_tenant_user_filter(user_table, tenant))).scalars().all()
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            for name in reversed(USER_CHILD_TABLES):
+                conn.execute(tables[name].delete().where(tables[name].c.user_id.in_(batch)))
+            conn.execute(user_table.delete().where(user_table.c.id.in_(batch)))
+    return len(user_ids)
+
+
+def _set_tenant_shard_state(tenant_key, **values):
+    from .models import Tenant
+
+    db.session.execute(sa.update(Tenant).where(Tenant.tenant_key == tenant_key).values(**values))
+    db.session.commit()
+    invalidate_shard_map()
+
+
+def move_tenant(tenant_key, target_shard, batch_size=1000, grace_seconds=None, echo=click.echo):
+    """
+    Moves a tenant's data to another shard while it stays online.
+
+    1. Bulk copy everything while the tenant keeps working on the source.
+    2. Lock the tenant (requests that write get 503, whatever their method;
+       reads continue) and wait for every worker's shard map to notice.
+    3. Copy what changed during step 1, switch the tenant to the target shard,
+       wait again so no worker still routes to the source, then unlock.
+    4. Delete the tenant's rows from the source.
+    """
+    from .models import Tenant
+
+    tenant = Tenant.query.filter_by(tenant_key=tenant_key).first()
+    if tenant is None:
+        raise click.ClickException(f"Tenant '{tenant_key}' not found.")
+    source_shard = tenant.shard_id or DEFAULT_SHARD
+    if source_shard == target_shard:
+        raise click.ClickException(f"Tenant '{tenant_key}' is already on shard '{target_shard}'.")
+    source, target = shard_engine(source_shard), shard_engine(target_shard)
+    if grace_seconds is None:
+        grace_seconds = current_app.config['SHARD_MAP_TTL'] + 1
+    db.session.expunge(tenant)
+
+    id_maps = {}
+    started = time.perf_counter()
+    echo(f"Copying '{tenant_key}' from {source_shard} to {target_shard}...")
+    counts = sync_tenant(tenant, source, target, id_maps, batch_size)
+    echo(f"  bulk copy: {_format_counts(counts)} ({time.perf_counter() - started:.1f}s)")
+
+    _set_tenant_shard_state(tenant_key, shard_locked=True)
+    locked_at = time.perf_counter()
+    try:
+        echo(f"  locked for writes; waiting {grace_seconds:.0f}s for workers to notice...")
+        time.sleep(grace_seconds)
+        counts = sync_tenant(tenant, source, target, id_maps, batch_size)
+        echo(f"  catch-up copy: {_format_counts(counts)}")
+        _set_tenant_shard_state(tenant_key, shard_id=target_shard)
+        echo(f"  switched to {target_shard}; waiting {grace_seconds:.0f}s before unlocking...")
+        time.sleep(grace_seconds)
+    finally:
+        _set_tenant_shard_state(tenant_key, shard_locked=False)
+    echo(f"  writes were blocked for {time.perf_counter() - locked_at:.1f}s")
+
+    deleted_users = _delete_tenant_rows(tenant, source, batch_size)
+    echo(f"Done: removed {deleted_users} users and their data from {source_shard}.")
+
+
+def _format_counts(counts):
+    return ', '.join(
+        f"{name} +{c['inserted']}/~{c['updated']}/-{c['deleted']}" for name, c in counts.items()
+        if c['inserted'] or c['updated'] or c['deleted']
+    ) or 'no changes'
+
+
+@click.command('move-tenant')
+@click.argument('tenant_key')
+@click.argument('target_shard')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per bulk insert, update or delete.')
+@click.option('--grace-seconds', type=float, help='Wait for shard map caches to expire. Defaults to SHARD_MAP_TTL + 1.')
+def move_tenant_command(tenant_key, target_shard, batch_size, grace_seconds):
+    """Move a tenant's data to another shard with a short write freeze."""
+    move_tenant(tenant_key, target_shard, batch_size=batch_size, grace_seconds=grace_seconds)
+
+
+@click.command('list-shards')
+def list_shards_command():
+    """List shards and how many tenants each one holds."""
+    from .models import Tenant
+
+    counts = dict(db.session.execute(sa.select(Tenant.shard_id, sa.func.count()).group_by(Tenant.shard_id)).all())
+    for shard_id in shard_ids():
+        click.echo(f"{shard_id:<20} {counts.get(shard_id, 0):>6} tenants  {shard_engine(shard_id).url.render_as_string()}")
+
+
+def init_sharding(app):
+    """Resolves each request's shard before any tenant data is loaded."""
+
+    @app.before_request
+    def resolve_shard():
+        """Routes the request to the shard of the logged-in user's tenant."""
+        if request.endpoint == 'static':
+            return None
+        locked = False
+        shard_id = None
+        tenant_key = session.get('tenant_key')
+        if tenant_key and has_shards():
+            shard_id, locked = get_tenant_shard(tenant_key)
+        g.shard_id = shard_id or session.get('shard_id') or DEFAULT_SHARD
+        # Checked on every flush and ORM DML statement: GET routes write too.
+        g.shard_locked = locked
+        return None
+
+    @app.errorhandler(TenantLockedError)
+    def tenant_locked(error):
+        db.session.rollback()
+        response = make_response('Your account is being moved. Please try again in a minute.', 503)
+        response.headers['Retry-After'] = str(int(app.config['SHARD_MAP_TTL']) + 1)
+        return response
+
+    app.cli.add_command(move_tenant_command)
+    app.cli.add_command(list_shards_command)
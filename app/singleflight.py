@@ -0,0 +1,263 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from flask_login import current_user
+from werkzeug.http import is_hop_by_hop_header
+
+try:
+    import fcntl
+except ImportError:  # No file locks (Windows): calls are shared within a process only.
+    fcntl = None
+
+# Seconds a finished call's response stays on disk for other workers' identical calls.
+RESULT_TTL = 30
+# Seconds a user's write sequence is kept after their last write; far longer than any call.
+SEQ_TTL = 3600
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'seq')
+
+    def __init__(self, seq):
+        self.done = threading.Event()
+        self.result = None
+        self.seq = seq
+
+
+class SingleFlight:
+    """
+    Runs identical concurrent calls once and hands every caller the result.
+
+    Calls are identical when their keys are. The first caller of a key runs
+    it, and callers of the same key arriving while it runs wait for its
+    result instead of running it again. A call that fails (returns None) is
+    not shared: its followers run the call themselves.
+
+    Calls are writes, so a result is only shared while it is still the
+    latest write of its `scope` (the user). Every execution takes the next
+    number of the scope's sequence, and a caller joins a running call only
+    if no other call of the scope started after it. For the autosaves X, Y,
+    X, the second X runs again rather than being answered with the first X's
+    result, which Y has overwritten.
+
+    With a `lock_dir`, calls are also shared between the processes of one
+    host. The sequence is kept in `<lock_dir>/<scope hash>.seq`. The caller
+    running a key holds an exclusive lock on `<key hash>.lock` and leaves its
+    result and sequence number in `<key hash>.json`. Callers from other
+    processes that waited on the lock use that result if it was written
+    after they arrived and no other call of the scope started before then.
+    """
+
+    def __init__(self, lock_dir=None, wait_timeout=30.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._seqs = {}  # scope -> number of the latest execution, without a lock_dir
+        self._stats = {'executed': 0, 'shared': 0, 'shared_across_workers': 0, 'timeouts': 0}
+        self._pruned_at = 0.0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, scope, key, fn):
+        """
+        Returns fn(), or the result of an identical call of `scope` already
+        running. `fn` returns a JSON-able value, or None when it failed.
+        """
+        arrived = time.time()
+        with self._lock:
+            seen = self._current_seq(scope)
+            call = self._calls.get(key)
+            leader = call is None or call.seq != seen
+            if leader:
+                call = self._calls[key] = _Call(seen)
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.result is not None:
+                    self._count('shared')
+                    return call.result
+            else:
+                self._count('timeouts')
+            return self._execute(scope, key, fn, arrived, seen)
+
+        try:
+            call.result = self._execute(scope, key, fn, arrived, seen, call)
+            return call.result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def _run(self, scope, fn, call):
+        with self._lock:
+            seq = self._next_seq(scope)
+            if call is not None:
+                call.seq = seq
+        self._count('executed')
+        return seq, fn()
+
+    def _execute(self, scope, key, fn, arrived, seen, call=None):
+        if not self.lock_dir:
+            return self._run(scope, fn, call)[1]
+        path = self._path(key)
+        with open(path + '.lock', 'a') as lock_file:
+            if not self._acquire(lock_file):
+                self._count('timeouts')
+                return self._run(scope, fn, call)[1]
+            try:
+                result = self._read_result(path + '.json', arrived, seen)
+                if result is not None:
+                    self._count('shared_across_workers')
+                    return result
+                seq, result = self._run(scope, fn, call)
+                if result is not None:
+                    self._write_result(path + '.json', {'seq': seq, 'result': result})
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, key):
+        return os.path.join(self.lock_dir, hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32])
+
+    def _current_seq(self, scope):
+        if not self.lock_dir:
+            return self._seqs.get(scope, 0)
+        try:
+            with open(self._path(('seq', scope)) + '.seq') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _next_seq(self, scope):
+        if not self.lock_dir:
+            self._seqs[scope] = self._seqs.get(scope, 0) + 1
+            return self._seqs[scope]
+        with open(self._path(('seq', scope)) + '.seq', 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # Released when the file is closed
+            f.seek(0)
+            try:
+                seq = int(f.read() or 0) + 1
+            except ValueError:
+                seq = 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(seq))
+        return seq
+
+    def _acquire(self, lock_file):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.01)
+
+    def _read_result(self, path, arrived, seen):
+        try:
+            if os.path.getmtime(path) < arrived:
+                return None  # Finished before this call arrived
+            with open(path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Another call of the scope started between that one and this one.
+        return stored['result'] if stored.get('seq') == seen else None
+
+    def _write_result(self, path, stored):
+        fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        """
+        Removes results and locks nobody has used for RESULT_TTL seconds, and
+        sequences idle for SEQ_TTL, at most once a minute.
+        """
+        now = time.time()
+        if now - self._pruned_at < 60:
+            return
+        self._pruned_at = now
+        with os.scandir(self.lock_dir) as it:
+            for entry in it:
+                ttl = SEQ_TTL if entry.name.endswith('.seq') else RESULT_TTL
+                try:
+                    if entry.stat().st_mtime < now - ttl:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _request_key():
+    body = hashlib.sha256(request.get_data())
+    body.update(request.query_string)
+    return (current_user.get_id(), request.method, request.path, request.mimetype, body.hexdigest())
+
+
+def _pack(response):
+    if response.is_streamed or response.status_code >= 500:
+        return None
+    # The leader's cookies belong to its session, maybe on another device.
+    headers = [(name, value) for name, value in response.headers.items()
+               if name.lower() != 'set-cookie' and not is_hop_by_hop_header(name)]
+    return {'status': response.status_code, 'headers': headers,
+            'body': base64.b64encode(response.get_data()).decode('ascii'), 'wrote': bool(g.get('db_wrote'))}
+
+
+def singleflight(methods=('POST',)):
+    """
+    Shares one execution of a view between a user's identical concurrent
+    requests (same method, path and body), e.g. double-submits and several
+    open tabs saving at once, unless another write of the user started in
+    between. Only requests with one of `methods` are shared. Apply below
+    @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            flight = current_app.extensions['singleflight']
+            if request.method not in methods or not current_user.is_authenticated:
+                return view(*args, **kwargs)
+            own = []
+
+            def run():
+                own.append(make_response(view(*args, **kwargs)))
+                return _pack(own[0])
+
+            packed = flight.do(current_user.get_id(), _request_key(), run)
+            if own:
+                return own[0]
+            if packed['wrote']:
+                g.db_wrote = True  # Reads of this user stay on the primary, as after their own write
+            return current_app.response_class(base64.b64decode(packed['body']), status=packed['status'],
+                                              headers=packed['headers'])
+        return wrapper
+    return decorator
+
+
+def init_singleflight(app):
+    app.extensions['singleflight'] = SingleFlight(
+        lock_dir=app.config['SINGLEFLIGHT_LOCK_DIR'] or None,
+        wait_timeout=app.config['SINGLEFLIGHT_WAIT_SECONDS'],
+    )
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import click
+import sqlalchemy as sa
+from flask import current_app, has_request_context, request
+from flask.cli import with_appcontext
+
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+# Plan lines that read a whole table: SQLite's "SCAN <table>" without an index, PostgreSQL's "Seq Scan".
+FULL_SCAN = re.compile(r'^\s*SCAN (?!.*\bUSING (COVERING )?INDEX\b)|Seq Scan on', re.MULTILINE)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_NAMED_PARAM = re.compile(r'%\(\w+\)s|:\w+\b')
+_PARAM_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_ROWS = re.compile(r'(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """
+    Returns the statement with literals and placeholders replaced by `?`, lists
+    of placeholders collapsed to `(?...)` and whitespace squeezed, so that the
+    same query with other values (or another IN list length) looks the same.
+    """
+    sql = _STRING.sub('?', statement)
+    sql = _NAMED_PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM_LIST.sub('(?...)', sql)
+    sql = _VALUES_ROWS.sub(r'\1...', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode('utf-8')).hexdigest()[:12]
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describes bind parameters by type only, e.g. `{user_id: int}` or `(int, str) x 40`."""
+    if executemany:
+        rows = list(parameters)
+        return f'{parameter_shape(rows[0]) if rows else "()"} x {len(rows)}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in parameters.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in parameters or ()) + ')'
+
+
+def explain(cursor, dialect_name, statement, parameters):
+    """Returns the database's plan for `statement` as text, or None if it cannot be explained."""
+    prefix = EXPLAIN_PREFIXES.get(dialect_name)
+    if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    # A separate DBAPI cursor, so the result of the statement itself is untouched.
+    explain_cursor = cursor.connection.cursor()
+    # On PostgreSQL a failed statement aborts the whole transaction; the
+    # savepoint confines a failed EXPLAIN to itself.
+    savepoint = dialect_name == 'postgresql'
+    try:
+        if savepoint:
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+        explain_cursor.execute(prefix + statement, parameters)
+        rows = explain_cursor.fetchall()
+        if savepoint:
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    except Exception as e:
+        if savepoint:
+            try:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            except Exception:
+                pass  # No savepoint was set: outside a transaction, nothing was aborted
+        return f'EXPLAIN failed: {e}'
+    finally:
+        explain_cursor.close()
+    if dialect_name == 'sqlite':
+        # (id, parent, notused, detail): indent each step under its parent.
+        depth = {0: -1}
+        lines = []
+        for row_id, parent, _, detail in rows:
+            depth[row_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[row_id] + detail)
+        return '\n'.join(lines)
+    return '\n'.join(row[0] for row in rows)
+
+
+class SlowQueryLog:
+    """
+    Appends statements slower than `threshold` seconds to a JSON Lines file.
+
+    Each entry has the normalized SQL, the shape of its bind parameters, the
+    endpoint and tenant of the request that ran it and its duration. The first
+    time this process sees a statement, the entry also carries its plan, taken
+    with EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on the same connection. A
+    log file that cannot be written is skipped silently.
+    """
+
+    def __init__(self, path, threshold):
+        self.path = path
+        self.threshold = threshold
+        self._explained = set()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError:
+                pass  # Writes are skipped, see _after_cursor_execute
+
+    def attach(self, engine):
+        sa.event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        sa.event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        sa.event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        started = exception_context.connection.info.get('slow_query_started') if exception_context.connection else None
+        if started:
+            started.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['slow_query_started'].pop()
+        if elapsed < self.threshold:
+            return
+        normalized = normalize_sql(statement)
+        key = fingerprint(normalized)
+        entry = {
+            'at': time.time(),
+            'ms': round(elapsed * 1000, 3),
+            'fingerprint': key,
+            'sql': normalized,
+            'params': parameter_shape(parameters, executemany),
+            'endpoint': None,
+            'tenant': None,
+        }
+        if has_request_context():
+            from .admission import current_tenant_key
+
+            entry['endpoint'] = request.endpoint
+            entry['tenant'] = current_tenant_key()
+
+        with self._lock:
+            first = key not in self._explained
+            self._explained.add(key)
+        if first:
+            first_parameters = parameters[0] if executemany else parameters
+            entry['plan'] = explain(cursor, conn.dialect.name, statement, first_parameters)
+
+        line = json.dumps(entry, default=str) + '\n'
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                f.write(line)
+        except OSError:
+            pass  # Read-only or full disk: logging must never fail the query
+
+
+def read_slow_queries(path, since=None):
+    entries = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if since is None or entry['at'] >= since:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def summarize_slow_queries(entries):
+    """Groups log entries by statement, slowest total time first."""
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': Counter(),
+                                  'tenants': set(), 'plan': None})
+    for entry in entries:
+        group = groups[entry['fingerprint']]
+        group['sql'] = entry['sql']
+        group['params'] = entry['params']
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['endpoints'][entry['endpoint'] or '-'] += 1
+        if entry['tenant']:
+            group['tenants'].add(entry['tenant'])
+        if group['plan'] is None and entry.get('plan'):
+            group['plan'] = entry['plan']
+
+    summary = []
+    for key, group in groups.items():
+        summary.append({
+            'fingerprint': key,
+            'sql': group['sql'],
+            'params': group['params'],
+            'count': group['count'],
+            'total_ms': group['total_ms'],
+            'mean_ms': group['total_ms'] / group['count'],
+            'max_ms': group['max_ms'],
+            'endpoints': group['endpoints'].most_common(),
+            'tenants': len(group['tenants']),
+            'plan': group['plan'],
+            'full_scan': bool(group['plan'] and FULL_SCAN.search(group['plan'])),
+        })
+    summary.sort(key=lambda s: s['total_ms'], reverse=True)
+    return summary
+
+
+@click.command('slow-queries')
+@click.option('--limit', default=10, show_default=True, help='Number of statements to list.')
+@click.option('--hours', type=float, help='Only entries from the last HOURS hours.')
+@click.option('--log', 'path', type=click.Path(dir_okay=False), help='Log file (default: SLOW_QUERY_LOG).')
+@click.option('--full-scans', is_flag=True, help='Only statements whose plan reads a whole table.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the summary as JSON.')
+@with_appcontext
+def slow_queries_command(limit, hours, path, full_scans, as_json):
+    """Lists the statements that spent the most time over the slow query threshold."""
+    path = path or current_app.config['SLOW_QUERY_LOG']
+    since = time.time() - hours * 3600 if hours else None
+    summary = summarize_slow_queries(read_slow_queries(path, since))
+    summary = [s for s in summary if s['full_scan'] or not full_scans][:limit]
+    if as_json:
+        click.echo(json.dumps(summary, indent=2))
+        return
+    if not summary:
+        click.echo(f"No slow queries logged in {path}.")
+        return
+    for rank, s in enumerate(summary, 1):
+        endpoints = ', '.join(f'{name} ({count})' for name, count in s['endpoints'][:3])
+        click.echo(f"{rank}. {s['total_ms']:.1f} ms total, {s['count']} calls, mean {s['mean_ms']:.1f} ms, "
+                   f"max {s['max_ms']:.1f} ms, {s['tenants']} tenants{'  [FULL SCAN]' if s['full_scan'] else ''}")
+        click.echo(f"   {s['sql']}")
+        click.echo(f"   params {s['params']}; from {endpoints}")
+        if s['plan']:
+            for line in s['plan'].splitlines():
+                click.echo(f"   | {line}")
+        click.echo('')
+
+
+def init_slow_queries(app):
+    """Logs statements slower than SLOW_QUERY_MS on every engine (primary, replica and shards)."""
+    from .extensions import db
+
+    app.cli.add_command(slow_queries_command)
+    if not app.config['SLOW_QUERY_LOG']:
+        return None
+    log = SlowQueryLog(app.config['SLOW_QUERY_LOG'], app.config['SLOW_QUERY_MS'] / 1000)
+    with app.app_context():
+        for engine in db.engines.values():
+            log.attach(engine)
+    app.extensions['slow_queries'] = log
+    return log
@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+# Runs in a fresh interpreter so that nothing imported by the `flask` CLI
+# itself skews the numbers. The marker lets us pick our result line out of
+# whatever create_app prints to stdout.
+_RESULT_MARKER = 'STARTUP_PROFILE_RESULT '
+_CHILD_SCRIPT = f"""
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+finished = time.perf_counter()
+print({_RESULT_MARKER!r} + json.dumps({{
+    'import_app_seconds': imported - started,
+    'create_app_seconds': finished - imported,
+}}))
+"""
+
+
+def parse_importtime(output):
+    """
+    Parses the stderr of `python -X importtime` into a list of module timings.
+
+    Each entry has the module name, its own import time and the cumulative
+    time including everything it imported, both in microseconds.
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        if not self_us.strip().isdigit():
+            continue  # Header line
+        modules.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+        })
+    return modules
+
+
+def summarize_by_package(modules):
+    """Sums the self import time of every module per top-level package."""
+    totals = {}
+    for m in modules:
+        package = m['module'].split('.')[0]
+        totals[package] = totals.get(package, 0) + m['self_us']
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_startup(project_root):
+    """Imports and builds the app in a child interpreter and returns its timings."""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD_SCRIPT],
+        cwd=project_root, capture_output=True, text=True
+    )
+    wall_seconds = time.perf_counter() - started
+
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith(_RESULT_MARKER):
+            result = json.loads(line[len(_RESULT_MARKER):])
+    if proc.returncode != 0 or result is None:
+        raise click.ClickException(f"Profiling the application factory failed:\n{proc.stderr[-2000:]}")
+
+    modules = parse_importtime(proc.stderr)
+    result.update({
+        'wall_seconds': wall_seconds,
+        'module_count': len(modules),
+        'modules': sorted(modules, key=lambda m: m['cumulative_us'], reverse=True),
+        'packages': summarize_by_package(modules),
+    })
+    return result
+
+
+@click.command('startup-profile')
+@click.option('--limit', default=25, show_default=True, help='Number of modules and packages to list.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full result as JSON.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Append a one-line JSON summary to this file so cold starts can be tracked over time.')
+@click.option('--max-seconds', type=float,
+              help='Exit with an error if importing plus building the app takes longer than this.')
+def startup_profile_command(limit, as_json, output, max_seconds):
+    """Report per-module import time and time spent in create_app."""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = profile_startup(project_root)
+    startup_seconds = result['import_app_seconds'] + result['create_app_seconds']
+
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+    else:
+        click.echo(f"Import 'app':       {result['import_app_seconds'] * 1000:8.1f} ms")
+        click.echo(f"create_app():       {result['create_app_seconds'] * 1000:8.1f} ms")
+        click.echo(f"Interpreter total:  {result['wall_seconds'] * 1000:8.1f} ms ({result['module_count']} modules)")
+
+        click.echo("\nSlowest modules (cumulative):")
+        for m in result['modules'][:limit]:
+            click.echo(f"  {m['cumulative_us'] / 1000:8.1f} ms  {m['self_us'] / 1000:8.1f} ms self  {m['module']}")
+
+        click.echo("\nSlowest packages (self time):")
+        for package, self_us in result['packages'][:limit]:
+            click.echo(f"  {self_us / 1000:8.1f} ms  {package}")
+
+    if output:
+        summary = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'import_app_seconds': result['import_app_seconds'],
+            'create_app_seconds': result['create_app_seconds'],
+            'wall_seconds': result['wall_seconds'],
+            'module_count': result['module_count'],
+            'packages': dict(result['packages'][:limit]),
+        }
+        with open(output, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+    if max_seconds is not None and startup_seconds > max_seconds:
+        raise click.ClickException(
+            f"Startup took {startup_seconds:.3f}s, above the {max_seconds:.3f}s budget."
+        )
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped; gzip still applies.
+    brotli = None
+
+# Fingerprinted URLs never change content, so browsers may keep them for a year.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.txt', '.html', '.map'}
+COMPRESSIBLE_MIMETYPES = {'text/html'}
+
+
+def _compress(data):
+    """Returns {content encoding: compressed bytes} for the encodings available."""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+class AssetManifest:
+    """
+    Content hashes and precompressed variants of every file in the static
+    folder, computed once at startup.
+
+    `url_for('static', filename=...)` gets a `v=<hash>` query argument from
+    the manifest, so a changed file gets a new URL and a fingerprinted URL can
+    be cached forever. Text assets are compressed ahead of time (gzip, and
+    brotli when installed) and kept in memory; the static folder is small.
+    """
+
+    def __init__(self, static_folder, min_size=0):
+        self.static_folder = static_folder
+        self.min_size = min_size
+        self.hashes = {}
+        self.variants = {}
+        self.scan()
+
+    def scan(self):
+        hashes, variants = {}, {}
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                hashes[filename] = hashlib.sha256(data).hexdigest()[:12]
+                if os.path.splitext(name)[1] in COMPRESSIBLE_EXTENSIONS and len(data) >= self.min_size:
+                    variants[filename] = {
+                        encoding: compressed for encoding, compressed in _compress(data).items()
+                        if len(compressed) < len(data)
+                    }
+        self.hashes, self.variants = hashes, variants
+
+    def variant(self, filename, accept_encodings):
+        """Returns (encoding, bytes) of the best precompressed variant the client accepts, or None."""
+        variants = self.variants.get(filename)
+        if not variants:
+            return None
+        for encoding in ('br', 'gzip'):
+            if encoding in variants and accept_encodings[encoding] > 0:
+                return encoding, variants[encoding]
+        return None
+
+
+def static_view(filename):
+    """Serves a static file, precompressed when possible, with immutable caching for fingerprinted URLs."""
+    manifest = current_app.extensions['asset_manifest']
+    fingerprint = manifest.hashes.get(filename)
+    compressed = manifest.variant(filename, request.accept_encodings)
+    if compressed is None:
+        response = send_from_directory(current_app.static_folder, filename)
+    else:
+        encoding, data = compressed
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = current_app.response_class(data, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+        # One ETag per encoding, so caches never mix up the variants.
+        response.set_etag(f'{fingerprint}-{encoding}')
+        response.make_conditional(request)
+    if filename in manifest.variants:
+        response.vary.add('Accept-Encoding')
+    if fingerprint is not None and request.args.get('v') == fingerprint:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def compress_response(response):
+    """
+    Gzips HTML responses of at least COMPRESS_MIN_SIZE bytes for clients that
+    accept it. Streamed, already encoded and non-200 responses are left alone.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE'] or not request.accept_encodings['gzip'] > 0:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_static_assets(app):
+    """Fingerprints static URLs, serves precompressed assets and compresses HTML responses."""
+    manifest = AssetManifest(app.static_folder, min_size=app.config['COMPRESS_MIN_SIZE'])
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            fingerprint = manifest.hashes.get(values.get('filename'))
+            if fingerprint is not None:
+                values['v'] = fingerprint
+
+    app.view_functions['static'] = static_view
+    app.after_request(compress_response)
@@ -0,0 +1,69 @@
+import os
+import time
+from hashlib import sha1
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+
+class SourceBytecodeCache(FileSystemBytecodeCache):
+    """
+    Jinja bytecode on local disk, keyed by template name and source hash.
+
+    Jinja's own key is the template's file path, which differs between the
+    build machine that precompiles the templates and the servers that run
+    them; keying by source lets a precompiled cache be shipped with the app.
+    A changed template gets a new key, and bytecode from another Python
+    version is ignored by Jinja. Where the directory is read-only the cache
+    is only read.
+    """
+
+    def get_bucket(self, environment, name, filename, source):
+        key = sha1(f'{name}\0{source}'.encode('utf-8')).hexdigest()
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass  # Read-only or full disk: the template still renders from memory
+
+
+def compile_templates(app):
+    """Loads every template, compiling those without cached bytecode. Returns (count, seconds)."""
+    started = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names), time.perf_counter() - started
+
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates_command():
+    """Compiles every template into the bytecode cache, e.g. at build time."""
+    cache_dir = current_app.config['TEMPLATE_CACHE_DIR']
+    if not cache_dir:
+        raise click.ClickException('TEMPLATE_CACHE_DIR is empty, so there is no bytecode cache to fill.')
+    before = set(os.listdir(cache_dir))
+    count, seconds = compile_templates(current_app)
+    written = len(set(os.listdir(cache_dir)) - before)
+    click.echo(f"Loaded {count} templates in {seconds * 1000:.0f} ms; wrote {written} new cache files to {cache_dir}.")
+
+
+def init_template_cache(app):
+    """Stores compiled templates in TEMPLATE_CACHE_DIR so new processes skip compiling them."""
+    app.cli.add_command(precompile_templates_command)
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if not cache_dir:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        pass  # Read-only deployments use what was precompiled into it, if anything
+    if os.path.isdir(cache_dir):
+        app.jinja_env.bytecode_cache = SourceBytecodeCache(cache_dir)
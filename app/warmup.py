@@ -0,0 +1,43 @@
+import json
+import os
+import time
+from functools import lru_cache
+
+SEED_FILES = ('startup-activities.json', 'initial_expenses.json', 'initial_liabilities.json',
+              'initial_products.json', 'initial_assets.json')
+SEED_DIR = os.path.join(os.path.dirname(__file__), 'db')
+
+
+@lru_cache(maxsize=None)
+def seed_data(name):
+    """
+    Returns the parsed seed catalog app/db/<name>, read once per process.
+    Callers share the result and must not modify it.
+    """
+    with open(os.path.join(SEED_DIR, name)) as f:
+        return json.load(f)
+
+
+def warm_up(app):
+    """
+    Loads what the first requests would otherwise pay for: the seed catalogs,
+    the assessment messages and every compiled template. Run it where the app
+    is built (the gunicorn master when preloading), so forked workers start
+    with it in memory. Returns the seconds spent per step.
+    """
+    from .main_routes import load_assessment_messages
+    from .template_cache import compile_templates
+
+    timings = {}
+    started = time.perf_counter()
+    for name in SEED_FILES:
+        seed_data(name)
+    timings['seeds'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with app.app_context():
+        load_assessment_messages()
+    timings['assessment_messages'] = time.perf_counter() - started
+
+    _, timings['templates'] = compile_templates(app)
+    return timings
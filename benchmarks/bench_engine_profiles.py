@@ -0,0 +1,85 @@
+"""
+Measures connection checkout latency for each engine profile.
+
+    python -m benchmarks.bench_engine_profiles [--url URL] [--checkouts N]
+
+Without --url the benchmark runs against DATABASE_URL, or a temporary SQLite
+file if that is not set. Each checkout opens a connection from the engine,
+runs `SELECT 1` and returns it, which is what a short request costs in
+connection handling.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.engine_profiles import ENGINE_PROFILES, engine_options
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_profile(profile_name, url, checkouts):
+    """Returns checkout latency statistics, in milliseconds, for one profile."""
+    engine = create_engine(url, **engine_options(profile_name, url))
+    try:
+        # The first connection pays for DNS, TLS and authentication in every
+        # profile; report it separately from steady-state checkouts.
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        first_ms = (time.perf_counter() - started) * 1000
+
+        samples = []
+        for _ in range(checkouts):
+            started = time.perf_counter()
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        engine.dispose()
+
+    return {
+        'profile': profile_name,
+        'checkouts': checkouts,
+        'first_ms': first_ms,
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': _percentile(samples, 50),
+        'p95_ms': _percentile(samples, 95),
+        'max_ms': max(samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--checkouts', type=int, default=200)
+    parser.add_argument('--profiles', nargs='*', default=sorted(ENGINE_PROFILES))
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args(argv)
+
+    url = args.url
+    if not url:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    elif url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://')
+
+    results = [bench_profile(name, url, args.checkouts) for name in args.profiles]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'profile':<12} {'first':>9} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  (ms, {args.checkouts} checkouts)")
+    for r in results:
+        print(f"{r['profile']:<12} {r['first_ms']:9.3f} {r['mean_ms']:9.3f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['max_ms']:9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures time, throughput and peak memory of the forecast export formats.
+
+    python -m benchmarks.bench_export [--years N] [--activities N] [--repeat N] [--formats xlsx csv json]
+
+The input is a synthetic tenant with a handful of products and expenses, a
+loan schedule of --years years (one row per month) and --activities startup
+activities. Peak memory is the Python heap high-water mark reported by
+tracemalloc while one export is rendered.
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+from logic.loan import calculate_loan_schedule
+from utils.export import create_forecast_spreadsheet
+from utils.export_formats import iter_columnar_json, iter_csv_zip
+
+
+def _render_xlsx(inputs):
+    with create_forecast_spreadsheet(**inputs) as output:
+        return len(output.read())
+
+
+def _render_stream(render):
+    def run(inputs):
+        return sum(len(chunk) for chunk in render(**inputs))
+    return run
+
+
+RENDERERS = {
+    'xlsx': _render_xlsx,
+    'csv': _render_stream(iter_csv_zip),
+    'json': _render_stream(iter_columnar_json),
+}
+
+
+def build_inputs(years, activities):
+    """Returns the keyword arguments for `create_forecast_spreadsheet`."""
+    loan = calculate_loan_schedule(250000, 6.5, years)
+    return {
+        'products': [
+            {'description': f'Product {i}', 'price': 19.99 + i, 'sales_volume': 120 * (i + 1), 'sales_volume_unit': 'monthly'}
+            for i in range(8)
+        ],
+        'operating_expenses': [
+            {'item': f'Expense {i}', 'amount': 500.0 + 25 * i, 'frequency': 'monthly' if i % 2 else 'quarterly'}
+            for i in range(20)
+        ],
+        'cogs_percentage': 35.0,
+        'loan_details': {
+            'loan_amount': 250000,
+            'interest_rate': 6.5,
+            'loan_term': years,
+            'monthly_payment': loan['monthly_payment'],
+            'schedule': loan['schedule'],
+        },
+        'seasonality_factors': [1.0, 0.9, 1.1, 1.0, 1.2, 1.3, 1.1, 0.9, 1.0, 1.0, 1.2, 1.4],
+        'company_name': 'Benchmark Startup',
+        'depreciation': 1200.0,
+        'interest_expense': 800.0,
+        'startup_activities': [
+            {'activity': f'Activity {i}', 'description': f'Step {i} of the launch plan, with some notes attached',
+             'weight': 5, 'progress': i % 100}
+            for i in range(activities)
+        ],
+    }
+
+
+def bench_export(inputs, repeat, export_format='xlsx'):
+    """Returns timing (ms), throughput, peak memory (KiB) and output size for one format."""
+    render = RENDERERS[export_format]
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(inputs)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    size = render(inputs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean_ms = statistics.fmean(samples)
+    return {
+        'format': export_format,
+        'repeat': repeat,
+        'mean_ms': mean_ms,
+        'min_ms': min(samples),
+        'exports_per_second': 1000 / mean_ms,
+        'peak_kib': peak / 1024,
+        'size_kib': size / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--activities', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--formats', nargs='*', default=list(RENDERERS), choices=list(RENDERERS))
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args(argv)
+
+    inputs = build_inputs(args.years, args.activities)
+    results = [bench_export(inputs, args.repeat, export_format) for export_format in args.formats]
+
+    if args.json:
+        print(json.dumps({'years': args.years, 'activities': args.activities, 'results': results}, indent=2))
+        return
+    print(f"export: {args.years}-year schedule, {args.activities} activities, {args.repeat} runs")
+    print(f"{'format':<6} {'mean ms':>9} {'min ms':>9} {'exports/s':>10} {'peak KiB':>9} {'size KiB':>9}")
+    for r in results:
+        print(f"{r['format']:<6} {r['mean_ms']:9.1f} {r['min_ms']:9.1f} {r['exports_per_second']:10.1f} "
+              f"{r['peak_kib']:9.0f} {r['size_kib']:9.0f}")
+
+
+if __name__ == '__main__':
+    main()
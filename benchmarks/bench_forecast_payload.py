@@ -0,0 +1,90 @@
+"""
+Compares the plain and columnar encodings of the forecast response.
+
+    python -m benchmarks.bench_forecast_payload [--products N] [--repeat N] [--json]
+
+For each encoding this reports the body size, the gzipped size and the time
+to serialize (and, separately, to serialize and gzip) one full forecast as
+returned by /recalculate-forecast.
+"""
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+from logic.financial_ratios import calculate_key_ratios
+from logic.profitability import calculate_profitability
+from utils.forecast_payload import GZIP_MIN_SIZE, dumps_columnar
+
+
+def build_forecast(products):
+    """Returns a forecast shaped like the /recalculate-forecast response."""
+    forecast = calculate_profitability(
+        products=[{'description': f'Product {i}', 'price': 19.99 + i, 'sales_volume': 120 * (i + 1),
+                   'sales_volume_unit': 'monthly'} for i in range(products)],
+        cogs_percentage=35.0, annual_operating_expenses=48000.0, tax_rate=8.0,
+        seasonality_factors=[1.0, 0.9, 1.1, 1.0, 1.2, 1.3, 1.1, 0.9, 1.0, 1.0, 1.2, 1.4],
+    )
+    annual = forecast['annual']
+    ratios = calculate_key_ratios(
+        net_profit=annual['net_profit'], total_revenue=annual['revenue'], total_assets=120000.0,
+        current_assets=15000.0, current_liabilities=8000.0, total_debt=40000.0,
+        net_operating_income=annual['gross_profit'] - 48000.0, interest_expense=2000.0, depreciation=3000.0,
+    )
+    forecast['annual'].update(ratios)
+    forecast['quarterly'].update(ratios)
+    forecast['version'] = '0123456789abcdef'
+    return forecast
+
+
+ENCODERS = {
+    # What jsonify produces outside debug mode.
+    'json': lambda body: json.dumps(body, separators=(',', ':')).encode('utf-8'),
+    'columnar': dumps_columnar,
+}
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return statistics.fmean(samples)
+
+
+def bench_payload(body, repeat, encoding):
+    """Returns sizes (bytes) and mean serialization times (µs) for one encoding."""
+    encode = ENCODERS[encoding]
+    data = encode(body)
+    return {
+        'encoding': encoding,
+        'bytes': len(data),
+        'gzip_bytes': len(gzip.compress(data, compresslevel=6, mtime=0)),
+        'encode_us': _time(lambda: encode(body), repeat),
+        'encode_gzip_us': _time(lambda: gzip.compress(encode(body), compresslevel=6, mtime=0), repeat),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args(argv)
+
+    body = build_forecast(args.products)
+    results = [bench_payload(body, args.repeat, encoding) for encoding in ENCODERS]
+
+    if args.json:
+        print(json.dumps({'products': args.products, 'results': results}, indent=2))
+        return
+    print(f"forecast payload: {args.products} products, {args.repeat} runs (gzip applies from {GZIP_MIN_SIZE} bytes)")
+    print(f"{'encoding':<9} {'bytes':>7} {'gzip':>7} {'encode µs':>10} {'+gzip µs':>10}")
+    for r in results:
+        print(f"{r['encoding']:<9} {r['bytes']:7d} {r['gzip_bytes']:7d} {r['encode_us']:10.1f} {r['encode_gzip_us']:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Measures the hot per-user queries on a large product table, without and with the user_id indexes.
+
+    python -m benchmarks.bench_indexes [--url URL] [--rows N] [--rows-per-user N] [--queries N] [--json]
+
+Without --url the benchmark builds a temporary SQLite file; pass a scratch
+PostgreSQL database to measure there (its product and user tables are
+dropped and recreated). The product table is filled with --rows rows spread
+over users with --rows-per-user rows each (1,000,000 and 100 by default).
+Each query shape is then timed for --queries random users with the table's
+indexes dropped, the indexes from the models are built and ANALYZEd (the
+build time is reported), and the same lookups are timed again.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+from app.extensions import db
+from app.models import Product, User
+
+BATCH = 10000
+
+QUERIES = {
+    # user.products, loaded lazily by every forecast and export.
+    'products by user': lambda user_id: sa.select(Product).where(Product.user_id == user_id),
+    # save_product_and_expense_data: rows no longer submitted.
+    'stale products': lambda user_id: sa.select(Product).where(
+        Product.user_id == user_id, ~Product.description.in_([f'Product {i}' for i in range(5)])),
+    # One product by (user, description).
+    'product by description': lambda user_id: sa.select(Product).where(
+        Product.user_id == user_id, Product.description == 'Product 3'),
+}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_tables(engine, rows, rows_per_user):
+    tables = [User.__table__, Product.__table__]
+    users = max(1, rows // rows_per_user)
+    db.metadata.drop_all(engine, tables=tables[::-1])
+    db.metadata.create_all(engine, tables=tables)
+    with engine.begin() as conn:
+        for index in Product.__table__.indexes:
+            index.drop(conn)
+        for start in range(0, users, BATCH):
+            conn.execute(sa.insert(User), [{'username': f'bench_{i}', 'password_hash': 'x', 'role': 'member'}
+                                           for i in range(start + 1, min(users, start + BATCH) + 1)])
+        # Interleaved users, as rows arrive from many users over time.
+        for start in range(0, rows, BATCH):
+            conn.execute(sa.insert(Product), [
+                {'user_id': i % users + 1, 'description': f'Product {i // users}', 'price': 9.99,
+                 'sales_volume': 100, 'sales_volume_unit': 'monthly'}
+                for i in range(start, min(rows, start + BATCH))
+            ])
+    return users
+
+
+def time_queries(engine, users, queries, seed=1):
+    """Returns latency statistics, in milliseconds, per query shape."""
+    results = {}
+    with engine.connect() as conn:
+        for name, build in QUERIES.items():
+            rng = random.Random(seed)
+            samples = []
+            for _ in range(queries):
+                statement = build(rng.randint(1, users))
+                started = time.perf_counter()
+                conn.execute(statement).all()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = {'mean_ms': statistics.fmean(samples), 'p50_ms': _percentile(samples, 50),
+                             'p95_ms': _percentile(samples, 95)}
+    return results
+
+
+def create_indexes(engine):
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for index in Product.__table__.indexes:
+            index.create(conn)
+        conn.execute(sa.text('ANALYZE'))
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Scratch database to use (default: a temporary SQLite file).')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--rows-per-user', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200, help='Lookups per query shape and phase.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args(argv)
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_indexes.db')}"
+    engine = sa.create_engine(url)
+    try:
+        started = time.perf_counter()
+        users = build_tables(engine, args.rows, args.rows_per_user)
+        fill_seconds = time.perf_counter() - started
+        # Without indexes every lookup scans the table; fewer samples say as much.
+        before = time_queries(engine, users, max(5, args.queries // 20))
+        index_seconds = create_indexes(engine)
+        after = time_queries(engine, users, args.queries)
+    finally:
+        engine.dispose()
+
+    if args.json:
+        print(json.dumps({'database': engine.dialect.name, 'rows': args.rows, 'users': users,
+                          'fill_seconds': fill_seconds, 'index_seconds': index_seconds,
+                          'without_indexes': before, 'with_indexes': after}, indent=2))
+        return
+    print(f"{engine.dialect.name}: {args.rows:,} products for {users:,} users (filled in {fill_seconds:.1f}s, "
+          f"indexes built in {index_seconds:.1f}s)")
+    print(f"{'query':<24} {'no index p50':>13} {'p95':>9} {'indexed p50':>12} {'p95':>9} {'speedup':>8}")
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        print(f"{name:<24} {b['p50_ms']:10.2f} ms {b['p95_ms']:6.2f} ms {a['p50_ms']:9.3f} ms {a['p95_ms']:6.3f} ms "
+              f"{b['p50_ms'] / a['p50_ms']:7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
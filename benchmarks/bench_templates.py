@@ -0,0 +1,102 @@
+"""
+Measures what a fresh process pays to load its templates, without and with the bytecode cache.
+
+    python -m benchmarks.bench_templates [--runs N] [--json]
+
+Every run starts a new Python process that builds the app, renders
+login.html and loads each other template once, as its first requests would.
+Three setups are compared: no bytecode cache (TEMPLATE_CACHE_DIR empty), an
+empty cache directory (the first process after a deploy without
+`flask precompile-templates`; it compiles and writes the cache) and a
+precompiled cache. The median over --runs processes is reported, in
+milliseconds.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEMPLATES = ('financial-forecast.html', 'loan-calculator.html', 'startup_activities.html', 'intro.html')
+
+
+def measure():
+    """Runs in the child process: prints the first login.html render and first-load times per template."""
+    from flask import render_template
+
+    from app import create_app
+
+    app = create_app()
+    timings = {}
+    # login.html extends base.html, so this loads both.
+    with app.test_request_context('/login'):
+        started = time.perf_counter()
+        render_template('login.html')
+        timings['render login.html'] = (time.perf_counter() - started) * 1000
+    for name in TEMPLATES:
+        started = time.perf_counter()
+        app.jinja_env.get_template(name)
+        timings[name] = (time.perf_counter() - started) * 1000
+    # All templates, as warm_up() and the first requests to every page load them.
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+    timings['all templates'] = sum(timings.values()) + (time.perf_counter() - started) * 1000
+    print(json.dumps(timings))
+
+
+def run_child(env):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_templates', '--child'], cwd=PROJECT_ROOT,
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_mode(mode, runs, workdir):
+    env = dict(os.environ, FLASK_SKIP_DOTENV='1', SECRET_KEY='bench', TEMPLATE_WARMUP='0',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    cache_dir = os.path.join(workdir, 'template_cache')
+    env['TEMPLATE_CACHE_DIR'] = '' if mode == 'no cache' else cache_dir
+    samples = []
+    for _ in range(runs):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if mode == 'precompiled':
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'precompile-templates'], cwd=PROJECT_ROOT,
+                           env=env, check=True, capture_output=True)
+        samples.append(run_child(env))
+    return {name: statistics.median(sample[name] for sample in samples) for name in samples[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per setup.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        measure()
+        return
+
+    workdir = tempfile.mkdtemp()
+    try:
+        results = {mode: run_mode(mode, args.runs, workdir) for mode in ('no cache', 'empty cache', 'precompiled')}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    modes = list(results)
+    print(f"median of {args.runs} fresh processes, ms")
+    print(f"{'first load':<26}" + ''.join(f"{mode:>14}" for mode in modes))
+    for name in results[modes[0]]:
+        print(f"{name:<26}" + ''.join(f"{results[mode][name]:14.1f}" for mode in modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+"""
+End-to-end load test: synthetic tenants and users driving the real routes.
+
+    python -m benchmarks.loadtest [--database-url URL] [--url BASE_URL] [--tenants N] [--users M]
+                                  [--concurrency C] [--duration S] [--seed N] [--sweep WxT,...] [--json FILE]
+
+Without --database-url the app runs against a fresh temporary SQLite file;
+pass a local PostgreSQL URL to test against Postgres. The database is
+seeded with --tenants tenants of --users users each. Their products,
+expenses, assets, liabilities and startup activities are drawn from the
+app/db/*.json seeds, with sizes from a long-tailed distribution so a few
+users carry much more data than the rest.
+
+Without --url the app is served in this process by a threaded development
+server. With --url the load goes to an already running server (for example
+gunicorn started with the same DATABASE_URL). With --sweep 1x4,2x4,... the
+load runs once against gunicorn.conf.py per workers x threads combination,
+and the report recommends the fastest one without errors.
+
+--concurrency virtual users then repeat this scenario for --duration
+seconds, each as a different seeded user:
+
+    login -> save product details -> forecast page -> forecast recalc (PATCH)
+          -> loan calculator POST -> export
+
+The report gives the request count, error count, throughput and
+p50/p95/p99 latency per route.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_DIR = os.path.join(PROJECT_ROOT, 'app', 'db')
+PASSWORD = 'loadtest'
+ROUTES = ('login', 'save_product_details', 'financial_forecast', 'recalculate_forecast', 'loan_calculator', 'export')
+
+
+# --- Data ---
+
+def _load_seed(name):
+    with open(os.path.join(SEED_DIR, name)) as f:
+        return json.load(f)
+
+
+def _size(rng, typical, cap):
+    """A long-tailed item count: usually around `typical`, now and then up to `cap`."""
+    return max(1, min(cap, int(typical * rng.paretovariate(1.5) / 1.5)))
+
+
+def _cycle(rng, seed_items, count):
+    """Returns `count` items cycling through the seed list, numbering repeats so names stay unique."""
+    items = []
+    for i in range(count):
+        item = dict(seed_items[i % len(seed_items)])
+        if i >= len(seed_items):
+            key = 'item' if 'item' in item else 'activity' if 'activity' in item else 'description'
+            item[key] = f'{item[key]} {i // len(seed_items) + 1}'
+        items.append(item)
+    rng.shuffle(items)
+    return items
+
+
+def user_data(rng, seeds):
+    """Returns randomized products, expenses, assets, liabilities and activities for one user."""
+    scale = lambda amount: round(float(amount) * rng.uniform(0.5, 2.0), 2)
+    return {
+        'products': [
+            {'description': f'Product {i + 1}', 'price': round(rng.uniform(5, 500), 2),
+             'sales_volume': rng.randint(10, 2000), 'sales_volume_unit': rng.choice(('monthly', 'quarterly'))}
+            for i in range(_size(rng, 5, 200))
+        ],
+        'expenses': [dict(e, amount=scale(e['amount'])) for e in _cycle(rng, seeds['expenses'], _size(rng, 8, 150))],
+        'assets': [dict(a, amount=scale(a['amount'])) for a in _cycle(rng, seeds['assets'], _size(rng, 3, 60))],
+        'liabilities': [dict(l, amount=scale(l['amount'])) for l in _cycle(rng, seeds['liabilities'], _size(rng, 2, 40))],
+        'activities': [dict(a, progress=str(rng.randint(0, 100)))
+                       for a in _cycle(rng, seeds['activities'], _size(rng, len(seeds['activities']), 500))],
+    }
+
+
+def seed_database(app, tenants, users_per_tenant, rng):
+    """Creates the tables and the synthetic tenants and users. Returns the usernames."""
+    from werkzeug.security import generate_password_hash
+
+    from app.extensions import db
+    from app.models import Asset, BusinessStartupActivity, Expense, FinancialParams, Liability, Product, Tenant, User
+    from app.sharding import on_shard, pick_shard_for_new_tenant, shard_engine, shard_ids
+
+    seeds = {
+        'expenses': _load_seed('initial_expenses.json'),
+        'assets': _load_seed('initial_assets.json'),
+        'liabilities': _load_seed('initial_liabilities.json'),
+        'activities': _load_seed('startup-activities.json'),
+    }
+    # Hashing once keeps seeding fast while logins still pay the real cost.
+    password_hash = generate_password_hash(PASSWORD)
+    usernames = []
+
+    with app.app_context():
+        for shard_id in shard_ids():
+            db.metadata.create_all(shard_engine(shard_id))
+        for t in range(tenants):
+            key = f'loadtest_{t}'
+            tenant = Tenant(tenant_key=key, schema_name=key, company_name=f'Load Test {t}',
+                            plan_type='standard', shard_id=pick_shard_for_new_tenant())
+            db.session.add(tenant)
+            db.session.commit()
+            with on_shard(tenant.shard_id):
+                for u in range(users_per_tenant):
+                    username = f'{key}_user_{u}'
+                    user = User(username=username, password_hash=password_hash, tenant_id=tenant.tenant_id,
+                                role='admin' if u == 0 else 'member')
+                    db.session.add(user)
+                    db.session.flush()
+                    data = user_data(rng, seeds)
+                    params = FinancialParams(user_id=user.id)
+                    params.company_name = tenant.company_name
+                    params.cogs_percentage = round(rng.uniform(20, 60), 1)
+                    db.session.add(params)
+                    db.session.add_all(Product(user_id=user.id, **p) for p in data['products'])
+                    db.session.add_all(Expense(user_id=user.id, **e) for e in data['expenses'])
+                    db.session.add_all(Asset(user_id=user.id, **a) for a in data['assets'])
+                    db.session.add_all(Liability(user_id=user.id, **l) for l in data['liabilities'])
+                    db.session.add_all(BusinessStartupActivity(user_id=user.id, **a) for a in data['activities'])
+                    usernames.append(username)
+                db.session.commit()
+    return usernames
+
+
+# --- Driving ---
+
+class _Client:
+    """A keep-alive HTTP client with a cookie jar that does not follow redirects."""
+
+    def __init__(self, base_url, timeout=60):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._connection = connection_class(parts.netloc, timeout=timeout)
+        self._cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self._cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self._cookies.items())
+        try:
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # The server closed the kept-alive connection; retry once on a new one.
+            self._connection.close()
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+        data = response.read()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self._cookies[name] = morsel.value
+        return response.status, data
+
+    def close(self):
+        self._connection.close()
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+def run_scenario(client, username, rng, recorder):
+    """Runs one pass of the scenario as `username`."""
+    def call(route, method, path, expect, body=None, headers=None):
+        started = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body, headers)
+        except OSError:
+            recorder.record(route, time.perf_counter() - started, False)
+            raise
+        recorder.record(route, time.perf_counter() - started, status in expect)
+        return status, data
+
+    json_headers = {'Content-Type': 'application/json'}
+    form_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    call('login', 'POST', '/login', (302,), urlencode({'username': username, 'password': PASSWORD}), form_headers)
+
+    products = [{'description': f'Product {i + 1}', 'price': round(rng.uniform(5, 500), 2),
+                 'sales_volume': rng.randint(10, 2000), 'sales_volume_unit': 'monthly'} for i in range(rng.randint(1, 10))]
+    expenses = [{'item': f'Expense {i + 1}', 'amount': round(rng.uniform(100, 5000), 2), 'frequency': 'monthly'}
+                for i in range(rng.randint(1, 12))]
+    call('save_product_details', 'POST', '/save-product-details', (200,),
+         json.dumps({'company_name': 'Load Test', 'products': products, 'expenses': expenses}), json_headers)
+
+    status, page = call('financial_forecast', 'GET', '/financial-forecast', (200,))
+    match = re.search(rb'const forecastVersion = "([0-9a-f]+)"', page) if status == 200 else None
+    if match:
+        patch = {'version': match.group(1).decode(),
+                 'changes': {'tax_rate': rng.randint(5, 30), 'depreciation': rng.randint(0, 10000)}}
+        call('recalculate_forecast', 'PATCH', '/recalculate-forecast', (200,), json.dumps(patch), json_headers)
+
+    loan = {'loan_amount': rng.randint(10, 500) * 1000, 'interest_rate': round(rng.uniform(3, 12), 2),
+            'loan_term': rng.choice((5, 10, 15, 20, 30))}
+    call('loan_calculator', 'POST', '/loan-calculator', (302,), urlencode(loan), form_headers)
+    call('export', 'GET', '/export-forecast', (200,))
+
+
+def drive(base_url, usernames, concurrency, duration, rng_seed):
+    """Runs `concurrency` virtual users for `duration` seconds. Returns (recorder, wall seconds)."""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    next_user = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def virtual_user(index):
+        rng = random.Random(rng_seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            with lock:
+                username = usernames[next(next_user) % len(usernames)]
+            client = _Client(base_url)
+            try:
+                run_scenario(client, username, rng, recorder)
+            except OSError:
+                pass
+            finally:
+                client.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - started
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(recorder, wall_seconds):
+    routes = {}
+    for route in ROUTES:
+        samples = recorder.latencies.get(route)
+        if not samples:
+            continue
+        routes[route] = {
+            'requests': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'throughput_rps': len(samples) / wall_seconds,
+            'mean_ms': statistics.fmean(samples) * 1000,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+        }
+    total = sum(r['requests'] for r in routes.values())
+    samples = [s for route in routes for s in recorder.latencies[route]]
+    return {'seconds': wall_seconds, 'requests': total, 'throughput_rps': total / wall_seconds,
+            'errors': sum(r['errors'] for r in routes.values()),
+            'p50_ms': percentile(samples, 50) * 1000 if samples else None,
+            'p95_ms': percentile(samples, 95) * 1000 if samples else None,
+            'routes': routes}
+
+
+# --- Setup ---
+
+def create_loadtest_app(database_url):
+    """Creates the app against `database_url`, ignoring the repository's .env files."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['FLASK_SKIP_DOTENV'] = '1'
+    os.environ.setdefault('SECRET_KEY', 'loadtest')
+    from app import create_app
+    return create_app()
+
+
+def serve_in_background(app):
+    """Serves `app` on a free local port from a daemon thread and returns its base URL."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # No line per request
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(database_url, workers, threads, timeout=60):
+    """Starts gunicorn with gunicorn.conf.py and the given sizes; returns (process, base URL) once it accepts connections."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, FLASK_SKIP_DOTENV='1', WEB_CONCURRENCY=str(workers),
+               GUNICORN_THREADS=str(threads), PORT=str(port))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+                               cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start listening in time')
+
+
+def sweep(database_url, combinations, usernames, concurrency, duration, rng_seed):
+    """Runs the load against gunicorn once per (workers, threads) combination and returns one summary each."""
+    results = []
+    for workers, threads in combinations:
+        process, base_url = start_gunicorn(database_url, workers, threads)
+        try:
+            recorder, wall_seconds = drive(base_url, usernames, concurrency, duration, rng_seed)
+        finally:
+            process.terminate()
+            process.wait()
+        summary = summarize(recorder, wall_seconds)
+        summary.update(workers=workers, threads=threads)
+        results.append(summary)
+    return results
+
+
+def _parse_combinations(value):
+    combinations = []
+    for item in value.split(','):
+        workers, _, threads = item.strip().partition('x')
+        combinations.append((int(workers), int(threads or 1)))
+    return combinations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='Database to seed (default: a temporary SQLite file).')
+    parser.add_argument('--url', help='Drive this running server instead of serving the app in-process.')
+    parser.add_argument('--tenants', type=int, default=5)
+    parser.add_argument('--users', type=int, default=10, help='Users per tenant.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load.')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for data and scenarios.')
+    parser.add_argument('--sweep', metavar='WxT,...', type=_parse_combinations,
+                        help='Compare gunicorn sizes instead, e.g. 1x4,2x4,4x2 (workers x threads).')
+    parser.add_argument('--json', metavar='FILE', help="Write the report as JSON ('-' for stdout).")
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    app = create_loadtest_app(database_url)
+
+    started = time.perf_counter()
+    usernames = seed_database(app, args.tenants, args.users, random.Random(args.seed))
+    seed_seconds = time.perf_counter() - started
+
+    if args.sweep:
+        results = sweep(database_url, args.sweep, usernames, args.concurrency, args.duration, args.seed)
+        _report_sweep(results, args)
+        return
+
+    base_url = args.url or serve_in_background(app)
+    recorder, wall_seconds = drive(base_url, usernames, args.concurrency, args.duration, args.seed)
+    report = summarize(recorder, wall_seconds)
+    report.update(tenants=args.tenants, users=len(usernames), concurrency=args.concurrency,
+                  target=base_url if args.url else 'in-process', database=database_url.split(':', 1)[0])
+
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+        return
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"seeded {len(usernames)} users in {args.tenants} tenants in {seed_seconds:.1f}s; "
+          f"{args.concurrency} virtual users for {wall_seconds:.1f}s against {report['target']}")
+    print(f"{'route':<22} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in report['routes'].items():
+        print(f"{route:<22} {r['requests']:8d} {r['errors']:6d} {r['throughput_rps']:7.1f} "
+              f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f}")
+    print(f"{'total':<22} {report['requests']:8d} {report['errors']:6d} {report['throughput_rps']:7.1f}")
+
+
+
+def _report_sweep(results, args):
+    if args.json:
+        output = json.dumps(results, indent=2)
+        if args.json == '-':
+            print(output)
+            return
+        with open(args.json, 'w') as f:
+            f.write(output)
+    print(f"gunicorn sweep: {args.concurrency} virtual users for {args.duration:g}s per combination")
+    print(f"{'workers x threads':<18} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['workers']:>7} x {r['threads']:<8} {r['throughput_rps']:7.1f} {r['p50_ms'] or 0:8.1f} "
+              f"{r['p95_ms'] or 0:8.1f} {r['errors']:7d}")
+    clean = [r for r in results if not r['errors']] or results
+    best = max(clean, key=lambda r: r['throughput_rps'])
+    print(f"best: WEB_CONCURRENCY={best['workers']} GUNICORN_THREADS={best['threads']} "
+          f"({best['throughput_rps']:.1f} req/s, p95 {best['p95_ms'] or 0:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
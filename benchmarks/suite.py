@@ -0,0 +1,255 @@
+"""
+Benchmark suite for the calculation engines, with a regression gate.
+
+    python -m benchmarks.suite [--filter TEXT] [--repeat N] [--json FILE] [--history FILE]
+                               [--check] [--threshold 0.25] [--save-baseline]
+
+Each case times one call of `calculate_profitability`, `calculate_loan_schedule`,
+`calculate_key_ratios` or `create_forecast_spreadsheet` on small, typical
+and pathological inputs. A case is looped until one sample takes at least
+--min-time seconds and the fastest of --repeat samples is its result, in
+microseconds per call.
+
+Shared and throttled machines drift by tens of percent between runs, so
+every case is also expressed relative to a fixed pure-Python calibration
+loop timed right before it. --save-baseline stores the results in
+benchmarks/baselines.json; --check compares a run's relative times with the
+stored ones and exits with status 1 if any case is more than --threshold
+slower (0.25 = 25%). Baselines still belong to the machine (and Python)
+that recorded them; re-save them after moving CI.
+
+--json writes the full run as JSON and --history appends it as one line to
+a JSON Lines file, for charting results over time.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from logic.financial_ratios import calculate_key_ratios
+from logic.loan import calculate_loan_schedule
+from logic.profitability import calculate_profitability
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# setup() builds the inputs and returns the zero-argument callable to time.
+Case = namedtuple('Case', 'name setup')
+
+SEASONALITY = [1.0, 0.9, 1.1, 1.0, 1.2, 1.3, 1.1, 0.9, 1.0, 1.0, 1.2, 1.4]
+
+
+def _products(n):
+    return [{'description': f'Product {i}', 'price': 19.99 + i, 'sales_volume': 120 * (i + 1),
+             'sales_volume_unit': 'monthly' if i % 3 else 'quarterly'} for i in range(n)]
+
+
+def _profitability(products):
+    def setup():
+        inputs = _products(products)
+        return lambda: calculate_profitability(inputs, 35.0, 48000.0, 8.0, SEASONALITY)
+    return setup
+
+
+def _loan(years, rate=6.5):
+    def setup():
+        return lambda: calculate_loan_schedule(250000, rate, years)
+    return setup
+
+
+def _ratios(**overrides):
+    def setup():
+        kwargs = dict(net_profit=42000.0, total_revenue=310000.0, total_assets=120000.0, current_assets=15000.0,
+                      current_liabilities=8000.0, total_debt=40000.0, net_operating_income=61000.0,
+                      interest_expense=2000.0, depreciation=3000.0)
+        kwargs.update(overrides)
+        return lambda: calculate_key_ratios(**kwargs)
+    return setup
+
+
+def _spreadsheet(years, activities):
+    def setup():
+        # openpyxl is only imported when a spreadsheet case runs.
+        from benchmarks.bench_export import build_inputs
+        from utils.export import create_forecast_spreadsheet
+
+        inputs = build_inputs(years, activities)
+
+        def run():
+            with create_forecast_spreadsheet(**inputs) as output:
+                output.read()
+        return run
+    return setup
+
+
+CASES = [
+    Case('profitability/small', _profitability(1)),
+    Case('profitability/typical', _profitability(8)),
+    Case('profitability/pathological', _profitability(2000)),
+    Case('loan_schedule/1y', _loan(1)),
+    Case('loan_schedule/10y', _loan(10)),
+    Case('loan_schedule/30y', _loan(30)),
+    Case('loan_schedule/40y', _loan(40)),
+    Case('loan_schedule/40y_zero_rate', _loan(40, rate=0.0)),
+    Case('key_ratios/typical', _ratios()),
+    Case('key_ratios/zero_denominators', _ratios(total_revenue=0.0, total_assets=0.0, current_liabilities=0.0,
+                                                 total_debt=0.0, interest_expense=0.0)),
+    Case('spreadsheet/small', _spreadsheet(1, 3)),
+    Case('spreadsheet/typical', _spreadsheet(30, 50)),
+    Case('spreadsheet/pathological', _spreadsheet(40, 5000)),
+]
+
+
+def time_case(fn, repeat, min_time):
+    """Returns (fastest, median) seconds per call and the loops per sample."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops)
+    return min(samples), statistics.median(samples), loops
+
+
+def _calibration():
+    total = 0
+    for i in range(2000):
+        total += i * i
+    return total
+
+
+def run_suite(cases, repeat=5, min_time=0.2):
+    """
+    Times `cases` and returns one result per case. `relative` is the case's
+    time divided by the calibration loop's, timed just before it.
+    """
+    results = []
+    for case in cases:
+        fn = case.setup()
+        calibration, _, _ = time_case(_calibration, repeat, min_time / 4)
+        fastest, median, loops = time_case(fn, repeat, min_time)
+        results.append({'name': case.name, 'min_us': fastest * 1e6, 'median_us': median * 1e6,
+                        'relative': fastest / calibration, 'calibration_us': calibration * 1e6,
+                        'loops': loops, 'repeat': repeat})
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.node(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def find_regressions(results, baselines, threshold):
+    """
+    Returns (name, ratio) for every result whose relative time exceeds its
+    baseline's by more than `threshold`. Cases without a baseline are not
+    gated.
+    """
+    regressions = []
+    for result in results:
+        baseline = baselines.get(result['name'])
+        if baseline is None:
+            continue
+        ratio = result['relative'] / baseline['relative']
+        if ratio > 1 + threshold:
+            regressions.append((result['name'], ratio))
+    return regressions
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'results': {}}
+
+
+def save_baselines(results, path=BASELINE_PATH):
+    baselines = load_baselines(path)
+    baselines['environment'] = environment()
+    baselines['commit'] = _git_commit()
+    baselines['results'].update({
+        r['name']: {'min_us': round(r['min_us'], 3), 'relative': round(r['relative'], 6)} for r in results
+    })
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filter', help='Only run cases whose name contains this text.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per sample.')
+    parser.add_argument('--json', metavar='FILE', help="Write the run as JSON ('-' for stdout).")
+    parser.add_argument('--history', metavar='FILE', help='Append the run to a JSON Lines file.')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file (default: %(default)s).')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline.')
+    parser.add_argument('--check', action='store_true', help='Exit with 1 if a case regressed past --threshold.')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    cases = [c for c in CASES if not args.filter or args.filter in c.name]
+    results = run_suite(cases, args.repeat, args.min_time)
+    baselines = load_baselines(args.baseline)['results']
+
+    run = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': environment(),
+        'results': results,
+    }
+    if args.json == '-':
+        print(json.dumps(run, indent=2))
+    else:
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(run, f, indent=2)
+        print(f"{'case':<32} {'min µs':>12} {'median µs':>12} {'relative':>10} {'vs baseline':>12}")
+        for r in results:
+            baseline = baselines.get(r['name'])
+            change = f"{(r['relative'] / baseline['relative'] - 1) * 100:+.1f}%" if baseline else ''
+            print(f"{r['name']:<32} {r['min_us']:12.1f} {r['median_us']:12.1f} {r['relative']:10.3f} {change:>12}")
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+
+    if args.check:
+        regressions = find_regressions(results, baselines, args.threshold)
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: {ratio:.2f}x its baseline", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Production gunicorn settings:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is built and warmed up once in the master (seed catalogs, assessment
+messages, compiled templates; see app/warmup.py) and forked into the workers,
+which start serving without a cold first request. Each worker drops the
+database connections it inherited and opens its own.
+
+Environment:
+    PORT                          port to listen on (8000)
+    GUNICORN_WORKER_CLASS         gthread (default) or gevent
+    WEB_CONCURRENCY               worker processes (number of CPUs)
+    GUNICORN_THREADS              threads per gthread worker (4)
+    GUNICORN_WORKER_CONNECTIONS   concurrent requests per gevent worker (50)
+    GUNICORN_TIMEOUT              seconds before a silent worker is killed (60)
+    GUNICORN_MAX_REQUESTS         recycle a worker after this many requests (2000, 0 = never)
+    GUNICORN_MAX_MEMORY_GROWTH_MB recycle a worker whose memory grew this much since it started (200, 0 = never)
+
+Pick WEB_CONCURRENCY x GUNICORN_THREADS with the load test, against the
+database the app will really use:
+
+    python -m benchmarks.loadtest --database-url postgresql://... --sweep 1x4,2x4,2x8,4x4
+
+Threads share one connection pool per worker, so workers x threads should
+stay within what the database accepts (see engine_profiles.py).
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 50))
+
+# gevent patches the standard library when a worker starts, which is too late
+# for an app imported in the master; gevent workers build and warm their own.
+preload_app = worker_class != 'gevent'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+max_memory_growth = int(os.environ.get('GUNICORN_MAX_MEMORY_GROWTH_MB', 200)) * 1024 * 1024
+# Checking memory reads /proc; once every this many requests is plenty.
+memory_check_interval = 50
+
+# Worker heartbeats go to shared memory instead of a possibly slow disk.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def _rss_bytes():
+    """Current resident memory of this process, or None where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _warm_up(app, log):
+    from app.warmup import warm_up
+
+    timings = warm_up(app)
+    log.info('Warmed up in %.0f ms (%s)', sum(timings.values()) * 1000,
+             ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in timings.items()))
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_up(server.app.wsgi(), server.log)
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app.extensions import db
+
+    # Connections opened in the master (while warming up) must not be shared
+    # between processes; close=False leaves the master's sockets alone.
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning('psycogreen is not installed; PostgreSQL queries will block the gevent worker')
+        else:
+            patch_psycopg()
+    if not preload_app:
+        _warm_up(worker.wsgi, worker.log)
+    worker.started_rss = _rss_bytes()
+    worker.requests_seen = 0
+
+
+def post_request(worker, req, environ, resp):
+    worker.requests_seen += 1
+    if not max_memory_growth or worker.started_rss is None or worker.requests_seen % memory_check_interval:
+        return
+    growth = _rss_bytes() - worker.started_rss
+    if growth > max_memory_growth:
+        worker.log.warning('Worker %s grew by %d MB; recycling it', worker.pid, growth // (1024 * 1024))
+        # Finishes the requests in flight, then exits; the master starts a fresh worker.
+        worker.alive = False
@@ -37,3 +37,23 @@ def calculate_loan_schedule(principal, annual_interest_rate, loan_term_years):
         "monthly_payment": monthly_payment,
         "schedule": schedule
     }
+
+def aggregate_schedule_by_year(schedule):
+    """
+    Sums an amortization schedule per loan year (months 1-12 are year 1).
+    The remaining balance is the one at the end of each year.
+    """
+    years = []
+    for item in schedule:
+        year = (item["month"] - 1) // 12 + 1
+        if not years or years[-1]["year"] != year:
+            years.append({"year": year, "principal": 0.0, "interest": 0.0, "remaining_balance": 0.0})
+        totals = years[-1]
+        totals["principal"] += item["principal_payment"]
+        totals["interest"] += item["interest_payment"]
+        totals["remaining_balance"] = item["remaining_balance"]
+    return years
+
+def schedule_for_year(schedule, year):
+    """Returns the months of an amortization schedule that fall in loan year `year`."""
+    return schedule[(year - 1) * 12:year * 12]
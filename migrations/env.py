@@ -64,17 +64,29 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
-    connectable = db.get_engine()
-
-    with connectable.connect() as connection:
+    def run_with(connection):
         context.configure(
             connection=connection, target_metadata=target_metadata,
-            process_revision_directives=process_revision_directives
+            process_revision_directives=process_revision_directives,
+            # One transaction per revision, so a revision that builds indexes
+            # CONCURRENTLY (autocommit_block) only commits its own predecessors.
+            transaction_per_migration=True
         )
 
         with context.begin_transaction():
             context.run_migrations()
 
+    # `flask init-db` passes in a connection for each shard.
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        run_with(connection)
+        return
+
+    connectable = db.get_engine()
+
+    with connectable.connect() as connection:
+        run_with(connection)
+
 
 if context.is_offline_mode():
     run_migrations_offline()
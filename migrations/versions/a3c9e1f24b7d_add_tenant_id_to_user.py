@@ -0,0 +1,28 @@
+"""Add tenant_id to user for shard routing
+
+Revision ID: a3c9e1f24b7d
+Revises: 0bb270530b50
+Create Date: 2026-10-19 10:12:41.508221
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e1f24b7d'
+down_revision = '0bb270530b50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # No foreign key: shared.tenants lives in the directory database, while a
+    # user's rows may live on another shard.
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tenant_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('tenant_id')
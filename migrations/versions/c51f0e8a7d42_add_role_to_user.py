@@ -0,0 +1,33 @@
+"""Add role to user for tenant admin features
+
+Revision ID: c51f0e8a7d42
+Revises: a3c9e1f24b7d
+Create Date: 2026-10-19 14:37:05.114902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51f0e8a7d42'
+down_revision = 'a3c9e1f24b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('role', sa.String(length=20), nullable=False, server_default='member'))
+
+    # The first user of each tenant is the one who registered it. Users from
+    # before tenant_id existed each own a tenant of their own.
+    op.execute(
+        'UPDATE "user" SET role = \'admin\' WHERE tenant_id IS NULL OR id IN '
+        '(SELECT MIN(id) FROM "user" WHERE tenant_id IS NOT NULL GROUP BY tenant_id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('role')
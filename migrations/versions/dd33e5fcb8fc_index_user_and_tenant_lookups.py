@@ -0,0 +1,54 @@
+"""Index the user_id and tenant_id columns hot queries filter on
+
+Revision ID: dd33e5fcb8fc
+Revises: c51f0e8a7d42
+Create Date: 2026-10-19 18:02:11.730416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd33e5fcb8fc'
+down_revision = 'c51f0e8a7d42'
+branch_labels = None
+depends_on = None
+
+# (index, table, columns), matched to how the routes query each table.
+INDEXES = [
+    ('ix_product_user_id_description', 'product', ['user_id', 'description']),
+    ('ix_expense_user_id_item', 'expense', ['user_id', 'item']),
+    ('ix_asset_user_id', 'asset', ['user_id']),
+    ('ix_liability_user_id', 'liability', ['user_id']),
+    ('ix_business_startup_activity_user_id_id', 'business_startup_activity', ['user_id', 'id']),
+    ('ix_user_tenant_id', 'user', ['tenant_id']),
+]
+
+
+def _create_indexes(indexes, schema=None):
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY keeps the tables writable while the indexes build; it
+        # cannot run inside the migration's transaction.
+        with op.get_context().autocommit_block():
+            for name, table, columns in indexes:
+                op.create_index(name, table, columns, schema=schema, postgresql_concurrently=True,
+                                if_not_exists=True)
+    else:
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, schema=schema, if_not_exists=True)
+
+
+def upgrade():
+    _create_indexes(INDEXES)
+    # shared.locations is created with the tenant directory, outside these
+    # migrations, so it may not exist yet.
+    if op.get_bind().dialect.name == 'postgresql' and sa.inspect(op.get_bind()).has_table('locations', schema='shared'):
+        _create_indexes([('ix_locations_tenant_id', 'locations', ['tenant_id'])], schema='shared')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS shared.ix_locations_tenant_id')
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
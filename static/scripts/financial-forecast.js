@@ -15,6 +15,34 @@ const parseFormattedNumber = (str) => {
     return parseFloat(str.replace(/,/g, '')) || 0;
 };
 
+// --- Columnar Responses ---
+// Forecast responses are requested in the compact encoding of
+// utils/forecast_payload.py and expanded back to the shape of forecastData.
+const FORECAST_COLUMNAR_MIMETYPE = 'application/vnd.bizstarter.forecast+json';
+
+const decodeForecast = (payload) => {
+    const result = { ...payload };
+    if (payload.monthly) {
+        const columns = Object.keys(payload.monthly);
+        result.monthly = payload.monthly.revenue.map((_, i) => {
+            const month = { month: i + 1 };
+            columns.forEach(column => { month[column] = payload.monthly[column][i]; });
+            return month;
+        });
+    }
+    if (payload.annual && payload.ratios) {
+        result.annual = { ...payload.annual, ...payload.ratios };
+        result.quarterly = { ...payload.quarterly, ...payload.ratios };
+    }
+    return result;
+};
+
+const readForecastResponse = (response) => {
+    if (!response.ok) return Promise.reject(new Error(`HTTP ${response.status}`));
+    const columnar = (response.headers.get('Content-Type') || '').startsWith(FORECAST_COLUMNAR_MIMETYPE);
+    return response.json().then(payload => columnar ? decodeForecast(payload) : payload);
+};
+
 let cashFlowChart;
 let revenueExpenseChart;
 const drawCashFlowChart = () => {
@@ -157,64 +185,131 @@ const initializeForecastPage = () => {
         totalLiabilitiesInput.value = formatNumberInput(totalLiabilities);
     };
 
-    const recalculate = () => {
-        updateTotals(); // Update the total fields before sending data
-
-        const cogs = cogsSlider.value;
-        const expenses = parseFormattedNumber(annualExpensesInput.value);
-        const tax = taxSlider.value;
-        const depreciation = parseFormattedNumber(depreciationInput.value);
-        const interestExpense = parseFormattedNumber(interestExpenseInput.value);
-        const seasonality = Array.from(seasonalityInputs).map(input => parseFloat(input.value) || 0);
-
-        const assetsList = Array.from(document.querySelectorAll('#assets-table-body tr')).map(row => ({
-            description: row.querySelector('.asset-description').value,
-            amount: parseFormattedNumber(row.querySelector('.asset-amount').value)
-        }));
+    // --- Patching ---
+    // Edits are debounced, diffed against what the server last confirmed and
+    // sent as a PATCH holding only the changed fields. One request is in
+    // flight at a time; edits made meanwhile go out together once it returns.
+    const PATCH_DEBOUNCE_MS = 300;
+    let version = forecastVersion;
+    let patchTimer = null;
+    let patchInFlight = false;
+
+    const readTable = (tbodyId, descClass, amountClass) => Array.from(document.querySelectorAll(`#${tbodyId} tr`))
+        .map(row => ({
+            description: row.querySelector(`.${descClass}`).value,
+            amount: parseFormattedNumber(row.querySelector(`.${amountClass}`).value)
+        }))
+        .filter(item => item.description);
+
+    const readInputs = () => ({
+        changes: {
+            cogs_percentage: parseFloat(cogsSlider.value),
+            tax_rate: parseFloat(taxSlider.value),
+            annual_operating_expenses: parseFormattedNumber(annualExpensesInput.value),
+            depreciation: parseFormattedNumber(depreciationInput.value),
+            interest_expense: parseFormattedNumber(interestExpenseInput.value),
+            seasonality: Array.from(seasonalityInputs).map(input => parseFloat(input.value) || 0),
+            current_assets: parseFormattedNumber(totalAssetsInput.value),
+            current_liabilities: parseFormattedNumber(totalLiabilitiesInput.value)
+        },
+        assets: readTable('assets-table-body', 'asset-description', 'asset-amount'),
+        liabilities: readTable('liabilities-table-body', 'liability-description', 'liability-amount')
+    });
+
+    // The inputs as the server last saw them.
+    let confirmed = readInputs();
+
+    const diffInputs = (current) => {
+        const same = (a, b) => JSON.stringify(a) === JSON.stringify(b);
+        const patch = { version: version, changes: {} };
+        Object.entries(current.changes).forEach(([field, value]) => {
+            if (!same(value, confirmed.changes[field])) patch.changes[field] = value;
+        });
+        ['assets', 'liabilities'].forEach(table => {
+            if (!same(current[table], confirmed[table])) patch[table] = current[table];
+        });
+        const empty = !Object.keys(patch.changes).length && !patch.assets && !patch.liabilities;
+        return empty ? null : patch;
+    };
 
-        const liabilitiesList = Array.from(document.querySelectorAll('#liabilities-table-body tr')).map(row => ({
-            description: row.querySelector('.liability-description').value,
-            amount: parseFormattedNumber(row.querySelector('.liability-amount').value)
-        }));
+    const renderTable = (tbodyId, descClass, amountClass, items) => {
+        document.getElementById(tbodyId).innerHTML = '';
+        items.forEach(item => {
+            const row = addRow(tbodyId, descClass, amountClass);
+            row.querySelector(`.${descClass}`).value = item.description;
+            row.querySelector(`.${amountClass}`).value = formatNumberInput(item.amount);
+        });
+    };
 
-        const totalAssets = parseFormattedNumber(totalAssetsInput.value);
-        const totalLiabilities = parseFormattedNumber(totalLiabilitiesInput.value);
+    // Another tab or user changed the inputs: show the server's.
+    const resyncInputs = (inputs) => {
+        cogsSlider.value = inputs.cogs_percentage;
+        taxSlider.value = inputs.tax_rate;
+        cogsValue.textContent = inputs.cogs_percentage;
+        taxValue.textContent = inputs.tax_rate;
+        annualExpensesInput.value = formatNumberInput(inputs.annual_operating_expenses);
+        depreciationInput.value = formatNumberInput(inputs.depreciation);
+        interestExpenseInput.value = formatNumberInput(inputs.interest_expense);
+        seasonalityInputs.forEach((input, i) => { input.value = inputs.seasonality[i]; });
+        renderTable('assets-table-body', 'asset-description', 'asset-amount', inputs.assets);
+        renderTable('liabilities-table-body', 'liability-description', 'liability-amount', inputs.liabilities);
+        updateTotals();
+    };
 
-        cogsValue.textContent = cogs;
-        taxValue.textContent = tax;
+    const applyPatchResult = (result) => {
+        if (result.annual) {
+            forecastData.annual = result.annual;
+            forecastData.quarterly = result.quarterly;
+            forecastData.monthly = result.monthly;
+            drawCashFlowChart();
+            drawRevenueExpenseChart();
+        } else if (result.ratios) {
+            Object.assign(forecastData.annual, result.ratios);
+            Object.assign(forecastData.quarterly, result.ratios);
+        }
+        const selectedView = document.getElementById('annual-view').checked ? 'annual' : 'quarterly';
+        updateDisplay(selectedView);
+    };
+
+    const sendPatch = () => {
+        patchTimer = null;
+        if (patchInFlight) return;
+        const current = readInputs();
+        const patch = diffInputs(current);
+        if (!patch) return;
 
+        patchInFlight = true;
         fetch('/recalculate-forecast', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                cogs_percentage: cogs,
-                annual_operating_expenses: expenses,
-                tax_rate: tax,
-                seasonality: seasonality,
-                assets: assetsList,
-                liabilities: liabilitiesList,
-                depreciation: depreciation,
-                current_assets: totalAssets,
-                current_liabilities: totalLiabilities,
-                interest_expense: interestExpense
-            }),
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json', 'Accept': FORECAST_COLUMNAR_MIMETYPE },
+            body: JSON.stringify(patch),
         })
-            .then(response => response.json())
-            .then(newForecast => {
-                // Update the global forecast data
-                forecastData.annual = newForecast.annual;
-                forecastData.quarterly = newForecast.quarterly;
-                forecastData.monthly = newForecast.monthly;
-
-                // Update the display based on the currently selected view
-                const selectedView = document.getElementById('annual-view').checked ? 'annual' : 'quarterly';
-                updateDisplay(selectedView);
-                drawCashFlowChart(); // Redraw the cash flow chart
-                drawRevenueExpenseChart(); // Redraw the new revenue/expense chart
+            .then(readForecastResponse)
+            .then(result => {
+                version = result.version;
+                if (result.stale) {
+                    resyncInputs(result.inputs);
+                    confirmed = readInputs();
+                } else {
+                    confirmed = current;
+                }
+                applyPatchResult(result);
             })
-            .catch(error => console.error('Error recalculating forecast:', error));
+            .catch(error => console.error('Error recalculating forecast:', error))
+            .finally(() => {
+                patchInFlight = false;
+                // Send whatever was edited while this request was out.
+                if (!patchTimer && diffInputs(readInputs())) sendPatch();
+            });
+    };
+
+    const recalculate = () => {
+        updateTotals(); // Keep the totals current while typing
+        cogsValue.textContent = cogsSlider.value;
+        taxValue.textContent = taxSlider.value;
+
+        clearTimeout(patchTimer);
+        patchTimer = setTimeout(sendPatch, PATCH_DEBOUNCE_MS);
     };
 
     const inputsForRecalculation = [
@@ -263,6 +358,7 @@ const initializeForecastPage = () => {
         newRow.querySelector('.number-input').addEventListener('focusout', (e) => {
             e.target.value = formatNumberInput(e.target.value);
         });
+        return newRow;
     };
 
     setupTableEventListeners('assets-table-body', 'add-asset-btn', 'asset-description', 'asset-amount');
@@ -25,20 +25,79 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // --- Export Results ---
+    // Large exports are built by a background job; the link is polled until the
+    // file is ready. Without JavaScript the link downloads directly.
+    const exportLink = document.getElementById('export-results');
+    const exportStatus = document.getElementById('export-status');
+
+    if (exportLink && exportLink.dataset.exportJobsUrl) {
+        const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+        exportLink.addEventListener('click', async (e) => {
+            e.preventDefault();
+            if (exportLink.classList.contains('disabled')) return;
+            exportLink.classList.add('disabled');
+            try {
+                let response = await fetch(exportLink.dataset.exportJobsUrl, { method: 'POST' });
+                let job = await response.json();
+                if (!response.ok) throw new Error(job.error || 'Export failed.');
+
+                const statusUrl = job.status_url;
+                let delay = 500;
+                while (job.status === 'queued' || job.status === 'running') {
+                    exportStatus.textContent = 'Preparing your export...';
+                    await sleep(delay);
+                    delay = Math.min(delay * 1.5, 3000);
+                    response = await fetch(statusUrl);
+                    job = await response.json();
+                    if (!response.ok) throw new Error(job.error || 'Export failed.');
+                }
+                if (job.status !== 'done') throw new Error(job.error || 'Export failed.');
+
+                exportStatus.textContent = '';
+                window.location.href = job.download_url;
+            } catch (error) {
+                console.error('Export failed:', error);
+                exportStatus.textContent = error.message;
+            } finally {
+                exportLink.classList.remove('disabled');
+            }
+        });
+    }
+
     // --- Charting Logic ---
     const chartContainer = document.getElementById('chart-container');
     if (!chartContainer) return; // Don't run chart logic if there's no chart
 
-    const scheduleData = JSON.parse(chartContainer.dataset.schedule);
+    // The schedule is not part of the page: yearly totals and the months of a
+    // year are fetched from /loan-schedule when needed, once each.
+    const scheduleUrl = chartContainer.dataset.scheduleUrl;
     const loanTermInYears = parseInt(chartContainer.dataset.loanTerm, 10);
 
-    if (!scheduleData || !loanTermInYears) return;
+    if (!scheduleUrl || !loanTermInYears) return;
 
     const ctx = document.getElementById('loanChart').getContext('2d');
     const backButton = document.getElementById('back-to-yearly');
     const chartControls = document.getElementById('chart-controls');
     let loanChart;
 
+    const scheduleCache = new Map();
+    const fetchSchedule = (year) => {
+        const key = year || 'years';
+        if (!scheduleCache.has(key)) {
+            const url = year ? `${scheduleUrl}?year=${year}` : scheduleUrl;
+            scheduleCache.set(key, fetch(url).then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            }).catch(error => {
+                scheduleCache.delete(key);
+                throw error;
+            }));
+        }
+        return scheduleCache.get(key);
+    };
+
     const currencyFormatter = new Intl.NumberFormat('en-US', { style: 'currency', currency: 'USD' });
     const tooltipOptions = { callbacks: { label: (c) => `${c.dataset.label || ''}: ${currencyFormatter.format(c.parsed.y)}` } };
 
@@ -61,16 +120,8 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    function drawYearlyChart() {
+    function drawYearlyChart(yearlyData) {
         if (loanChart) loanChart.destroy();
-        const yearlyAggregates = {};
-        scheduleData.forEach(item => {
-            const year = Math.ceil(item.month / 12);
-            if (!yearlyAggregates[year]) yearlyAggregates[year] = { year: year, principal: 0, interest: 0 };
-            yearlyAggregates[year].principal += item.principal_payment;
-            yearlyAggregates[year].interest += item.interest_payment;
-        });
-        const yearlyData = Object.values(yearlyAggregates);
         loanChart = new Chart(ctx, {
             type: 'bar',
             data: {
@@ -85,9 +136,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 onClick: (event, elements) => {
                     if (elements.length > 0) {
                         const selectedYear = yearlyData[elements[0].index].year;
-                        const monthlyData = scheduleData.filter(item => Math.ceil(item.month / 12) === selectedYear);
-                        drawMonthlyChart(monthlyData, `Monthly Breakdown for Year ${selectedYear}`);
-                        chartControls.style.display = 'block';
+                        fetchSchedule(selectedYear)
+                            .then(data => {
+                                drawMonthlyChart(data.months, `Monthly Breakdown for Year ${selectedYear}`);
+                                chartControls.style.display = 'block';
+                            })
+                            .catch(error => console.error('Error loading loan schedule:', error));
                     }
                 },
                 scales: { x: { stacked: true, title: { display: true, text: 'Year (Click for details)' } }, y: { stacked: true } },
@@ -97,11 +151,17 @@ document.addEventListener('DOMContentLoaded', () => {
         chartControls.style.display = 'none';
     }
 
+    const showYears = () => fetchSchedule()
+        .then(data => drawYearlyChart(data.years))
+        .catch(error => console.error('Error loading loan schedule:', error));
+
     if (loanTermInYears >= 2) {
-        drawYearlyChart();
+        showYears();
     } else {
-        drawMonthlyChart(scheduleData, 'Monthly Loan Payment Schedule');
+        fetchSchedule(1)
+            .then(data => drawMonthlyChart(data.months, 'Monthly Loan Payment Schedule'))
+            .catch(error => console.error('Error loading loan schedule:', error));
     }
 
-    backButton.addEventListener('click', () => drawYearlyChart());
-});
\ No newline at end of file
+    backButton.addEventListener('click', showYears);
+});
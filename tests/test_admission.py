@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from app.admission import AdmissionRejected, TenantAdmission
+
+
+def test_tenant_limit_rejects_with_429():
+    admission = TenantAdmission(max_active=10, tenant_limit=1, max_queue=5, timeout=0.05)
+    admission.acquire('tenant:a')
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission.acquire('tenant:a')
+    assert excinfo.value.status_code == 429
+
+    # Another tenant is unaffected by the first one's backlog.
+    assert admission.acquire('tenant:b') == 0.0
+
+
+def test_saturated_pool_rejects_with_503():
+    admission = TenantAdmission(max_active=1, tenant_limit=5, max_queue=5, timeout=0.05)
+    admission.acquire('tenant:a')
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        admission.acquire('tenant:b')
+    assert excinfo.value.status_code == 503
+    assert admission.stats()['tenant:b']['rejected_503'] == 1
+
+
+def test_full_queue_rejects_immediately():
+    admission = TenantAdmission(max_active=1, tenant_limit=1, max_queue=0, timeout=5)
+    admission.acquire('tenant:a')
+
+    started = time.perf_counter()
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('tenant:a')
+    assert time.perf_counter() - started < 1
+
+
+def test_free_slots_are_shared_round_robin():
+    admission = TenantAdmission(max_active=1, tenant_limit=1, max_queue=10, timeout=5)
+    admission.acquire('holder')
+
+    order = []
+    order_lock = threading.Lock()
+
+    def worker(tenant):
+        admission.acquire(tenant)
+        with order_lock:
+            order.append(tenant)
+        admission.release(tenant)
+
+    # The noisy tenant queues three requests before the quiet one queues its only request.
+    threads = [threading.Thread(target=worker, args=('noisy',)) for _ in range(3)]
+    threads.append(threading.Thread(target=worker, args=('quiet',)))
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+
+    admission.release('holder')
+    for t in threads:
+        t.join(timeout=5)
+
+    assert order[:2] == ['noisy', 'quiet']
+    assert admission.stats()['quiet']['admitted'] == 1
+
+
+def test_anonymous_bucket_has_its_own_limit():
+    admission = TenantAdmission(max_active=10, tenant_limit=1, max_queue=5, timeout=0.05, limits={'anonymous': 3})
+    for _ in range(3):
+        assert admission.acquire('anonymous') == 0.0
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('anonymous')
+    admission.acquire('tenant:a')
+    with pytest.raises(AdmissionRejected):
+        admission.acquire('tenant:a')
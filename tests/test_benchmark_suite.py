@@ -0,0 +1,19 @@
+from benchmarks.suite import CASES, find_regressions, run_suite
+
+
+def test_regressions_are_judged_on_relative_time():
+    baselines = {'a': {'min_us': 10.0, 'relative': 1.0}, 'b': {'min_us': 10.0, 'relative': 1.0}}
+    results = [
+        # Twice as slow in absolute terms, but so was the machine.
+        {'name': 'a', 'min_us': 20.0, 'relative': 1.1},
+        {'name': 'b', 'min_us': 10.0, 'relative': 1.5},
+        {'name': 'new', 'min_us': 99.0, 'relative': 9.0},
+    ]
+    assert find_regressions(results, baselines, threshold=0.25) == [('b', 1.5)]
+
+
+def test_suite_runs():
+    cases = [case for case in CASES if case.name in ('key_ratios/typical', 'loan_schedule/1y')]
+    results = run_suite(cases, repeat=2, min_time=0.001)
+    assert [r['name'] for r in results] == ['loan_schedule/1y', 'key_ratios/typical']
+    assert all(r['min_us'] > 0 and r['relative'] > 0 for r in results)
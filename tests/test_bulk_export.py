@@ -0,0 +1,50 @@
+import zipfile
+
+import pytest
+from flask import Flask
+
+from app.bulk_export import write_tenant_export
+from app.engine_profiles import engine_options
+from app.extensions import db
+from app.models import FinancialParams, Product, Tenant, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_ENGINE_OPTIONS=engine_options('sqlite', url))
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        tenant = Tenant(tenant_key='acme', schema_name='acme')
+        other = Tenant(tenant_key='other', schema_name='other')
+        db.session.add_all([tenant, other])
+        db.session.flush()
+        for i in range(5):
+            user = User(username=f'user {i}', password_hash='x', tenant_id=tenant.tenant_id)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Product(f'Widget {i}', 10.0, 5, 'monthly', user.id))
+            if i != 4:  # the last user has not reached the forecast yet
+                db.session.add(FinancialParams(user_id=user.id))
+        db.session.add(User(username='outsider', password_hash='x', tenant_id=other.tenant_id))
+        db.session.commit()
+    return app
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_tenant_export_zips_one_workbook_per_user(app, tmp_path, workers):
+    progress = []
+    output = tmp_path / 'export.zip'
+    with app.app_context(), open(output, 'wb') as f:
+        tenant = Tenant.query.filter_by(tenant_key='acme').one()
+        counts = write_tenant_export(tenant, f, workers=workers, batch_size=2,
+                                     progress=lambda done, total: progress.append((done, total)))
+
+    assert counts['exported'] == 4 and counts['skipped'] == 1
+    assert progress[-1] == (5, 5) and len(progress) == 5
+    with zipfile.ZipFile(output) as archive:
+        assert sorted(archive.namelist()) == ['user_0.xlsx', 'user_1.xlsx', 'user_2.xlsx', 'user_3.xlsx']
+        assert archive.read('user_0.xlsx')[:2] == b'PK'
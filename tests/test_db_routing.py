@@ -0,0 +1,89 @@
+import pytest
+from flask import Flask, jsonify
+
+from app.db_routing import init_db_routing, mark_replica_unhealthy, read_only, use_replica
+from app.engine_profiles import engine_options
+from app.extensions import db
+from app.models import User
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A minimal app with a primary and a replica, each its own SQLite file."""
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=primary_url,
+        SQLALCHEMY_ENGINE_OPTIONS=engine_options('sqlite', primary_url),
+        SQLALCHEMY_BINDS={'replica': {'url': replica_url, **engine_options('sqlite', replica_url)}},
+        REPLICA_MAX_LAG=5,
+        REPLICA_HEALTH_TTL=60,
+        READ_YOUR_WRITES_SECONDS=5,
+    )
+    db.init_app(app)
+    init_db_routing(app)
+
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica'])
+        # Give each database a different row so the tests can tell them apart.
+        for engine, username in ((db.engine, 'on-primary'), (db.engines['replica'], 'on-replica')):
+            with engine.begin() as conn:
+                conn.execute(User.__table__.insert().values(username=username, password_hash='x'))
+
+    @app.route('/read')
+    @read_only
+    def read():
+        return jsonify([u.username for u in User.query.all()])
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        db.session.add(User(username='new', password_hash='x'))
+        db.session.commit()
+        return jsonify([u.username for u in User.query.all()])
+
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        db.session.remove()
+
+    return app
+
+
+def test_read_only_routes_use_replica(app):
+    client = app.test_client()
+    assert client.get('/read').get_json() == ['on-replica']
+
+
+def test_reads_after_own_write_stick_to_primary(app):
+    client = app.test_client()
+    assert client.post('/write').get_json() == ['on-primary', 'new']
+    # The replica has not seen the write yet, so the next read stays on the primary.
+    assert client.get('/read').get_json() == ['on-primary', 'new']
+    # Other users are not affected by this user's write.
+    assert app.test_client().get('/read').get_json() == ['on-replica']
+
+
+def test_unhealthy_replica_falls_back_to_primary(app):
+    with app.app_context():
+        mark_replica_unhealthy(db.engines['replica'])
+    assert app.test_client().get('/read').get_json() == ['on-primary']
+
+
+def test_failed_replica_read_is_retried_on_the_primary(app):
+    with app.app_context():
+        # Breaks the replica: the table the route reads is gone.
+        with db.engines['replica'].begin() as conn:
+            conn.exec_driver_sql('DROP TABLE user')
+    assert app.test_client().get('/read').get_json() == ['on-primary']
+    # Later reads skip the replica until its next health probe.
+    assert app.test_client().get('/read').get_json() == ['on-primary']
+
+
+def test_use_replica_outside_requests(app):
+    with app.app_context():
+        assert [u.username for u in User.query.all()] == ['on-primary']
+        with use_replica():
+            assert [u.username for u in User.query.all()] == ['on-replica']
+        db.session.remove()
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy.pool import NullPool
+
+from app.engine_profiles import DEFAULT_MAX_CONNECTIONS, default_profile_name, engine_options, max_connections
+
+PSYCOPG2_URL = 'postgresql://app@db/app'
+PSYCOPG_URL = 'postgresql+psycopg://app@db/app'
+
+
+def test_profile_is_picked_from_the_url_and_runtime():
+    assert default_profile_name('sqlite:///app.db', {'VERCEL': '1'}) == 'sqlite'
+    assert default_profile_name(PSYCOPG2_URL, {'VERCEL': '1'}) == 'serverless'
+    assert default_profile_name(PSYCOPG2_URL, {}) == 'pooled'
+
+
+def test_pooled_keeps_a_warm_pre_pinged_pool():
+    options = engine_options('pooled', PSYCOPG2_URL)
+    assert options == {
+        'pool_pre_ping': True,
+        'query_cache_size': 500,
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_recycle': 280,
+        'connect_args': {'connect_timeout': 30},
+    }
+    assert max_connections(options) == 15
+
+
+def test_serverless_opens_a_connection_per_checkout():
+    options = engine_options('serverless', PSYCOPG_URL)
+    assert options['poolclass'] is NullPool
+    assert options['pool_pre_ping'] is False
+    assert 'pool_size' not in options and 'max_overflow' not in options
+    assert options['connect_args'] == {'connect_timeout': 30, 'prepare_threshold': None}
+    assert max_connections(options) == DEFAULT_MAX_CONNECTIONS
+
+
+def test_pgbouncer_uses_a_small_pool_without_prepared_statements():
+    options = engine_options('pgbouncer', PSYCOPG_URL)
+    assert (options['pool_size'], options['max_overflow'], options['pool_pre_ping']) == (2, 3, False)
+    assert options['connect_args']['prepare_threshold'] is None
+    assert max_connections(options) == 5
+
+    # psycopg2 never prepares server-side, so there is nothing to turn off.
+    assert engine_options('pgbouncer', PSYCOPG2_URL)['connect_args'] == {'connect_timeout': 30}
+
+
+def test_sqlite_maps_the_shared_schema_and_skips_pool_sizing():
+    options = engine_options('sqlite', 'sqlite:///app.db')
+    assert options == {
+        'pool_pre_ping': False,
+        'query_cache_size': 500,
+        'execution_options': {'schema_translate_map': {'shared': None}},
+    }
+    assert max_connections(options) == DEFAULT_MAX_CONNECTIONS
+
+
+def test_pool_sizing_is_dropped_for_sqlite_urls_in_any_profile():
+    options = engine_options('pooled', 'sqlite:///app.db')
+    assert 'pool_size' not in options and 'connect_args' not in options
+    assert max_connections(options) == DEFAULT_MAX_CONNECTIONS
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError, match='Unknown engine profile'):
+        engine_options('bogus', PSYCOPG2_URL)
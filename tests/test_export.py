@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+import zipfile
+
+from openpyxl import load_workbook
+
+from benchmarks.bench_export import build_inputs
+from utils.export import CURRENCY_FORMAT, STYLE_CURRENCY, STYLE_HEADER, create_forecast_spreadsheet
+from utils.export_formats import iter_columnar_json, iter_csv_zip
+
+
+def test_forecast_spreadsheet_layout():
+    inputs = build_inputs(years=2, activities=3)
+    wb = load_workbook(create_forecast_spreadsheet(**inputs))
+
+    assert wb.sheetnames == ['Quarterly Revenue', 'Annual P&L Summary', 'Loan Payment Schedule', 'Startup Activities']
+
+    loan = wb['Loan Payment Schedule']
+    assert [str(r) for r in loan.merged_cells.ranges] == ['A1:B1']
+    assert loan.max_row == 7 + 24
+    assert loan['B8'].number_format == CURRENCY_FORMAT
+    assert loan['A7'].font.b
+
+    # Formatting comes from the template's named styles, not per-cell formats.
+    assert loan['A7'].style == STYLE_HEADER
+    assert loan['B8'].style == STYLE_CURRENCY
+
+    # Widths come from the widest value in each column, ignoring the merged title.
+    activities = wb['Startup Activities']
+    longest = max(len(a['description']) for a in inputs['startup_activities'])
+    assert activities.column_dimensions['B'].width == longest + 2
+    assert activities.column_dimensions['A'].width == len('Activity 0') + 2
+
+
+def test_loan_sheet_is_skipped_without_schedule():
+    inputs = build_inputs(years=1, activities=1)
+    inputs['loan_details'] = {'monthly_payment': 0, 'schedule': []}
+    wb = load_workbook(create_forecast_spreadsheet(**inputs))
+    assert 'Loan Payment Schedule' not in wb.sheetnames
+
+
+def test_csv_and_json_match_the_workbook():
+    inputs = build_inputs(years=2, activities=3)
+    pnl = load_workbook(create_forecast_spreadsheet(**inputs))['Annual P&L Summary']
+    net_income = [pnl.cell(row=r, column=10).value for r in range(3, 8)]
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(iter_csv_zip(**inputs, rows_per_chunk=5))))
+    assert archive.namelist() == ['summary.csv', 'revenue.csv', 'pnl.csv', 'loan_schedule.csv', 'startup_activities.csv']
+    rows = list(csv.reader(io.StringIO(archive.read('pnl.csv').decode())))
+    assert [float(r[9]) for r in rows[1:]] == net_income
+    assert len(archive.read('loan_schedule.csv').decode().splitlines()) == 1 + 24
+
+    document = json.loads(''.join(iter_columnar_json(**inputs)))
+    section = document['sections']['pnl']
+    assert section['data'][section['columns'].index('Net Income')] == net_income
+    assert document['summary']['loan_term_years'] == 2
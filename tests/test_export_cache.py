@@ -0,0 +1,32 @@
+import io
+import os
+
+from app.export_cache import ExportCache, export_cache_key
+
+
+def test_key_depends_only_on_content():
+    assert export_cache_key({'a': 1, 'b': [1, 2]}, 'x') == export_cache_key({'b': [1, 2], 'a': 1}, 'x')
+    assert export_cache_key({'a': 1}) != export_cache_key({'a': 2})
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ExportCache(str(tmp_path), max_bytes=25, suffix='.xlsx')
+    for key, mtime in (('old', 1000), ('used', 2000)):
+        os.utime(cache.put(key, io.BytesIO(b'x' * 10)), (mtime, mtime))
+
+    assert cache.get('used') is not None  # bumps 'used' to now
+    cache.put('new', io.BytesIO(b'x' * 10))
+
+    assert cache.get('old') is None
+    assert open(cache.get('used'), 'rb').read() == b'x' * 10
+    assert cache.get('new') is not None
+
+
+def test_entry_larger_than_the_cache_stays_until_the_next_put(tmp_path):
+    cache = ExportCache(str(tmp_path), max_bytes=25, suffix='.zip')
+    cache.put('small', io.BytesIO(b'x' * 10))
+    cache.put('big', io.BytesIO(b'x' * 40))
+
+    assert cache.get('big') is not None and cache.get('small') is None
+    cache.put('next', io.BytesIO(b'x' * 10))
+    assert cache.get('big') is None and cache.get('next') is not None
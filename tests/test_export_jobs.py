@@ -0,0 +1,52 @@
+import io
+import threading
+
+import pytest
+
+from app.export_cache import ExportCache
+from app.export_jobs import JOB_DONE, JOB_FAILED, ExportJobQueue, ExportQueueFull
+
+
+@pytest.fixture
+def queue(tmp_path):
+    cache = ExportCache(str(tmp_path / 'cache'), max_bytes=1024 * 1024, suffix='.xlsx')
+    queue = ExportJobQueue(cache, str(tmp_path / 'jobs'), max_workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_finished_job_lands_in_the_cache(queue):
+    job = queue.submit('alice', 'key1', lambda inputs: io.BytesIO(inputs), b'workbook')
+    queue.shutdown()
+
+    record = queue.get(job['id'])
+    assert record['status'] == JOB_DONE
+    assert record['started_at'] >= record['submitted_at']
+    assert open(queue.cache.get('key1'), 'rb').read() == b'workbook'
+    assert queue.stats()['completed'] == 1
+
+
+def test_failed_build_is_reported(queue):
+    def build(inputs):
+        raise ValueError('broken')
+
+    job = queue.submit('alice', 'key2', build, None)
+    queue.shutdown()
+    assert queue.get(job['id'])['status'] == JOB_FAILED
+    assert queue.cache.get('key2') is None
+    assert queue.stats()['failed'] == 1
+
+
+def test_queue_is_bounded(queue):
+    release = threading.Event()
+
+    def build(inputs):
+        release.wait(5)
+        return io.BytesIO(b'x')
+
+    queue.submit('alice', 'a', build, None)
+    queue.submit('alice', 'b', build, None)
+    with pytest.raises(ExportQueueFull):
+        queue.submit('alice', 'c', build, None)
+    release.set()
+    assert queue.stats()['rejected'] == 1
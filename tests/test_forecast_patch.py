@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from app.forecast_patch import ForecastPatchCoalescer, merge_patches, parse_forecast_patch
+
+
+def test_patch_is_validated_and_merged():
+    first = parse_forecast_patch({'version': 'v1', 'changes': {'tax_rate': '9', 'depreciation': 100},
+                                  'assets': [{'description': 'Cash', 'amount': '1000'}, {'description': ''}]})
+    assert first['changes'] == {'tax_rate': 9.0, 'depreciation': 100.0}
+    assert first['assets'] == [('Cash', 1000.0)]
+    assert first['liabilities'] is None
+
+    second = parse_forecast_patch({'version': 'v1', 'changes': {'tax_rate': 10}})
+    merged = merge_patches([first, second])
+    assert merged['versions'] == {'v1'}
+    assert merged['changes'] == {'tax_rate': 10.0, 'depreciation': 100.0}
+    assert merged['assets'] == [('Cash', 1000.0)]
+
+    for bad in ({'changes': {}}, {'version': 'v1', 'changes': {'user_id': 2}},
+                {'version': 'v1', 'changes': {'seasonality': [1.0] * 11}}):
+        with pytest.raises(ValueError):
+            parse_forecast_patch(bad)
+
+
+def test_burst_of_patches_is_coalesced():
+    coalescer = ForecastPatchCoalescer()
+    release = threading.Event()
+    applied = []
+
+    def apply(merged):
+        release.wait(5)
+        applied.append(merged['changes'])
+        return {'tax_rate': merged['changes'].get('tax_rate')}
+
+    results = []
+    patches = [{'version': 'v1', 'changes': {'tax_rate': float(i)}, 'assets': None, 'liabilities': None}
+               for i in range(5)]
+    threads = [threading.Thread(target=lambda p=p: results.append(coalescer.submit(1, p, apply))) for p in patches]
+    threads[0].start()
+    # The first patch holds the user's lock; the rest pile up behind it.
+    while coalescer.stats()['recomputes'] < 1:
+        pass
+    for n, t in enumerate(threads[1:], 2):
+        t.start()
+        while coalescer.stats()['patches'] < n:
+            pass
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(applied) == 2
+    assert applied[1]['tax_rate'] == 4.0
+    assert results.count({'tax_rate': 4.0}) == 4
+    assert coalescer.stats() == {'patches': 5, 'recomputes': 2}
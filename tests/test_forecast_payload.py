@@ -0,0 +1,24 @@
+import gzip
+import json
+
+from benchmarks.bench_forecast_payload import build_forecast
+from utils.forecast_payload import RATIO_FIELDS, dumps_columnar, encode_columnar, gzip_if_worthwhile
+
+
+def test_columnar_encoding_keeps_every_value_once():
+    forecast = build_forecast(products=3)
+    encoded = encode_columnar(forecast)
+
+    assert encoded['monthly']['net_profit'] == [round(m['net_profit'], 2) for m in forecast['monthly']]
+    assert set(encoded['ratios']) == set(RATIO_FIELDS)
+    assert not set(RATIO_FIELDS) & (set(encoded['annual']) | set(encoded['quarterly']))
+    assert encoded['version'] == forecast['version']
+    assert len(dumps_columnar(forecast)) < len(json.dumps(forecast)) / 2
+
+
+def test_small_or_unaccepted_bodies_are_not_gzipped():
+    data = dumps_columnar(build_forecast(products=3))
+    assert gzip_if_worthwhile(data, accepts_gzip=False) == (data, None)
+    assert gzip_if_worthwhile(b'{}', accepts_gzip=True) == (b'{}', None)
+    compressed, encoding = gzip_if_worthwhile(data, accepts_gzip=True)
+    assert encoding == 'gzip' and gzip.decompress(compressed) == data
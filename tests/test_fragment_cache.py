@@ -0,0 +1,40 @@
+from jinja2 import DictLoader, Environment
+
+from app.fragment_cache import FragmentCache, FragmentCacheExtension
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = FragmentCache(max_entries=2)
+    cache.set(('a',), 1)
+    cache.set(('b',), 2)
+    assert cache.get(('a',)) == 1
+    cache.set(('c',), 3)
+    assert cache.get(('b',)) is None and cache.get(('a',)) == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_drops_entries_carrying_a_key_part():
+    cache = FragmentCache()
+    cache.set(('fragment', 'sidebar', 'user:alice', 'tenant:1'), 'x')
+    cache.set(('page', 'intro.html', 'user:bob', 'tenant:2'), 'y')
+    cache.invalidate('tenant:1')
+    assert cache.get(('fragment', 'sidebar', 'user:alice', 'tenant:1')) is None
+    assert cache.get(('page', 'intro.html', 'user:bob', 'tenant:2')) == 'y'
+
+
+def test_expired_entries_are_not_served():
+    cache = FragmentCache(ttl=-1)
+    cache.set(('a',), 1)
+    assert cache.get(('a',)) is None
+
+
+def test_cache_tag_renders_once_per_key():
+    env = Environment(loader=DictLoader({'t.html': "{% cache 'nav', scope %}{{ calls.append(1) or name }}{% endcache %}"}),
+                      extensions=[FragmentCacheExtension], autoescape=True)
+    env.fragment_cache = FragmentCache()
+    calls = []
+    template = env.get_template('t.html')
+    assert template.render(scope=('user:a',), name='<a>', calls=calls) == '&lt;a&gt;'
+    assert template.render(scope=('user:a',), name='changed', calls=calls) == '&lt;a&gt;'
+    assert template.render(scope=('user:b',), name='b', calls=calls) == 'b'
+    assert len(calls) == 2
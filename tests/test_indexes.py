@@ -0,0 +1,64 @@
+import random
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+from app.extensions import db
+from app.models import Asset, BusinessStartupActivity, Expense, Liability, Location, Product, User
+from app.slow_queries import FULL_SCAN
+
+HOT_QUERIES = {
+    'products': sa.select(Product).where(Product.user_id == 7),
+    'stale products': sa.select(Product).where(Product.user_id == 7, ~Product.description.in_(['Product 1'])),
+    'product by description': sa.select(Product).where(Product.user_id == 7, Product.description == 'Product 3'),
+    'expense by item': sa.select(Expense).where(Expense.user_id == 7, Expense.item == 'Rent'),
+    'assets': sa.select(Asset).where(Asset.user_id == 7),
+    'liabilities': sa.select(Liability).where(Liability.user_id == 7),
+    'activities': sa.select(BusinessStartupActivity).where(BusinessStartupActivity.user_id == 7)
+                    .order_by(BusinessStartupActivity.id),
+    'locations': sa.select(Location).where(Location.tenant_id == 3),
+    'tenant users': sa.select(User.id).where(User.tenant_id == 3),
+}
+
+
+@contextmanager
+def explained(engine):
+    """Runs every statement as EXPLAIN QUERY PLAN, with the exact SQL and parameters the ORM sends."""
+    def prefix(conn, cursor, statement, parameters, context, executemany):
+        return 'EXPLAIN QUERY PLAN ' + statement, parameters
+
+    sa.event.listen(engine, 'before_cursor_execute', prefix, retval=True)
+    try:
+        yield
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', prefix)
+
+
+def _seed(conn, users=200, rows_per_user=20):
+    rng = random.Random(1)
+    conn.execute(sa.insert(User), [{'username': f'u{i}', 'password_hash': 'x', 'tenant_id': i // 5, 'role': 'member'}
+                                   for i in range(1, users + 1)])
+    for model, column in ((Product, 'description'), (Expense, 'item'), (Asset, 'description'), (Liability, 'description')):
+        extra = {'price': 1.0, 'sales_volume': 1, 'sales_volume_unit': 'monthly'} if model is Product else {'amount': 1.0}
+        if model is Expense:
+            extra['frequency'] = 'monthly'
+        conn.execute(sa.insert(model), [{'user_id': rng.randint(1, users), column: f'Row {i}', **extra}
+                                        for i in range(users * rows_per_user)])
+    conn.execute(sa.insert(BusinessStartupActivity), [
+        {'user_id': rng.randint(1, users), 'activity': f'A{i}', 'description': '', 'weight': 1, 'progress': 0}
+        for i in range(users * rows_per_user)])
+    conn.exec_driver_sql('ANALYZE')
+
+
+def test_hot_queries_use_indexes():
+    engine = sa.create_engine('sqlite://', execution_options={'schema_translate_map': {'shared': None}})
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+        _seed(conn)
+        with explained(engine):
+            plans = {name: '\n'.join(row[-1] for row in conn.execute(query)) for name, query in HOT_QUERIES.items()}
+
+    for name, plan in plans.items():
+        assert 'USING INDEX' in plan or 'USING COVERING INDEX' in plan, f'{name}: {plan}'
+        assert not FULL_SCAN.search(plan), f'{name}: {plan}'
+    assert 'TEMP B-TREE' not in plans['activities']
@@ -0,0 +1,24 @@
+import random
+
+from benchmarks.loadtest import Recorder, _load_seed, summarize, user_data
+
+
+def test_user_data_is_reproducible_and_unique():
+    seeds = {name: _load_seed(f'initial_{name}.json') for name in ('expenses', 'assets', 'liabilities')}
+    seeds['activities'] = _load_seed('startup-activities.json')
+    data = user_data(random.Random(7), seeds)
+    assert data == user_data(random.Random(7), seeds)
+    items = [e['item'] for e in data['expenses']]
+    assert len(items) == len(set(items))
+    assert all(p['price'] > 0 for p in data['products'])
+
+
+def test_summary_reports_percentiles_per_route():
+    recorder = Recorder()
+    for ms in range(1, 101):
+        recorder.record('login', ms / 1000, ok=ms != 100)
+    report = summarize(recorder, wall_seconds=10.0)
+    login = report['routes']['login']
+    assert (login['requests'], login['errors']) == (100, 1)
+    assert round(login['p50_ms']) == 51 and round(login['p99_ms']) == 99
+    assert login['throughput_rps'] == 10.0
@@ -0,0 +1,16 @@
+import pytest
+
+from logic.loan import aggregate_schedule_by_year, calculate_loan_schedule, schedule_for_year
+
+
+def test_yearly_aggregates_add_up_to_the_schedule():
+    schedule = calculate_loan_schedule(100000, 6, 30)['schedule']
+    years = aggregate_schedule_by_year(schedule)
+
+    assert [y['year'] for y in years] == list(range(1, 31))
+    assert sum(y['principal'] for y in years) == pytest.approx(100000)
+    assert sum(y['interest'] for y in years) == pytest.approx(sum(m['interest_payment'] for m in schedule))
+    assert years[0]['remaining_balance'] == schedule[11]['remaining_balance']
+
+    assert [m['month'] for m in schedule_for_year(schedule, 2)] == list(range(13, 25))
+    assert schedule_for_year(schedule, 31) == []
@@ -0,0 +1,52 @@
+import json
+import os
+
+from app.metrics import MetricsRegistry
+
+DEAD_PID = 2 ** 22 + 1  # Above the default pid_max
+
+
+def _write_worker(store_dir, pid, registry, values):
+    snapshot = dict(registry.snapshot(), pid=pid, values=values, histograms={})
+    with open(os.path.join(store_dir, f'{pid}.json'), 'w') as f:
+        json.dump(snapshot, f)
+
+
+def test_histogram_is_rendered_cumulatively():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        registry.observe('http_request_duration_seconds', {'endpoint': 'main.export_forecast'}, seconds)
+    text = registry.render()
+    assert 'bizstarter_http_request_duration_seconds_bucket{endpoint="main.export_forecast",le="0.1"} 1' in text
+    assert 'bizstarter_http_request_duration_seconds_bucket{endpoint="main.export_forecast",le="1.0"} 3' in text
+    assert 'bizstarter_http_request_duration_seconds_bucket{endpoint="main.export_forecast",le="+Inf"} 4' in text
+    assert 'bizstarter_http_request_duration_seconds_count{endpoint="main.export_forecast"} 4' in text
+
+
+def test_workers_are_added_up_and_dead_gauges_dropped(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.inc('http_requests_total', {'endpoint': 'main.index', 'status': 200}, 2)
+    registry.inc('http_requests_in_flight', {'endpoint': 'main.index'})
+    registry.flush()
+    values = {'http_requests_total': {'endpoint="main.index",status="200"': 3},
+              'http_requests_in_flight': {'endpoint="main.index"': 5}}
+    _write_worker(str(tmp_path), 1, registry, values)  # pid 1 is always running
+    _write_worker(str(tmp_path), DEAD_PID, registry, values)
+
+    text = registry.render()
+    assert 'bizstarter_http_requests_total{endpoint="main.index",status="200"} 8' in text
+    assert 'bizstarter_http_requests_in_flight{endpoint="main.index"} 6' in text
+
+
+def test_exited_workers_are_folded_into_one_file(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.flush()
+    values = {'http_requests_total': {'endpoint="main.index",status="200"': 3}}
+    for pid in (DEAD_PID, DEAD_PID + 1):
+        _write_worker(str(tmp_path), pid, registry, values)
+        text = registry.render()
+
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.json')) == [
+        f'{os.getpid()}.json', f'retired-{os.getppid()}.json']
+    assert 'bizstarter_http_requests_total{endpoint="main.index",status="200"} 6' in text
+    assert registry.render() == text
@@ -0,0 +1,50 @@
+import os
+import pstats
+
+from flask import Flask
+
+from app.profiling import StackSampler, init_profiling, issue_profile_token
+
+
+def _app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', PROFILE_DIR=str(tmp_path), PROFILE_TOKEN_MAX_AGE=60,
+                      PROFILE_SAMPLE_HZ=0, PROFILE_SAMPLE_FLUSH_SECONDS=60)
+
+    @app.route('/slow')
+    def slow():
+        return str(sum(i * i for i in range(10000)))
+
+    init_profiling(app)
+    return app
+
+
+def test_a_token_profiles_one_request(tmp_path):
+    app = _app(tmp_path)
+    with app.app_context():
+        token = issue_profile_token('slow')
+    client = app.test_client()
+
+    assert 'X-Profile-Id' not in client.get('/slow').headers
+    profile_id = client.get('/slow', headers={'X-Profile-Token': token}).headers['X-Profile-Id']
+    assert 'X-Profile-Id' not in client.get(f'/slow?_profile={token}').headers
+
+    summary = client.get(f'/profiles/{token}?format=json').get_json()
+    assert summary['id'] == profile_id and summary['endpoint'] == 'slow'
+    assert any('<genexpr>' in f['function'] for f in summary['functions'])
+    pstats.Stats(str(tmp_path / f'{profile_id}.prof'))
+
+    with app.app_context():
+        forged = issue_profile_token('slow')[:-2] + 'xx'
+    assert 'X-Profile-Id' not in client.get('/slow', headers={'X-Profile-Token': forged}).headers
+    assert client.get(f'/profiles/{forged}').status_code == 404
+
+
+def test_sampler_collapses_request_stacks(tmp_path):
+    sampler = StackSampler(hz=0.001, out_dir=str(tmp_path))  # Samples only when asked
+    sampler.request_started('main.index')
+    sampler.sample()
+    sampler.flush()
+    (line,) = (tmp_path / f"continuous-{os.getpid()}.collapsed").read_text().splitlines()
+    assert line.startswith('main.index;') and line.endswith(' 1')
+    assert 'test_sampler_collapses_request_stacks' in line
@@ -0,0 +1,145 @@
+import pytest
+import sqlalchemy as sa
+from flask import Flask, jsonify, session
+
+from app.db_routing import init_db_routing
+from app.engine_profiles import engine_options
+from app.extensions import db
+from app.models import Product, Tenant, User
+from app.sharding import (SHARD_BIND_PREFIX, _set_tenant_shard_state, find_user, init_sharding, load_session_user,
+                          move_tenant, on_shard, pick_shard_for_new_tenant, shard_engine, shard_ids)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A minimal app with the primary ('default') database and one extra shard, 'b'."""
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    shard_url = f"sqlite:///{tmp_path / 'shard_b.db'}"
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=primary_url,
+        SQLALCHEMY_ENGINE_OPTIONS=engine_options('sqlite', primary_url),
+        SQLALCHEMY_BINDS={SHARD_BIND_PREFIX + 'b': {'url': shard_url, **engine_options('sqlite', shard_url)}},
+        SHARD_MAP_TTL=0,
+        NEW_TENANT_SHARD='b',
+        READ_YOUR_WRITES_SECONDS=5,
+    )
+    db.init_app(app)
+    init_sharding(app)
+    init_db_routing(app)
+
+    with app.app_context():
+        for shard_id in shard_ids():
+            db.metadata.create_all(shard_engine(shard_id))
+
+        tenant = Tenant(tenant_key='acme', schema_name='acme', shard_id=pick_shard_for_new_tenant())
+        db.session.add(tenant)
+        db.session.commit()
+        with on_shard(tenant.shard_id):
+            user = User(username='alice', password_hash='x', tenant_id=tenant.tenant_id)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Product('Widget', 10.0, 5, 'monthly', user.id))
+            db.session.commit()
+        db.session.remove()
+
+    @app.route('/login/<username>')
+    def login(username):
+        user, shard_id = find_user(username)
+        session['tenant_key'] = db.session.get(Tenant, user.tenant_id).tenant_key
+        session['shard_id'] = shard_id
+        return jsonify(shard_id)
+
+    @app.route('/products')
+    def products():
+        return jsonify([p.description for p in Product.query.all()])
+
+    @app.route('/reprice')
+    def reprice():
+        # A GET that writes, like the forecast pages recalculating on view.
+        product = Product.query.first()
+        product.price += 1
+        db.session.commit()
+        return jsonify(product.price)
+
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        db.session.remove()
+
+    return app
+
+
+def _count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(sa.select(sa.func.count()).select_from(db.metadata.tables[table])).scalar()
+
+
+def test_tenant_data_lands_on_its_shard(app):
+    with app.app_context():
+        assert _count(shard_engine('b'), 'user') == 1
+        assert _count(shard_engine('b'), 'product') == 1
+        assert _count(shard_engine('default'), 'user') == 0
+        # The tenant directory stays on the primary.
+        with shard_engine('default').connect() as conn:
+            assert conn.execute(sa.text('SELECT shard_id FROM tenants')).scalar() == 'b'
+
+
+def test_requests_follow_the_tenant_shard(app):
+    client = app.test_client()
+    assert client.get('/login/alice').get_json() == 'b'
+    assert client.get('/products').get_json() == ['Widget']
+    # Anonymous requests only see the primary.
+    assert app.test_client().get('/products').get_json() == []
+
+
+def test_move_tenant_between_shards(app):
+    client = app.test_client()
+    client.get('/login/alice')
+
+    with app.app_context():
+        move_tenant('acme', 'default', grace_seconds=0, echo=lambda message: None)
+        assert db.session.execute(sa.select(Tenant.shard_id, Tenant.shard_locked)).one() == ('default', False)
+        assert _count(shard_engine('b'), 'user') == 0
+        assert _count(shard_engine('b'), 'product') == 0
+        assert _count(shard_engine('default'), 'product') == 1
+
+    # The logged-in session picks up the new shard without logging in again.
+    assert client.get('/products').get_json() == ['Widget']
+
+
+def test_writes_are_refused_while_the_tenant_is_locked(app):
+    client = app.test_client()
+    client.get('/login/alice')
+    with app.app_context():
+        _set_tenant_shard_state('acme', shard_locked=True)
+
+    response = client.get('/reprice')
+    assert response.status_code == 503 and response.headers['Retry-After']
+    assert client.get('/products').get_json() == ['Widget']  # Reads continue
+    with app.app_context():
+        with shard_engine('b').connect() as conn:
+            assert conn.execute(sa.text('SELECT price FROM product')).scalar() == 10.0
+
+        _set_tenant_shard_state('acme', shard_locked=False)
+    assert client.get('/reprice').get_json() == 11.0
+
+
+def test_session_ids_are_not_confused_with_numeric_usernames(tmp_path):
+    url = f"sqlite:///{tmp_path / 'single.db'}"
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_ENGINE_OPTIONS=engine_options('sqlite', url))
+    db.init_app(app)
+
+    with app.test_request_context():
+        db.metadata.create_all(db.engine)
+        alice, numeric = User(username='alice', password_hash='x'), User(username='1', password_hash='x')
+        db.session.add_all([alice, numeric])
+        db.session.commit()
+        assert alice.id == 1
+
+        # An old session of alice holds her numeric id, not the username '1'.
+        assert load_session_user('1') is alice
+        assert load_session_user(numeric.get_id()) is numeric
+        assert load_session_user(alice.get_id()) is alice
+        assert load_session_user('u:nobody') is None
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from flask import Flask
+
+from app.singleflight import SingleFlight, _pack
+
+
+def _run_concurrently(flights, fn, key=('alice', 'POST', '/save')):
+    results = []
+    threads = [threading.Thread(target=lambda f=f: results.append(f.do('alice', key, fn))) for f in flights]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)  # The first thread leads
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _slow_call(calls, result):
+    def fn():
+        calls.append(1)
+        time.sleep(0.2)
+        return result
+    return fn
+
+
+def test_identical_concurrent_calls_run_once():
+    flight, calls = SingleFlight(), []
+    assert _run_concurrently([flight] * 4, _slow_call(calls, {'ok': 1})) == [{'ok': 1}] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {'executed': 1, 'shared': 3, 'shared_across_workers': 0, 'timeouts': 0}
+
+
+def test_failed_calls_are_not_shared():
+    flight, calls = SingleFlight(), []
+    _run_concurrently([flight] * 2, _slow_call(calls, None))
+    assert len(calls) == 2
+
+
+def test_calls_are_shared_across_processes_through_the_lock_dir(tmp_path):
+    calls = []
+    # Separate instances stand in for worker processes; flock locks conflict within a process too.
+    flights = [SingleFlight(lock_dir=str(tmp_path)) for _ in range(2)]
+    assert _run_concurrently(flights, _slow_call(calls, {'ok': 1})) == [{'ok': 1}] * 2
+    assert len(calls) == 1 and flights[1].stats()['shared_across_workers'] == 1
+
+    # A call arriving after the first one finished runs again.
+    assert flights[1].do('alice', ('alice', 'POST', '/save'), _slow_call(calls, {'ok': 2})) == {'ok': 2}
+
+
+def test_a_call_is_not_shared_after_another_write_of_the_user_started():
+    flight, calls, results = SingleFlight(), [], {}
+    x, y = ('alice', 'POST', '/save', 'X'), ('alice', 'POST', '/save', 'Y')
+
+    def start(name, key, delay):
+        thread = threading.Thread(target=lambda: results.setdefault(name, flight.do('alice', key, _slow_call(calls, name))))
+        thread.start()
+        time.sleep(delay)
+        return thread
+
+    # Autosaves X, Y, X: the second X must run again to be the latest write.
+    threads = [start('x1', x, 0.05), start('y', y, 0.05), start('x2', x, 0)]
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 3 and results['x2'] == 'x2'
+    assert flight.stats()['shared'] == 0
+
+
+def test_packed_responses_leave_out_cookies_and_hop_by_hop_headers():
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = app.make_response('ok')
+        response.set_cookie('session', 'leader')
+        response.headers['Connection'] = 'keep-alive'
+        headers = dict(_pack(response)['headers'])
+    assert 'Set-Cookie' not in headers and 'Connection' not in headers
+    assert headers['Content-Type'].startswith('text/html')
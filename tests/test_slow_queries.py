@@ -0,0 +1,36 @@
+import sqlalchemy as sa
+
+from app.slow_queries import SlowQueryLog, normalize_sql, read_slow_queries, summarize_slow_queries
+
+
+def test_normalize_sql_hides_values_and_list_lengths():
+    assert normalize_sql("SELECT * FROM product WHERE user_id = 42 AND description = 'it''s'") == \
+        'SELECT * FROM product WHERE user_id = ? AND description = ?'
+    assert normalize_sql('SELECT id FROM t1 WHERE id IN (?, ?, ?)') == normalize_sql('SELECT id FROM t1 WHERE id IN (?, ?)')
+    assert normalize_sql('DELETE FROM expense\n  WHERE id = %(id_1)s') == 'DELETE FROM expense WHERE id = ?'
+
+
+def test_slow_statements_are_logged_with_their_plan_once(tmp_path):
+    engine = sa.create_engine('sqlite://')
+    log = SlowQueryLog(str(tmp_path / 'slow.jsonl'), threshold=0)
+    with engine.begin() as conn:
+        conn.execute(sa.text('CREATE TABLE product (id INTEGER PRIMARY KEY, user_id INTEGER)'))
+        log.attach(engine)
+        for user_id in (1, 2):
+            conn.execute(sa.text('SELECT * FROM product WHERE user_id = :user_id'), {'user_id': user_id})
+
+    entries = [e for e in read_slow_queries(log.path) if e['sql'].startswith('SELECT')]
+    assert len(entries) == 2 and entries[0]['params'] == '(int)'
+    assert 'SCAN product' in entries[0]['plan'] and 'plan' not in entries[1]
+
+    (summary,) = [s for s in summarize_slow_queries(entries)]
+    assert summary['count'] == 2 and summary['full_scan']
+
+
+def test_unwritable_log_does_not_fail_queries(tmp_path):
+    engine = sa.create_engine('sqlite://')
+    # A directory where the log file should be: opening it for appending fails.
+    log = SlowQueryLog(str(tmp_path), threshold=0)
+    log.attach(engine)
+    with engine.connect() as conn:
+        assert conn.execute(sa.text('SELECT 1')).scalar() == 1
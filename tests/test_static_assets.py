@@ -0,0 +1,47 @@
+import gzip
+
+from flask import Flask, url_for
+
+from app.static_assets import IMMUTABLE_MAX_AGE, init_static_assets
+
+
+def _app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'scripts').mkdir(parents=True)
+    (static / 'scripts' / 'app.js').write_text('console.log("hello");\n' * 200)
+    app = Flask(__name__, static_folder=str(static))
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+
+    @app.route('/page')
+    def page():
+        return '<p>' + 'x' * 2000 + '</p>'
+
+    init_static_assets(app)
+    return app
+
+
+def test_fingerprinted_assets_are_immutable_and_precompressed(tmp_path):
+    app = _app(tmp_path)
+    with app.test_request_context():
+        url = url_for('static', filename='scripts/app.js')
+    assert '?v=' in url
+
+    client = app.test_client()
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == (tmp_path / 'static' / 'scripts' / 'app.js').read_bytes()
+    assert response.cache_control.max_age == IMMUTABLE_MAX_AGE and response.cache_control.immutable
+    assert client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    # Without the current fingerprint, the file is revalidated as before.
+    response = client.get('/static/scripts/app.js?v=stale')
+    assert 'Content-Encoding' not in response.headers
+    assert not response.cache_control.immutable
+
+
+def test_large_html_responses_are_gzipped(tmp_path):
+    client = _app(tmp_path).test_client()
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert 'Content-Encoding' not in client.get('/page').headers
@@ -0,0 +1,30 @@
+from jinja2 import DictLoader, Environment
+
+from app.template_cache import SourceBytecodeCache
+
+
+def _env(cache_dir, source='Hello {{ name }}'):
+    return Environment(loader=DictLoader({'hello.html': source}), bytecode_cache=SourceBytecodeCache(str(cache_dir)))
+
+
+def test_bytecode_is_keyed_by_source_not_path(tmp_path):
+    env = _env(tmp_path)
+    bucket = env.bytecode_cache.get_bucket(env, 'hello.html', '/build/templates/hello.html', 'Hello {{ name }}')
+    moved = env.bytecode_cache.get_bucket(env, 'hello.html', '/srv/app/templates/hello.html', 'Hello {{ name }}')
+    changed = env.bytecode_cache.get_bucket(env, 'hello.html', '/srv/app/templates/hello.html', 'Hi {{ name }}')
+    assert bucket.key == moved.key != changed.key
+
+
+def test_precompiled_bytecode_is_used_by_a_new_environment(tmp_path):
+    assert _env(tmp_path).get_template('hello.html').render(name='a') == 'Hello a'
+    assert len(list(tmp_path.iterdir())) == 1
+
+    env = _env(tmp_path)
+    bucket = env.bytecode_cache.get_bucket(env, 'hello.html', None, 'Hello {{ name }}')
+    assert bucket.code is not None
+    assert env.get_template('hello.html').render(name='b') == 'Hello b'
+
+
+def test_unwritable_cache_still_renders(tmp_path):
+    env = _env(tmp_path / 'missing')
+    assert env.get_template('hello.html').render(name='c') == 'Hello c'
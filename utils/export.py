@@ -1,10 +1,13 @@
-from io import BytesIO
+import tempfile
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.chart import BarChart, LineChart, Reference, Series
 from openpyxl.chart.series import SeriesLabel
-from openpyxl.styles import Font, PatternFill
+from openpyxl.styles import Font, NamedStyle, PatternFill
 from openpyxl.utils import get_column_letter
 
+from utils.forecast_tables import forecast_sections
+
 # --- Styling Constants ---
 HEADER_FONT = Font(bold=True, color="FFFFFF")
 HEADER_FILL = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
@@ -12,239 +15,254 @@ TITLE_FONT = Font(size=18, bold=True, color="FFFFFF")
 TITLE_FILL = PatternFill(start_color="002060", end_color="002060", fill_type="solid")
 CURRENCY_FORMAT = '$#,##0.00'
 
-def _add_startup_activities_sheet(wb, activities):
+# Finished workbooks up to this size stay in memory; larger ones spill to disk.
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+# --- Template ---
+# The static part of every export, defined once per process. Formatting is
+# expressed as named styles: each workbook registers them up front, and a
+# cell then only carries a reference to its style instead of its own font,
+# fill and number format.
+STYLE_TITLE = 'Forecast Title'
+STYLE_HEADER = 'Forecast Header'
+STYLE_CURRENCY = 'Forecast Currency'
+STYLE_DECIMAL = 'Forecast Decimal'
+
+NAMED_STYLES = (
+    (STYLE_TITLE, {'font': TITLE_FONT, 'fill': TITLE_FILL}),
+    (STYLE_HEADER, {'font': HEADER_FONT, 'fill': HEADER_FILL}),
+    (STYLE_CURRENCY, {'number_format': CURRENCY_FORMAT}),
+    (STYLE_DECIMAL, {'number_format': '0.00'}),
+)
+
+# Column styles of the fixed-width tables, by column.
+PNL_COLUMN_STYLES = (None,) + (STYLE_CURRENCY,) * 9 + (STYLE_DECIMAL,)
+LOAN_COLUMN_STYLES = (None, STYLE_CURRENCY, STYLE_CURRENCY, STYLE_CURRENCY)
+LOAN_SUMMARY_ROWS = (
+    ('Loan Amount', 'loan_amount', STYLE_CURRENCY),
+    ('Annual Interest Rate (%)', 'interest_rate', STYLE_DECIMAL),
+    ('Loan Term (Years)', 'loan_term', STYLE_DECIMAL),
+    ('Monthly Payment', 'monthly_payment', STYLE_CURRENCY),
+)
+
+# Chart scaffolding: everything about a chart except its data ranges.
+REVENUE_CHART = {
+    'title': "Quarterly Revenue", 'x_title': "Quarter", 'y_title': "Revenue",
+    'grouping': "clustered", 'style': None, 'anchor': "A8",
+}
+PNL_CHART = {
+    'title': "5-Year Financial Projections", 'x_title': "Year", 'y_title': "Amount (USD)",
+    'grouping': "stacked", 'style': 13, 'anchor': "A10",
+}
+# 'Total Revenue', 'Gross Profit' and 'Net Income'
+PNL_CHART_COLUMNS = (2, 4, 10)
+
+
+def _revenue_column_styles(width):
+    return (None,) + (STYLE_CURRENCY,) * (width - 1)
+
+
+def _new_workbook():
+    """
+    Returns a write-only workbook with the template's named styles registered,
+    and the style array of each, ready to assign to cells.
+    """
+    wb = Workbook(write_only=True)
+    style_arrays = {}
+    for name, attributes in NAMED_STYLES:
+        # Binding a named style stores workbook-specific indexes on it, so
+        # each workbook gets its own NamedStyle objects.
+        named_style = NamedStyle(name=name, **attributes)
+        wb.add_named_style(named_style)
+        style_arrays[name] = named_style.as_tuple()
+    return wb, style_arrays
+
+
+def _bar_chart(spec):
+    chart = BarChart()
+    chart.title = spec['title']
+    chart.x_axis.title = spec['x_title']
+    chart.y_axis.title = spec['y_title']
+    chart.y_axis.number_format = CURRENCY_FORMAT
+    chart.grouping = spec['grouping']
+    if spec['style'] is not None:
+        chart.style = spec['style']
+    return chart
+
+
+class _SheetWriter:
+    """
+    Collects the rows of one write-only worksheet.
+
+    A write-only sheet streams its rows to disk as they are appended, and
+    column widths have to be set before the first row is written. Rows are
+    therefore kept as plain value tuples (not Cell objects) while the widest
+    value per column is tracked, and `close()` sets the widths and streams the
+    rows out, giving styled cells the prebuilt style array of their named
+    style.
+    """
+
+    def __init__(self, wb, style_arrays, title):
+        self.ws = wb.create_sheet(title=title)
+        self._style_arrays = style_arrays
+        self._rows = []
+        self._widths = []
+        self._title_span = 0
+
+    @property
+    def row_count(self):
+        return len(self._rows)
+
+    def title(self, text, span=None):
+        """Adds the sheet title on row 1, merged across `span` columns (default: all)."""
+        self._rows.append(((text,), None, STYLE_TITLE))
+        self._title_span = span
+
+    def header(self, values):
+        self.append(values, row_style=STYLE_HEADER)
+        return self.row_count
+
+    def append(self, values, column_styles=None, row_style=None):
+        """
+        Adds a row. `column_styles` names the style of each column (None for
+        none) and is meant to be shared by every row of a table; `row_style`
+        applies one style to the whole row.
+        """
+        values = tuple(values)
+        widths = self._widths
+        for col_idx, value in enumerate(values):
+            if value is None:
+                continue
+            width = len(str(value))
+            if col_idx >= len(widths):
+                widths.extend([0] * (col_idx + 1 - len(widths)))
+            if width > widths[col_idx]:
+                widths[col_idx] = width
+        self._rows.append((values, column_styles, row_style))
+
+    def close(self):
+        """Sets the column widths and writes every row to the sheet."""
+        ws = self.ws
+        for col_idx, width in enumerate(self._widths, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width + 2
+        span = self._title_span or max(len(self._widths), 1)
+        if span > 1:
+            ws.merged_cells.add(f"A1:{get_column_letter(span)}1")
+
+        style_arrays = self._style_arrays
+        for values, column_styles, row_style in self._rows:
+            if row_style is not None:
+                style = style_arrays[row_style]
+                ws.append([self._cell(value, style) for value in values])
+            elif column_styles is not None:
+                ws.append([self._cell(value, style_arrays[name] if name else None)
+                           for value, name in zip(values, column_styles)] + list(values[len(column_styles):]))
+            else:
+                ws.append(values)
+        self._rows = []
+
+    def _cell(self, value, style):
+        if value is None or style is None:
+            return value
+        cell = WriteOnlyCell(self.ws, value=value)
+        # Cells only read their style array when written, so one array can be
+        # shared by every cell of a style.
+        cell._style = style
+        return cell
+
+
+def _add_startup_activities_sheet(wb, style_arrays, section):
     """Adds the Startup Activities sheet to the workbook."""
-    ws = wb.create_sheet(title="Startup Activities")
-    ws['A1'] = 'Startup Activities'
-    ws['A1'].font = TITLE_FONT
-    ws['A1'].fill = TITLE_FILL
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=4)
-
-    headers = ['Activity', 'Description', 'Weight (%)', 'Progress (%)']
-    ws.append(headers)
-    for cell in ws[2]:
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-
-    for activity in activities:
-        ws.append([
-            activity.get('activity'),
-            activity.get('description'),
-            activity.get('weight'),
-            activity.get('progress')
-        ])
-
-def _add_revenue_sheet(wb, products, seasonality_factors, company_name):
+    sheet = _SheetWriter(wb, style_arrays, section.title)
+    sheet.title(section.title)
+    sheet.header(section.headers)
+    for row in section.rows:
+        sheet.append(row)
+    sheet.close()
+
+def _add_revenue_sheet(wb, style_arrays, section, company_name):
     """Adds the Quarterly Revenue sheet and chart to the workbook."""
-    ws = wb.create_sheet(title="Quarterly Revenue", index=0)
-    
+    sheet = _SheetWriter(wb, style_arrays, section.title)
+
     # Title
     display_company_name = company_name if company_name else 'My Awesome Startup'
-    ws['A1'] = f'Financial Forecast for {display_company_name}'
-    ws['A1'].font = TITLE_FONT
-    ws['A1'].fill = TITLE_FILL
+    sheet.title(f'Financial Forecast for {display_company_name}')
 
     # Headers
-    product_names = [p.get('description', 'N/A') for p in products]
-    headers = ['Quarter'] + product_names + ['Total Revenue']
-    ws.append(headers)
-    for cell in ws[2]:
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-
-    # --- Data Calculation ---
-    total_factor = sum(seasonality_factors)
-    normalized_factors = [(f / total_factor) * 12 for f in seasonality_factors] if total_factor > 0 else [1.0] * 12
-
-    product_monthly_revenues = []
-    for p in products:
-        price = float(p.get('price', 0) or 0)
-        volume = int(p.get('sales_volume', 0) or 0)
-        unit = p.get('sales_volume_unit', 'monthly')
-        annual_volume = volume * 12 if unit == 'monthly' else volume * 4
-        product_monthly_revenues.append((price * annual_volume) / 12)
-
-    # Populate quarterly data
-    for q in range(4):
-        row_data = [f'Q{q+1}']
-        quarterly_total = 0
-        for monthly_rev in product_monthly_revenues:
-            quarterly_prod_rev = sum(monthly_rev * normalized_factors[q * 3 + i] for i in range(3))
-            row_data.append(quarterly_prod_rev)
-            quarterly_total += quarterly_prod_rev
-        row_data.append(quarterly_total)
-        ws.append(row_data)
-
-    # Formatting
-    for row in ws.iter_rows(min_row=3, min_col=2, max_col=ws.max_column):
-        for cell in row:
-            cell.number_format = CURRENCY_FORMAT
+    sheet.header(section.headers)
+    column_styles = _revenue_column_styles(len(section.headers))
+    for row in section.rows:
+        sheet.append(row, column_styles)
 
     # --- Chart ---
-    chart = BarChart()
-    chart.title = "Quarterly Revenue"
-    chart.y_axis.title = "Revenue"
-    chart.x_axis.title = "Quarter"
-    chart.y_axis.number_format = CURRENCY_FORMAT
-    chart.grouping = "clustered" # Changed from "stacked"
-
     # Include all revenue columns, including the total
-    data = Reference(ws, min_col=2, min_row=2, max_col=ws.max_column, max_row=ws.max_row)
-    cats = Reference(ws, min_col=1, min_row=3, max_row=ws.max_row)
+    chart = _bar_chart(REVENUE_CHART)
+    ws, last_row = sheet.ws, sheet.row_count
+    data = Reference(ws, min_col=2, min_row=2, max_col=len(section.headers), max_row=last_row)
+    cats = Reference(ws, min_col=1, min_row=3, max_row=last_row)
     chart.add_data(data, titles_from_data=True)
     chart.set_categories(cats)
-    ws.add_chart(chart, "A8")
-    return product_monthly_revenues
+    ws.add_chart(chart, REVENUE_CHART['anchor'])
+    sheet.close()
 
-def _add_pnl_sheet(wb, product_monthly_revenues, operating_expenses, cogs_percentage, loan_details, depreciation, interest_expense):
+def _add_pnl_sheet(wb, style_arrays, section):
     """Adds the 5-Year P&L Summary sheet and chart."""
-    ws = wb.create_sheet(title="Annual P&L Summary")
-    ws['A1'] = 'Profit & Loss Summary (USD)'
-    ws['A1'].font = TITLE_FONT
-    ws['A1'].fill = TITLE_FILL
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=11)
-
-    headers = ['Year', 'Total Revenue', 'COGS', 'Gross Profit', 'Operating Expenses', 'Net Operating Income', 'Depreciation', 'Earnings Before Tax', 'Taxes', 'Net Income', 'DSCR']
-    ws.append(headers)
-    for cell in ws[2]:
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-
-    # --- P&L Calculation ---
-    y1_revenue = sum(product_monthly_revenues) * 12
-    y1_opex = sum((float(e.get('amount', 0)) * 12 if e.get('frequency') == 'monthly' else float(e.get('amount', 0)) * 4) for e in operating_expenses)
-
-    current_revenue, current_opex = y1_revenue, y1_opex
-    for year in range(1, 6):
-        if year > 1:
-            current_revenue *= 1.10  # 10% revenue growth
-            current_opex *= 1.05     # 5% opex growth
-
-        cogs = current_revenue * (cogs_percentage / 100)
-        gross_profit = current_revenue - cogs
-        noi = gross_profit - current_opex
-        ebt = noi - depreciation - interest_expense
-        taxes = max(0, ebt * 0.25) # 25% standard tax assumption
-        net_income = ebt - taxes
-        
-        total_debt_service = (loan_details.get('monthly_payment', 0) or 0) * 12
-        dscr = (noi / total_debt_service) if total_debt_service > 0 else 0
-
-        ws.append([year, current_revenue, cogs, gross_profit, current_opex, noi, depreciation, ebt, taxes, net_income, dscr if dscr > 0 else 'N/A'])
-
-    # Formatting
-    for row in ws.iter_rows(min_row=3, max_row=ws.max_row, min_col=2, max_col=10):
-        for cell in row:
-            cell.number_format = CURRENCY_FORMAT
-    for cell in ws['K']:
-        if cell.row > 2: cell.number_format = '0.00'
+    sheet = _SheetWriter(wb, style_arrays, section.title)
+    sheet.title('Profit & Loss Summary (USD)')
+    sheet.header(section.headers)
+    for row in section.rows:
+        sheet.append(row, PNL_COLUMN_STYLES)
 
     # --- Chart ---
-    chart = BarChart()
-    chart.style = 13
-    chart.grouping = "stacked"
-    chart.title = "5-Year Financial Projections"
-    chart.y_axis.title = "Amount (USD)"
-    chart.x_axis.title = "Year"
-    chart.y_axis.number_format = CURRENCY_FORMAT
-
-    cats = Reference(ws, min_col=1, min_row=3, max_row=ws.max_row)
+    chart = _bar_chart(PNL_CHART)
+    ws, last_row = sheet.ws, sheet.row_count
+    cats = Reference(ws, min_col=1, min_row=3, max_row=last_row)
     chart.set_categories(cats)
-
-    # Add data series for 'Total Revenue', 'Gross Profit', and 'Net Income'
-    data_cols = [2, 4, 10] 
-    for col in data_cols:
-        data = Reference(ws, min_col=col, min_row=2, max_row=ws.max_row)
+    for col in PNL_CHART_COLUMNS:
+        data = Reference(ws, min_col=col, min_row=2, max_row=last_row)
         chart.add_data(data, titles_from_data=True)
+    ws.add_chart(chart, PNL_CHART['anchor'])
+    sheet.close()
 
-    ws.add_chart(chart, "A10")
-
-def _add_loan_sheet(wb, loan_details):
-    """Adds the Loan Payment Schedule sheet and chart if data is available."""
-    if not loan_details or not loan_details.get('schedule'):
-        return
-
-    ws = wb.create_sheet(title="Loan Payment Schedule")
-    ws['A1'] = 'Loan Payment Schedule'
-    ws['A1'].font = TITLE_FONT
-    ws['A1'].fill = TITLE_FILL
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=2)
+def _add_loan_sheet(wb, style_arrays, section, loan_details):
+    """Adds the Loan Payment Schedule sheet."""
+    sheet = _SheetWriter(wb, style_arrays, section.title)
+    sheet.title(section.title, span=2)
 
     # Summary
-    ws.append(['Loan Amount', loan_details.get('loan_amount')])
-    ws.append(['Annual Interest Rate (%)', loan_details.get('interest_rate')])
-    ws.append(['Loan Term (Years)', loan_details.get('loan_term')])
-    ws.append(['Monthly Payment', loan_details.get('monthly_payment')])
-    for row_num in range(3, 7):
-        ws[f'B{row_num}'].number_format = CURRENCY_FORMAT if row_num in [3, 6] else '0.00'
+    for label, key, style in LOAN_SUMMARY_ROWS:
+        sheet.append([label, loan_details.get(key)], (None, style))
 
     # Schedule Table
-    ws.append([]) # Spacer
-    headers = ['Month', 'Principal', 'Interest', 'Remaining Balance']
-    ws.append(headers)
-    header_row = ws.max_row
-    for cell in ws[header_row]:
-        cell.font = HEADER_FONT
-        cell.fill = HEADER_FILL
-
-    for item in loan_details['schedule']:
-        ws.append([item['month'], item['principal_payment'], item['interest_payment'], item['remaining_balance']])
-    
-    for row in ws.iter_rows(min_row=header_row + 1, min_col=2, max_col=4):
-        for cell in row:
-            cell.number_format = CURRENCY_FORMAT
-
-    # --- Chart ---
-    #chart = BarChart()
-    #chart.title = "Loan Payments (Principal vs. Interest)"
-    #chart.y_axis.title = "Payment Amount"
-    #chart.y_axis.number_format = CURRENCY_FORMAT
-    #chart.grouping = "stacked"
-
-    #data = Reference(ws, min_col=2, min_row=header_row, max_col=3, max_row=ws.max_row)
-    #cats = Reference(ws, min_col=1, min_row=header_row + 1, max_row=ws.max_row)
-    #chart.add_data(data, titles_from_data=True)
-    #chart.set_categories(cats)
-    #ws.add_chart(chart, "F2")
-
-def _finalize_workbook(wb):
-    """Applies final formatting to all sheets in the workbook."""
-    for sheet in wb.worksheets:
-        # Adjust column widths
-        for col_idx in range(1, sheet.max_column + 1):
-            col_letter = get_column_letter(col_idx)
-            max_len = 0
-            for cell in sheet[col_letter]:
-                try:
-                    val_len = len(str(cell.value))
-                    if val_len > max_len:
-                        max_len = val_len
-                except: pass
-            sheet.column_dimensions[col_letter].width = max_len + 2
-        
-        # Special case for merged title cells
-        if sheet.title in ["Quarterly Revenue", "Annual P&L Summary", "Startup Activities"]:
-            sheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=sheet.max_column)
+    sheet.append([]) # Spacer
+    sheet.header(section.headers)
+    for row in section.rows:
+        sheet.append(row, LOAN_COLUMN_STYLES)
+    sheet.close()
 
 def create_forecast_spreadsheet(products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities):
-    """Creates an Excel spreadsheet with financial forecast and loan amortization data."""
-    if seasonality_factors is None:
-        seasonality_factors = [1.0] * 12
+    """
+    Creates an Excel spreadsheet with financial forecast and loan amortization data.
+
+    The workbook is built in write-only mode, so rows are streamed to disk
+    instead of being held as cells. Returns a file object positioned at the
+    start, ready to hand to `send_file`.
+    """
+    sections = {section.name: section for section in forecast_sections(
+        products, operating_expenses, cogs_percentage, loan_details, seasonality_factors,
+        company_name, depreciation, interest_expense, startup_activities
+    )}
 
-    wb = Workbook()
-    wb.remove(wb.active) # Remove default sheet
+    wb, style_arrays = _new_workbook()
 
     # Add sheets
-    product_monthly_revenues = _add_revenue_sheet(wb, products, seasonality_factors, company_name)
-    _add_pnl_sheet(wb, product_monthly_revenues, operating_expenses, cogs_percentage, loan_details, depreciation, interest_expense)
-    _add_loan_sheet(wb, loan_details)
-    _add_startup_activities_sheet(wb, startup_activities)
-
-    # Final formatting
-    _finalize_workbook(wb)
-
-    # Save to an in-memory file
-    in_memory_file = BytesIO()
-    wb.save(in_memory_file)
-    in_memory_file.seek(0)
-    return in_memory_file
\ No newline at end of file
+    _add_revenue_sheet(wb, style_arrays, sections['revenue'], company_name)
+    _add_pnl_sheet(wb, style_arrays, sections['pnl'])
+    if 'loan_schedule' in sections:
+        _add_loan_sheet(wb, style_arrays, sections['loan_schedule'], loan_details)
+    _add_startup_activities_sheet(wb, style_arrays, sections['startup_activities'])
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    wb.save(output)
+    output.seek(0)
+    return output
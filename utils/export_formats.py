@@ -0,0 +1,100 @@
+"""
+Light export formats for integrators: zipped CSV and columnar JSON.
+
+Both are rendered straight from `utils.forecast_tables` sections by
+generators, so a response can start streaming before the last table has
+been computed and openpyxl is never imported.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from utils.forecast_tables import forecast_sections, forecast_summary
+
+COLUMNAR_FORMAT_VERSION = 1
+
+
+class _ChunkSink:
+    """A write-only file object that hands out whatever was written since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_line(writer, buffer, row):
+    writer.writerow(row)
+    line = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return line.encode('utf-8')
+
+
+def iter_csv_zip(products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities, rows_per_chunk=256):
+    """
+    Yields a zip archive, in chunks, holding summary.csv and one CSV file per
+    section. Takes the arguments of `create_forecast_spreadsheet`.
+
+    The zip is written to a non-seekable sink, so every entry is streamed
+    with a data descriptor and nothing is buffered beyond `rows_per_chunk`
+    rows.
+    """
+    sink = _ChunkSink()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('summary.csv', 'w') as entry:
+            entry.write(_csv_line(writer, buffer, ('field', 'value')))
+            for row in forecast_summary(loan_details, company_name):
+                entry.write(_csv_line(writer, buffer, row))
+        yield sink.take()
+
+        sections = forecast_sections(
+            products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities
+        )
+        for section in sections:
+            with archive.open(f'{section.name}.csv', 'w') as entry:
+                entry.write(_csv_line(writer, buffer, section.headers))
+                for i, row in enumerate(section.rows, 1):
+                    entry.write(_csv_line(writer, buffer, row))
+                    if i % rows_per_chunk == 0:
+                        yield sink.take()
+            yield sink.take()
+    yield sink.take()
+
+
+def iter_columnar_json(products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities):
+    """
+    Yields a compact JSON document, one section at a time. Takes the
+    arguments of `create_forecast_spreadsheet`.
+
+    Each section is stored by column rather than by row, so a section with
+    360 rows costs its column names once instead of 360 times, and clients can
+    load a column straight into an array:
+
+        {"version": 1, "summary": {...},
+         "sections": {"pnl": {"columns": ["Year", ...], "data": [[1, 2, ...], ...]}, ...}}
+    """
+    dumps = json.JSONEncoder(separators=(',', ':'), allow_nan=False).encode
+
+    yield f'{{"version":{COLUMNAR_FORMAT_VERSION},"summary":{dumps(dict(forecast_summary(loan_details, company_name)))},"sections":{{'
+    sections = forecast_sections(
+        products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities
+    )
+    for i, section in enumerate(sections):
+        columns = [list(column) for column in zip(*section.rows)] or [[] for _ in section.headers]
+        yield f'{"," if i else ""}{dumps(section.name)}:{{"columns":{dumps(list(section.headers))},"data":{dumps(columns)}}}'
+    yield '}}'
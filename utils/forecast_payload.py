@@ -0,0 +1,72 @@
+"""
+Compact encoding of forecast responses.
+
+`calculate_profitability` returns twelve monthly dicts repeating their key
+names, and the key ratios are copied into both the annual and the
+quarterly summary. The columnar encoding stores the months by column,
+keeps the ratios once and rounds every number to a fixed precision:
+
+    {"v": 1,
+     "monthly": {"revenue": [...12 values], "cogs": [...], ...},
+     "annual": {"revenue": ..., "net_profit": ..., "tax": ..., "gross_profit": ...},
+     "quarterly": {...same keys...},
+     "ratios": {"profit_margin": ..., ...},
+     ...any other keys of the response, unchanged}
+
+Months are implicit (index + 1).
+"""
+import gzip
+import json
+
+COLUMNAR_MIMETYPE = 'application/vnd.bizstarter.forecast+json'
+COLUMNAR_VERSION = 1
+PRECISION = 2
+
+MONTHLY_COLUMNS = ('revenue', 'cogs', 'gross_profit', 'operating_expenses', 'net_profit', 'tax')
+SUMMARY_FIELDS = ('revenue', 'net_profit', 'tax', 'gross_profit')
+RATIO_FIELDS = ('profit_margin', 'roa', 'current_ratio', 'debt_to_equity_ratio',
+                'interest_coverage_ratio', 'operating_cash_flow_ratio')
+
+# Responses smaller than this are sent uncompressed; gzip's header and
+# checksum would outweigh the savings.
+GZIP_MIN_SIZE = 256
+
+_dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _round(value):
+    return round(value, PRECISION) if isinstance(value, float) else value
+
+
+def encode_columnar(body):
+    """Returns the columnar form of a forecast response body (see module docstring)."""
+    encoded = {'v': COLUMNAR_VERSION}
+    for key, value in body.items():
+        if key == 'monthly':
+            encoded['monthly'] = {column: [_round(month[column]) for month in value] for column in MONTHLY_COLUMNS}
+        elif key in ('annual', 'quarterly'):
+            encoded[key] = {field: _round(value[field]) for field in SUMMARY_FIELDS}
+            if key == 'annual':
+                ratios = {field: _round(value[field]) for field in RATIO_FIELDS if field in value}
+                if ratios:
+                    encoded['ratios'] = ratios
+        elif key == 'ratios':
+            encoded['ratios'] = {field: _round(v) for field, v in value.items()}
+        else:
+            encoded[key] = value
+    return encoded
+
+
+def dumps_columnar(body):
+    """Serializes `body` in the columnar encoding, as compact UTF-8 JSON."""
+    return _dumps(encode_columnar(body)).encode('utf-8')
+
+
+def gzip_if_worthwhile(data, accepts_gzip):
+    """
+    Returns (data, content_encoding): `data` gzipped when the client accepts
+    gzip and it is large enough to benefit, else unchanged with None.
+    """
+    if not accepts_gzip or len(data) < GZIP_MIN_SIZE:
+        return data, None
+    return gzip.compress(data, compresslevel=6, mtime=0), 'gzip'
@@ -0,0 +1,121 @@
+"""
+The tables of the forecast export, as plain rows.
+
+Every export format (the XLSX workbook, CSV and columnar JSON) is rendered
+from these sections, so the numbers are computed in one place and the light
+formats never import openpyxl.
+"""
+from collections import namedtuple
+
+# name: machine-readable id (CSV file name, JSON key); title: sheet title.
+# `rows` is an iterable of tuples matching `headers`.
+Section = namedtuple('Section', 'name title headers rows')
+
+REVENUE_GROWTH = 1.10  # 10% revenue growth per year
+OPEX_GROWTH = 1.05     # 5% opex growth per year
+TAX_RATE = 0.25        # 25% standard tax assumption
+PROJECTION_YEARS = 5
+
+PNL_HEADERS = ('Year', 'Total Revenue', 'COGS', 'Gross Profit', 'Operating Expenses', 'Net Operating Income',
+               'Depreciation', 'Earnings Before Tax', 'Taxes', 'Net Income', 'DSCR')
+LOAN_HEADERS = ('Month', 'Principal', 'Interest', 'Remaining Balance')
+ACTIVITY_HEADERS = ('Activity', 'Description', 'Weight (%)', 'Progress (%)')
+
+
+def product_monthly_revenues(products):
+    """Returns the average monthly revenue of each product."""
+    revenues = []
+    for p in products:
+        price = float(p.get('price', 0) or 0)
+        volume = int(p.get('sales_volume', 0) or 0)
+        unit = p.get('sales_volume_unit', 'monthly')
+        annual_volume = volume * 12 if unit == 'monthly' else volume * 4
+        revenues.append((price * annual_volume) / 12)
+    return revenues
+
+
+def revenue_rows(monthly_revenues, seasonality_factors):
+    """Yields ('Q1', revenue per product..., total) for each quarter."""
+    total_factor = sum(seasonality_factors)
+    normalized_factors = [(f / total_factor) * 12 for f in seasonality_factors] if total_factor > 0 else [1.0] * 12
+
+    for q in range(4):
+        row_data = [f'Q{q+1}']
+        quarterly_total = 0
+        for monthly_rev in monthly_revenues:
+            quarterly_prod_rev = sum(monthly_rev * normalized_factors[q * 3 + i] for i in range(3))
+            row_data.append(quarterly_prod_rev)
+            quarterly_total += quarterly_prod_rev
+        row_data.append(quarterly_total)
+        yield tuple(row_data)
+
+
+def pnl_rows(monthly_revenues, operating_expenses, cogs_percentage, monthly_payment, depreciation, interest_expense):
+    """Yields one P&L projection row per year, matching PNL_HEADERS."""
+    y1_revenue = sum(monthly_revenues) * 12
+    y1_opex = sum((float(e.get('amount', 0)) * 12 if e.get('frequency') == 'monthly' else float(e.get('amount', 0)) * 4) for e in operating_expenses)
+    total_debt_service = (monthly_payment or 0) * 12
+
+    current_revenue, current_opex = y1_revenue, y1_opex
+    for year in range(1, PROJECTION_YEARS + 1):
+        if year > 1:
+            current_revenue *= REVENUE_GROWTH
+            current_opex *= OPEX_GROWTH
+
+        cogs = current_revenue * (cogs_percentage / 100)
+        gross_profit = current_revenue - cogs
+        noi = gross_profit - current_opex
+        ebt = noi - depreciation - interest_expense
+        taxes = max(0, ebt * TAX_RATE)
+        net_income = ebt - taxes
+        dscr = (noi / total_debt_service) if total_debt_service > 0 else 0
+
+        yield (year, current_revenue, cogs, gross_profit, current_opex, noi, depreciation, ebt, taxes, net_income,
+               dscr if dscr > 0 else 'N/A')
+
+
+def loan_rows(schedule):
+    """Yields (month, principal, interest, remaining balance) for each payment."""
+    for item in schedule:
+        yield (item['month'], item['principal_payment'], item['interest_payment'], item['remaining_balance'])
+
+
+def activity_rows(activities):
+    for activity in activities:
+        yield (activity.get('activity'), activity.get('description'), activity.get('weight'), activity.get('progress'))
+
+
+def forecast_summary(loan_details, company_name):
+    """Returns the single-value fields of the export as (name, value) pairs."""
+    loan_details = loan_details or {}
+    return [
+        ('company_name', company_name or ''),
+        ('loan_amount', loan_details.get('loan_amount')),
+        ('loan_interest_rate', loan_details.get('interest_rate')),
+        ('loan_term_years', loan_details.get('loan_term')),
+        ('loan_monthly_payment', loan_details.get('monthly_payment')),
+    ]
+
+
+def forecast_sections(products, operating_expenses, cogs_percentage, loan_details, seasonality_factors, company_name, depreciation, interest_expense, startup_activities):
+    """
+    Returns the export sections in workbook order. Takes the same arguments as
+    `utils.export.create_forecast_spreadsheet`. Rows are generated lazily;
+    the loan section is left out when there is no schedule.
+    """
+    if seasonality_factors is None:
+        seasonality_factors = [1.0] * 12
+    monthly_revenues = product_monthly_revenues(products)
+
+    sections = [
+        Section('revenue', 'Quarterly Revenue',
+                ('Quarter',) + tuple(p.get('description', 'N/A') for p in products) + ('Total Revenue',),
+                revenue_rows(monthly_revenues, seasonality_factors)),
+        Section('pnl', 'Annual P&L Summary', PNL_HEADERS,
+                pnl_rows(monthly_revenues, operating_expenses, cogs_percentage,
+                         (loan_details or {}).get('monthly_payment', 0), depreciation, interest_expense)),
+    ]
+    if loan_details and loan_details.get('schedule'):
+        sections.append(Section('loan_schedule', 'Loan Payment Schedule', LOAN_HEADERS, loan_rows(loan_details['schedule'])))
+    sections.append(Section('startup_activities', 'Startup Activities', ACTIVITY_HEADERS, activity_rows(startup_activities)))
+    return sections